@@ -1,6 +1,90 @@
+from importlib import import_module
+from typing import TYPE_CHECKING
 from .__version__ import VERSION
-from .options import Options
-from .clients import Client, AsyncClient, ApiCommon
-from .models import ApiResult, RestResult, Session
-from .store import CostMemoryStore, TimeMemoryStore, StateStore
-from .deferrer import Deferrer, SleepDeferrer
+
+# Public names and the modules they live in. They are imported on first use,
+# so importing the package (or a light module like utils) does not import HTTPX.
+_LAZY = {
+    "Options": ".options",
+    "Client": ".clients",
+    "AsyncClient": ".clients",
+    "ApiCommon": ".clients",
+    "ApiResult": ".models",
+    "RestResult": ".models",
+    "Session": ".models",
+    "CostMemoryStore": ".store",
+    "TimeMemoryStore": ".store",
+    "StateStore": ".store",
+    "Deferrer": ".deferrer",
+    "SleepDeferrer": ".deferrer",
+    "VirtualDeferrer": ".deferrer",
+    "ResponseCache": ".cache",
+    "GraphQLCache": ".cache",
+    "CacheBackend": ".cache",
+    "MemoryCacheBackend": ".cache",
+    "DiskCacheBackend": ".cache",
+    "Coalescer": ".coalesce",
+    "CostEstimator": ".estimator",
+    "GraphQLBatcher": ".batch",
+    "QuerySplitter": ".splitter",
+    "WebhookReceiver": ".webhooks",
+    "MemoryIdempotencyIndex": ".webhooks",
+    "DiskIdempotencyIndex": ".webhooks",
+    "Metrics": ".metrics",
+    "RecordingTransport": ".cassette",
+    "ReplayTransport": ".cassette",
+    "PriorityScheduler": ".scheduler",
+    "FairScheduler": ".scheduler",
+    "AdaptiveConcurrency": ".concurrency",
+    "Hedger": ".hedge",
+    "LimiterSnapshot": ".persistence",
+    "Deadline": ".deadline",
+    "DeadlineExceeded": ".deadline",
+    "ColumnarResult": ".columnar",
+    "RestSync": ".sync",
+    "GraphQLSync": ".sync",
+    "MemoryCheckpointStore": ".sync",
+    "SqliteCheckpointStore": ".sync",
+}
+
+__all__ = ["VERSION", *_LAZY]
+
+
+def __getattr__(name: str):
+    """
+    Import a public name's module on first use (PEP 562).
+    """
+
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_LAZY[name], __name__), name)
+    # Cache it, so later lookups skip this function
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .options import Options
+    from .clients import Client, AsyncClient, ApiCommon
+    from .models import ApiResult, RestResult, Session
+    from .store import CostMemoryStore, TimeMemoryStore, StateStore
+    from .deferrer import Deferrer, SleepDeferrer, VirtualDeferrer
+    from .cache import ResponseCache, GraphQLCache, CacheBackend, MemoryCacheBackend, DiskCacheBackend
+    from .coalesce import Coalescer
+    from .estimator import CostEstimator
+    from .batch import GraphQLBatcher
+    from .splitter import QuerySplitter
+    from .webhooks import WebhookReceiver, MemoryIdempotencyIndex, DiskIdempotencyIndex
+    from .metrics import Metrics
+    from .cassette import RecordingTransport, ReplayTransport
+    from .scheduler import PriorityScheduler, FairScheduler
+    from .concurrency import AdaptiveConcurrency
+    from .hedge import Hedger
+    from .persistence import LimiterSnapshot
+    from .deadline import Deadline, DeadlineExceeded
+    from .columnar import ColumnarResult
+    from .sync import RestSync, GraphQLSync, MemoryCheckpointStore, SqliteCheckpointStore
@@ -0,0 +1,26 @@
+"""
+Command line entry point: python -m basic_shopify_api <command>
+"""
+
+from typing import List, Optional
+from . import export
+import argparse
+import sys
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m basic_shopify_api")
+    commands = parser.add_subparsers(title="commands", dest="name")
+    commands.required = True
+    export.configure(commands.add_parser(
+        "export",
+        help="Export a REST resource for many shops to NDJSON",
+        description=export.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    ))
+    args = parser.parse_args(argv)
+    return args.command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
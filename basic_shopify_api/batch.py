@@ -0,0 +1,295 @@
+from typing import List, Optional, Set, Tuple
+from .models import ApiResult
+from .estimator import static_cost
+from .utils import query_tokens, closing_index
+import asyncio
+
+# Operation name of merged documents
+BATCH_OPERATION = "Batch"
+
+
+class BatchOperation:
+    """
+    A query broken into its variable definitions and top-level fields, so it can be merged.
+    """
+
+    def __init__(self, variables: List[List[str]], fields: List[Tuple[str, List[str]]]):
+        # Each definition as tokens, example: ["$id", ":", "ID", "!"]
+        self.variables = variables
+        # Each field as its response key and tokens without the alias
+        self.fields = fields
+
+    @classmethod
+    def parse(cls, query: str) -> Optional["BatchOperation"]:
+        """
+        Parse a query, returns None if it can not be merged
+        (mutations, subscriptions, fragments, or multiple operations).
+        """
+
+        tokens = query_tokens(query)
+        i = 0
+        if tokens and tokens[0] == "query":
+            i = 1
+            if i < len(tokens) and tokens[i] not in ("(", "{"):
+                # Operation name
+                i += 1
+        elif not tokens or tokens[0] != "{":
+            return None
+
+        variables = []
+        if i < len(tokens) and tokens[i] == "(":
+            end = closing_index(tokens, i)
+            for token in tokens[i + 1:end]:
+                if token.startswith("$") and (not variables or _balanced(variables[-1])):
+                    variables.append([])
+                if variables:
+                    variables[-1].append(token)
+            i = end + 1
+
+        if i >= len(tokens) or tokens[i] != "{" or closing_index(tokens, i) != len(tokens) - 1:
+            return None
+        return cls(variables, _fields(tokens[i + 1:-1]))
+
+
+def _balanced(tokens: List[str]) -> bool:
+    """
+    Determine if a variable definition has no open brackets (default values can be objects).
+    """
+
+    opened = sum(token in ("(", "[", "{") for token in tokens)
+    return opened == sum(token in (")", "]", "}") for token in tokens)
+
+
+def _fields(tokens: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Split a selection set's tokens into top-level fields.
+    """
+
+    fields = []
+    i = 0
+    while i < len(tokens):
+        start = i
+        key = tokens[i]
+        i += 1
+        if i < len(tokens) and tokens[i] == ":":
+            # Aliased, drop the alias but keep it as the response key
+            start = i + 1
+            i += 2
+        while i < len(tokens) and (tokens[i] in ("(", "{") or tokens[i].startswith("@")):
+            if tokens[i].startswith("@"):
+                i += 1
+                continue
+            i = closing_index(tokens, i) + 1
+        fields.append((key, tokens[start:i]))
+    return fields
+
+
+def merge(operations: List[BatchOperation], variables: List[Optional[dict]]) -> Tuple[str, dict]:
+    """
+    Merge operations into one document.
+
+    Fields are aliased as "b{index}_{key}" and variables renamed as "$b{index}_{name}",
+    so operations can not clash with each other.
+    """
+
+    definitions = []
+    selections = []
+    merged_variables = {}
+    for index, operation in enumerate(operations):
+        prefix = f"b{index}_"
+
+        def rename(tokens: List[str]) -> str:
+            return " ".join(f"${prefix}{token[1:]}" if token.startswith("$") else token for token in tokens)
+
+        definitions.extend(rename(definition) for definition in operation.variables)
+        selections.extend(f"{prefix}{key} : {rename(tokens)}" for key, tokens in operation.fields)
+        for name, value in (variables[index] or {}).items():
+            merged_variables[f"{prefix}{name}"] = value
+
+    header = f"query {BATCH_OPERATION}"
+    if definitions:
+        header = f"{header} ( {' '.join(definitions)} )"
+    return f"{header} {{ {' '.join(selections)} }}", merged_variables
+
+
+def split(result: ApiResult, operations: List[BatchOperation]) -> List[ApiResult]:
+    """
+    Split the result of a merged document back into a result per operation.
+    """
+
+    body = result.body
+    if body is None and isinstance(result.errors, list):
+        # Errors are not attached to the body, read the raw response for partial data
+        try:
+            body = result.response.json()
+        except Exception:
+            body = None
+    data = (body or {}).get("data") or {}
+    extensions = (body or {}).get("extensions")
+
+    if result.errors is not None and not isinstance(result.errors, list):
+        # Decoding error (exception) or single error, applies to all
+        return [_result(result, None, result.errors) for _ in operations]
+    errors, shared_errors = _distribute_errors(result.errors or [], len(operations))
+
+    results = []
+    for index, operation in enumerate(operations):
+        prefix = f"b{index}_"
+        operation_errors = errors[index] + shared_errors
+        operation_body = {"data": {key: data.get(f"{prefix}{key}") for key, _ in operation.fields}}
+        if extensions is not None:
+            operation_body["extensions"] = extensions
+        if operation_errors:
+            results.append(_result(result, None, operation_errors))
+        else:
+            results.append(_result(result, operation_body, None))
+    return results
+
+
+def _distribute_errors(errors: list, count: int) -> Tuple[List[list], list]:
+    """
+    Assign errors to operations by the alias in their path, with the path restored.
+    Errors without an aliased path are shared by all operations.
+    """
+
+    assigned = [[] for _ in range(count)]
+    shared = []
+    for error in errors:
+        path = error.get("path") if isinstance(error, dict) else None
+        index = _error_index(path, count)
+        if index is None:
+            shared.append(error)
+        else:
+            assigned[index].append({**error, "path": [path[0].split("_", 1)[1], *path[1:]]})
+    return assigned, shared
+
+
+def _error_index(path: Optional[list], count: int) -> Optional[int]:
+    """
+    Find which operation an error belongs to from the alias in its path.
+    """
+
+    if not path or not isinstance(path[0], str) or not path[0].startswith("b") or "_" not in path[0]:
+        return None
+    index = path[0][1:].split("_", 1)[0]
+    return int(index) if index.isdigit() and int(index) < count else None
+
+
+def _result(result: ApiResult, body: Optional[dict], errors) -> ApiResult:
+    return ApiResult(
+        response=result.response,
+        status=result.status[0],
+        body=body,
+        errors=errors,
+        retries=result.retries,
+        cached=result.cached,
+    )
+
+
+class GraphQLBatcher:
+    """
+    Batches GraphQL queries for a shop (AsyncClient).
+
+    Queries made within a short window are merged into one aliased document
+    and sent once, then the result is split back to each caller. A batch is sent
+    early if adding a query would take its cost over the ceiling.
+    """
+
+    def __init__(self, client, window: float = 10, max_cost: float = 1000, max_size: int = 50):
+        """
+        Args:
+            client: The AsyncClient to send batches with.
+            window: Time in ms to collect queries for, after the first query of a batch.
+            max_cost: Ceiling of the predicted cost of a batch.
+            max_size: Maximum number of queries in a batch.
+        """
+
+        self.client = client
+        self.window = window
+        self.max_cost = max_cost
+        self.max_size = max_size
+        # Queued operations: (operation, variables, query, future)
+        self.pending: list = []
+        self.pending_cost = 0.0
+        self.timer: Optional[asyncio.Future] = None
+        # Batches being sent, held until done so they are not garbage collected
+        self.sending: Set[asyncio.Future] = set()
+        # Number of queries received, and number of requests sent for them
+        self.queries = 0
+        self.requests = 0
+
+    def _cost(self, query: str, variables: Optional[dict]) -> float:
+        estimator = self.client.options.cost_estimator
+        if estimator is not None:
+            return estimator.estimate(query, variables)
+        return static_cost(query, variables)
+
+    async def graphql(self, query: str, variables: Optional[dict] = None) -> ApiResult:
+        """
+        Queue a query for the next batch and wait for its result.
+        Queries which can not be merged are sent on their own.
+        """
+
+        self.queries += 1
+        operation = BatchOperation.parse(query)
+        cost = self._cost(query, variables)
+        if operation is None or cost >= self.max_cost:
+            self.requests += 1
+            return await self.client.graphql(query, variables)
+
+        if self.pending and (self.pending_cost + cost > self.max_cost or len(self.pending) >= self.max_size):
+            # Would go over the ceiling, send what is queued now
+            self.flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((operation, variables, query, future))
+        self.pending_cost += cost
+        if self.timer is None:
+            self.timer = asyncio.ensure_future(self._flush_later())
+        return await future
+
+    async def _flush_later(self) -> None:
+        await self.client.options.deferrer.asleep(self.window)
+        self.timer = None
+        self.flush()
+
+    def flush(self) -> Optional[asyncio.Future]:
+        """
+        Send the queued queries now.
+        """
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return None
+
+        batch = self.pending
+        self.pending = []
+        self.pending_cost = 0.0
+        task = asyncio.ensure_future(self._send(batch))
+        self.sending.add(task)
+        task.add_done_callback(self.sending.discard)
+        return task
+
+    async def _send(self, batch: list) -> None:
+        self.requests += 1
+        futures = [item[3] for item in batch]
+        try:
+            if len(batch) == 1:
+                # Nothing to merge
+                _, variables, query, _ = batch[0]
+                results = [await self.client.graphql(query, variables)]
+            else:
+                operations = [item[0] for item in batch]
+                query, variables = merge(operations, [item[1] for item in batch])
+                results = split(await self.client.graphql(query, variables), operations)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,713 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Callable, Dict, Set, Union, Iterator, List, Tuple
+from httpx import Request, Response
+from .models import Session
+from .types import UnionRequestData, ParsedBody
+from .utils import normalize_query, is_mutation, hmac_verify
+import hashlib
+import json
+import time
+import os
+
+# Header returned by Shopify to identify a version of a resource
+ETAG_HEADER = "etag"
+# Header returned by Shopify with the last modified date of a resource
+LAST_MODIFIED_HEADER = "last-modified"
+# Header sent to revalidate against an ETag
+IF_NONE_MATCH_HEADER = "if-none-match"
+# Header sent to revalidate against a last modified date
+IF_MODIFIED_SINCE_HEADER = "if-modified-since"
+# Header which can forbid storing of the response
+CACHE_CONTROL_HEADER = "cache-control"
+# HTTP status for a successful revalidation
+NOT_MODIFIED = 304
+# Headers describing the transfer, not the stored (already decoded) body
+SKIP_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+# Prefix of Shopify's global IDs
+GID_PREFIX = "gid://shopify/"
+
+
+def wall_time() -> float:
+    """
+    Get the current wall-clock time in ms.
+    Cache entries can outlive the process (disk), so a wall-clock is used.
+    """
+
+    return time.time() * 1000
+
+
+class CacheEntry:
+    """
+    A stored response: status, headers, and raw body.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        headers: dict,
+        content: bytes,
+        stored_at: float,
+        expires_at: float,
+        key: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+    ):
+        self.status = status
+        self.headers = headers
+        self.content = content
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        # Cache key the entry was stored under
+        self.key = key
+        # Tags for invalidation (GraphQL global IDs and resource types)
+        self.tags = tags
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get(ETAG_HEADER)
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get(LAST_MODIFIED_HEADER)
+
+    def validators(self) -> dict:
+        """
+        Headers to send to revalidate this entry.
+        """
+
+        headers = {}
+        if self.etag is not None:
+            headers[IF_NONE_MATCH_HEADER] = self.etag
+        if self.last_modified is not None:
+            headers[IF_MODIFIED_SINCE_HEADER] = self.last_modified
+        return headers
+
+    def dump(self) -> bytes:
+        """
+        Serialize the entry, a JSON line of metadata followed by the raw body.
+        """
+
+        meta = {
+            "status": self.status,
+            "headers": self.headers,
+            "stored_at": self.stored_at,
+            "expires_at": self.expires_at,
+            "key": self.key,
+            "tags": self.tags,
+        }
+        return json.dumps(meta, separators=(",", ":")).encode("utf-8") + b"\n" + self.content
+
+    @classmethod
+    def load(cls, data: bytes) -> "CacheEntry":
+        """
+        Unserialize an entry created by `dump`.
+        """
+
+        meta, content = data.split(b"\n", 1)
+        return cls(content=content, **json.loads(meta))
+
+
+class CacheBackend(ABC):
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, clock: Callable[[], float] = wall_time):
+        """
+        Setup the limits.
+
+        Args:
+            max_entries: Number of entries to keep before evicting the least recently used.
+            ttl: Time in ms to keep an entry for after it was stored, None to keep until evicted.
+            clock: Callable returning the current time in ms.
+        """
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        # Number of entries evicted by LRU or TTL
+        self.evictions = 0
+        # Called with the key of each entry evicted by LRU or TTL
+        self.on_evict: Optional[Callable[[str], None]] = None
+
+    def _evicted(self, key: Optional[str]) -> None:
+        """
+        Count an eviction and report it.
+        """
+
+        self.evictions += 1
+        if self.on_evict is not None and key is not None:
+            self.on_evict(key)
+
+    def tagged(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Get the key and tags of each stored entry with tags, to rebuild a tag index.
+        """
+
+        return iter(())
+
+    def expired(self, entry: CacheEntry) -> bool:
+        """
+        Determine if the entry has lived past the backend's TTL.
+        """
+
+        return self.ttl is not None and self.clock() - entry.stored_at > self.ttl
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Get an entry by key, marking it as recently used.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """
+        Store an entry by key, evicting if over the limit.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Remove an entry by key.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+
+        pass  # pragma: no cover
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.container: OrderedDict = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.container)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self.lock:
+            entry = self.container.get(key)
+            if entry is None:
+                return None
+            if self.expired(entry):
+                del self.container[key]
+                self._evicted(key)
+                return None
+            self.container.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        with self.lock:
+            self.container[key] = entry
+            self.container.move_to_end(key)
+            while len(self.container) > self.max_entries:
+                self._evicted(self.container.popitem(last=False)[0])
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.container.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.container.clear()
+
+    def tagged(self) -> Iterator[Tuple[str, List[str]]]:
+        with self.lock:
+            items = list(self.container.items())
+        return ((key, entry.tags) for key, entry in items if entry.tags)
+
+
+class DiskCacheBackend(CacheBackend):
+    def __init__(self, directory: str, **kwargs):
+        """
+        Store entries as files inside a directory.
+        Recency is tracked in memory and seeded from file modification times.
+        """
+
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Seed the LRU order, oldest first
+        names = [name for name in os.listdir(directory) if name.endswith(".entry")]
+        names.sort(key=lambda name: os.path.getmtime(self._path_for_name(name)))
+        self.index: OrderedDict = OrderedDict((name[:-6], None) for name in names)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _path_for_name(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _path(self, key: str) -> str:
+        return self._path_for_name(f"{self._file_key(key)}.entry")
+
+    @staticmethod
+    def _file_key(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _meta(self, file_key: str) -> dict:
+        """
+        Read only the metadata line of an entry, empty if unreadable.
+        """
+
+        try:
+            with open(self._path_for_name(f"{file_key}.entry"), "rb") as handle:
+                return json.loads(handle.readline())
+        except (OSError, ValueError):
+            return {}
+
+    def _remove(self, file_key: str) -> None:
+        self.index.pop(file_key, None)
+        try:
+            os.remove(self._path_for_name(f"{file_key}.entry"))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        file_key = self._file_key(key)
+        with self.lock:
+            try:
+                # Not limited to the index, another process may have written it
+                with open(self._path(key), "rb") as handle:
+                    entry = CacheEntry.load(handle.read())
+            except (OSError, ValueError):
+                # Missing or corrupt, drop it
+                self._remove(file_key)
+                return None
+            if self.expired(entry):
+                self._remove(file_key)
+                self._evicted(key)
+                return None
+            self.index[file_key] = None
+            self.index.move_to_end(file_key)
+            os.utime(self._path(key))
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        file_key = self._file_key(key)
+        path = self._path(key)
+        with self.lock:
+            # Write to a temporary file first so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as handle:
+                handle.write(entry.dump())
+            os.replace(tmp_path, path)
+
+            self.index[file_key] = None
+            self.index.move_to_end(file_key)
+            while len(self.index) > self.max_entries:
+                oldest = next(iter(self.index))
+                evicted = self._meta(oldest).get("key") if self.on_evict is not None else None
+                self._remove(oldest)
+                self._evicted(evicted)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self._remove(self._file_key(key))
+
+    def clear(self) -> None:
+        with self.lock:
+            for file_key in list(self.index):
+                self._remove(file_key)
+
+    def tagged(self) -> Iterator[Tuple[str, List[str]]]:
+        with self.lock:
+            metas = [self._meta(file_key) for file_key in list(self.index)]
+        return ((meta["key"], meta["tags"]) for meta in metas if meta.get("key") and meta.get("tags"))
+
+
+class CacheStats:
+    def __init__(self):
+        # Fresh entries served without a request
+        self.hits = 0
+        # Lookups which required a request
+        self.misses = 0
+        # Stale entries confirmed unchanged by a 304
+        self.revalidated = 0
+        # Responses written to the backend
+        self.stores = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "stores": self.stores,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class ResponseCache:
+    """
+    Caches successful GET responses for REST calls.
+
+    Fresh entries (younger than `ttl`) are served without a request.
+    Stale entries are revalidated with If-None-Match/If-Modified-Since.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: float = 60 * 1000,
+        clock: Callable[[], float] = wall_time,
+    ):
+        """
+        Args:
+            backend: Where to store entries; default: `MemoryCacheBackend`.
+            ttl: Time in ms an entry is considered fresh for.
+            clock: Callable returning the current time in ms.
+        """
+
+        self.backend = backend if backend is not None else MemoryCacheBackend(clock=clock)
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+
+    def key(self, session: Session, path: str, params: UnionRequestData = None) -> str:
+        """
+        Build the cache key for a shop, path, and the query params.
+        """
+
+        params = json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{session.domain}:{path}?{params}"
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        return self.backend.get(key)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self.clock() < entry.expires_at
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """
+        Get an entry and record the hit or miss.
+        """
+
+        entry = self.get(key)
+        if entry is not None and self.is_fresh(entry):
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        return entry
+
+    def storable(self, response: Response) -> bool:
+        """
+        Determine if a response can be stored.
+        """
+
+        cache_control = response.headers.get(CACHE_CONTROL_HEADER, "")
+        return response.status_code == 200 and "no-store" not in cache_control
+
+    def store(
+        self,
+        key: str,
+        response: Response,
+        ttl: Optional[float] = None,
+        tags: Optional[List[str]] = None,
+    ) -> Optional[CacheEntry]:
+        """
+        Store a response if it is storable.
+        """
+
+        if not self.storable(response):
+            return None
+
+        now = self.clock()
+        entry = CacheEntry(
+            status=response.status_code,
+            headers={k: v for k, v in response.headers.items() if k not in SKIP_HEADERS},
+            content=response.content,
+            stored_at=now,
+            expires_at=now + (self.ttl if ttl is None else ttl),
+            key=key,
+            tags=tags,
+        )
+        self.backend.set(key, entry)
+        self.stats.stores += 1
+        return entry
+
+    def refresh(self, key: str, entry: CacheEntry, ttl: Optional[float] = None) -> CacheEntry:
+        """
+        Entry was revalidated (304), mark it as fresh again.
+        """
+
+        now = self.clock()
+        entry.stored_at = now
+        entry.expires_at = now + (self.ttl if ttl is None else ttl)
+        self.backend.set(key, entry)
+        self.stats.revalidated += 1
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    @staticmethod
+    def response(entry: CacheEntry, method: str, url: str) -> Response:
+        """
+        Rebuild an HTTPX response from an entry.
+        """
+
+        return Response(
+            status_code=entry.status,
+            headers=entry.headers,
+            content=entry.content,
+            request=Request(method.upper(), url),
+        )
+
+
+class GraphQLCache(ResponseCache):
+    """
+    Caches results of GraphQL queries. Mutations are never cached.
+
+    Entries are tagged with the global IDs (and their resource types) found in the result,
+    so they can be invalidated when Shopify reports a change through a webhook.
+    Tags are stored with the entries, so the tag index is rebuilt from a disk backend on start,
+    and keys the backend evicts are dropped from it.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl: float = 60 * 1000,
+        ttls: Optional[Dict[str, float]] = None,
+        topic_types: Optional[Dict[str, str]] = None,
+        clock: Callable[[], float] = wall_time,
+    ):
+        """
+        Args:
+            backend: Where to store entries; default: `MemoryCacheBackend`.
+            ttl: Default time in ms a result is considered fresh for.
+            ttls: Per-query TTLs in ms, keyed by operation name or by the query itself.
+            topic_types: Overrides for mapping a webhook topic resource to a GraphQL type,
+                example: {"inventory_levels": "InventoryLevel"}.
+            clock: Callable returning the current time in ms.
+        """
+
+        super().__init__(backend=backend, ttl=ttl, clock=clock)
+        self.ttls = {self._ttl_key(query): value for query, value in (ttls or {}).items()}
+        self.topic_types = topic_types or {}
+        # Tag (GID or resource type) to cache keys, and the reverse
+        self.tags: Dict[str, Set[str]] = {}
+        self.key_tags: Dict[str, Set[str]] = {}
+        self.lock = Lock()
+        for key, tags in self.backend.tagged():
+            self._tag(key, tags)
+        self.backend.on_evict = self._evicted
+
+    def _evicted(self, key: str) -> None:
+        """
+        Drop an entry evicted by the backend from the tags.
+        """
+
+        with self.lock:
+            self._untag(key)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = super().get(key)
+        if entry is None and key in self.key_tags:
+            # Removed outside of the cache (expired, corrupt, or by another process)
+            self._evicted(key)
+        return entry
+
+    @staticmethod
+    def _ttl_key(query: str) -> str:
+        # Operation names are used as-is, documents are normalized
+        return query if query.isidentifier() else normalize_query(query)
+
+    def cacheable(self, query: str) -> bool:
+        return not is_mutation(query)
+
+    def key(
+        self,
+        session: Session,
+        query: str,
+        variables: Optional[dict] = None,
+        version: Optional[str] = None,
+    ) -> str:
+        """
+        Build the cache key for a shop, API version, normalized query, and variables.
+        """
+
+        variables = json.dumps(variables or {}, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{session.domain}:{version}:{normalize_query(query)}:{variables}"
+
+    def ttl_for(self, query: str) -> float:
+        """
+        Get the TTL for a query, by operation name first, then by the normalized query.
+        """
+
+        normalized = normalize_query(query)
+        tokens = normalized.split(" ")
+        if len(tokens) > 1 and tokens[0] == "query" and tokens[1] in self.ttls:
+            return self.ttls[tokens[1]]
+        return self.ttls.get(normalized, self.ttl)
+
+    def store(
+        self,
+        key: str,
+        response: Response,
+        ttl: Optional[float] = None,
+        body: ParsedBody = None,
+    ) -> Optional[CacheEntry]:
+        """
+        Store a result and tag it with the global IDs found in its body.
+        """
+
+        if body is None or not self.storable(response):
+            return super().store(key, response, ttl)
+
+        # Tag first, so an immediate eviction of the entry is also untagged
+        tags = sorted(set(self._extract_tags(body)))
+        self._tag(key, tags)
+        return super().store(key, response, ttl, tags)
+
+    def _tag(self, key: str, tags: List[str]) -> None:
+        """
+        Replace the tags of a key.
+        """
+
+        with self.lock:
+            self._untag(key)
+            self.key_tags[key] = set(tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+
+    def _untag(self, key: str) -> None:
+        """
+        Remove a key from all of its tags (lock must be held).
+        """
+
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def _extract_tags(self, value: Union[dict, list, str, None]) -> Iterator[str]:
+        """
+        Walk a body for global IDs, yielding the GID and its resource type.
+        """
+
+        if isinstance(value, dict):
+            for item in value.values():
+                yield from self._extract_tags(item)
+        elif isinstance(value, list):
+            for item in value:
+                yield from self._extract_tags(item)
+        elif isinstance(value, str) and value.startswith(GID_PREFIX):
+            gid = value.split("?", 1)[0]
+            yield gid
+            yield f"type:{gid[len(GID_PREFIX):].split('/', 1)[0]}"
+
+    def invalidate_tag(self, tag: str) -> int:
+        """
+        Remove all entries with a tag, returns the number of keys removed.
+        """
+
+        with self.lock:
+            keys = self.tags.pop(tag, set())
+            for key in keys:
+                self._untag(key)
+        for key in keys:
+            self.invalidate(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        super().clear()
+        with self.lock:
+            self.tags.clear()
+            self.key_tags.clear()
+
+    def invalidate_gid(self, gid: str) -> int:
+        """
+        Remove all entries containing a global ID, example: gid://shopify/Product/1.
+        """
+
+        return self.invalidate_tag(gid)
+
+    def invalidate_type(self, resource_type: str) -> int:
+        """
+        Remove all entries containing any global ID of a type, example: Product.
+        """
+
+        return self.invalidate_tag(f"type:{resource_type}")
+
+    def topic_type(self, topic: str) -> str:
+        """
+        Map a webhook topic to the GraphQL type, example: products/update to Product.
+        """
+
+        resource = topic.split("/", 1)[0]
+        if resource in self.topic_types:
+            return self.topic_types[resource]
+
+        if resource.endswith("ies"):
+            resource = f"{resource[:-3]}y"
+        elif resource.endswith("s"):
+            resource = resource[:-1]
+        return "".join(part.capitalize() for part in resource.split("_"))
+
+    def invalidate_topic(self, topic: str, payload: dict) -> int:
+        """
+        Invalidate entries affected by a webhook payload.
+
+        Entries containing the resource are removed. For creations (or when the
+        resource can not be identified), all entries of the resource type are removed,
+        as listings may now include the new resource.
+        """
+
+        resource_type = self.topic_type(topic)
+        gid = payload.get("admin_graphql_api_id")
+        if gid is None and "id" in payload:
+            gid = f"{GID_PREFIX}{resource_type}/{payload['id']}"
+
+        removed = 0
+        if gid is not None:
+            removed += self.invalidate_gid(gid)
+        if gid is None or topic.endswith("/create"):
+            removed += self.invalidate_type(resource_type)
+        return removed
+
+    def invalidate_webhook(
+        self,
+        secret: str,
+        topic: str,
+        body: Union[str, bytes],
+        hmac_header: str,
+    ) -> bool:
+        """
+        Verify a webhook and invalidate the entries affected by it.
+        Returns False if the webhook failed verification.
+
+        Args:
+            secret: The app's secret key.
+            topic: Value of the X-Shopify-Topic header.
+            body: The raw request body.
+            hmac_header: Value of the X-Shopify-Hmac-Sha256 header.
+        """
+
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        if not hmac_verify("webhook", secret, body, hmac_header):
+            return False
+
+        self.invalidate_topic(topic, json.loads(body))
+        return True
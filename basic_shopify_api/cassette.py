@@ -0,0 +1,314 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List, Optional, Union
+from httpx import AsyncBaseTransport, AsyncHTTPTransport, BaseTransport, HTTPTransport, Request, Response
+from .cache import SKIP_HEADERS
+from .constants import ACCESS_TOKEN_HEADER
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+# Marks the start of a cassette file
+MAGIC = b"BSACAS01"
+# Marks the end of the index footer
+INDEX_MAGIC = b"BSAIDX01"
+# Lengths of a record's meta and body
+RECORD_HEADER = struct.Struct("<II")
+# Offset of the index
+FOOTER = struct.Struct("<Q")
+# Request headers which are not recorded
+REDACTED_HEADERS = ("authorization", ACCESS_TOKEN_HEADER)
+
+
+class CassetteMiss(KeyError):
+    """
+    No recorded response for a request.
+    """
+
+    pass
+
+
+def request_key(request: Request) -> str:
+    """
+    Build the key matching a request to its recording: method, path, sorted query, and body digest.
+    Headers are left out so credentials do not need to match.
+    """
+
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.url.params.multi_items()))
+    digest = hashlib.sha1(request.content).hexdigest() if request.content else ""
+    return f"{request.method} {request.url.path}?{query} {digest}"
+
+
+class Record:
+    """
+    A recorded request/response pair.
+    """
+
+    def __init__(self, meta: dict, body: bytes):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def key(self) -> str:
+        return self.meta["key"]
+
+    @property
+    def elapsed(self) -> float:
+        # Time in ms the response took
+        return self.meta["elapsed"]
+
+    @property
+    def started(self) -> float:
+        # Time in ms from the start of the recording to the request
+        return self.meta["started"]
+
+    def response(self, request: Request) -> Response:
+        return Response(
+            status_code=self.meta["status"],
+            headers=self.meta["headers"],
+            content=self.body,
+            request=request,
+        )
+
+
+class CassetteWriter:
+    """
+    Appends records to a cassette file, and writes the index on close.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = Lock()
+        self.handle = open(path, "wb")
+        self.handle.write(MAGIC)
+        self.index: Dict[str, List[int]] = defaultdict(list)
+        self.started_at = time.perf_counter()
+
+    def write(self, request: Request, response: Response, started: float, elapsed: float) -> None:
+        """
+        Append a record. Times are from time.perf_counter(), in seconds.
+        """
+
+        key = request_key(request)
+        meta = json.dumps({
+            "key": key,
+            "method": request.method,
+            "url": str(request.url),
+            "request_headers": [
+                [name, value] for name, value in request.headers.multi_items() if name.lower() not in REDACTED_HEADERS
+            ],
+            "status": response.status_code,
+            # The body is stored decoded
+            "headers": [
+                [name, value] for name, value in response.headers.multi_items() if name.lower() not in SKIP_HEADERS
+            ],
+            "started": (started - self.started_at) * 1000,
+            "elapsed": elapsed * 1000,
+        }, separators=(",", ":")).encode("utf-8")
+        body = response.content
+
+        with self.lock:
+            offset = self.handle.tell()
+            self.handle.write(RECORD_HEADER.pack(len(meta), len(body)))
+            self.handle.write(meta)
+            self.handle.write(body)
+            self.index[key].append(offset)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.handle.closed:
+                return
+            offset = self.handle.tell()
+            self.handle.write(json.dumps(self.index, separators=(",", ":")).encode("utf-8"))
+            self.handle.write(FOOTER.pack(offset))
+            self.handle.write(INDEX_MAGIC)
+            self.handle.close()
+
+
+class Cassette:
+    """
+    Reads a cassette file through mmap. Only the index is held in memory,
+    records are read from the mapping when requested.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.handle = open(path, "rb")
+        size = os.fstat(self.handle.fileno()).st_size
+        if size < len(MAGIC):
+            raise ValueError(f"{path} is not a cassette")
+        self.map = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a cassette")
+        self.end = size
+        self.index = self._read_index()
+
+    def _read_index(self) -> Dict[str, List[int]]:
+        footer = FOOTER.size + len(INDEX_MAGIC)
+        if self.end >= len(MAGIC) + footer and self.map[self.end - len(INDEX_MAGIC):self.end] == INDEX_MAGIC:
+            (offset,) = FOOTER.unpack_from(self.map, self.end - footer)
+            index = json.loads(self.map[offset:self.end - footer].decode("utf-8"))
+            self.end = offset
+            return index
+        # Recording was not closed, rebuild the index by scanning
+        return self._scan()
+
+    def _scan(self) -> Dict[str, List[int]]:
+        index: Dict[str, List[int]] = defaultdict(list)
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= self.end:
+            meta_length, body_length = RECORD_HEADER.unpack_from(self.map, offset)
+            end = offset + RECORD_HEADER.size + meta_length + body_length
+            if end > self.end:
+                # Partly written record
+                break
+            index[self._meta(offset, meta_length)["key"]].append(offset)
+            offset = end
+        self.end = offset
+        return dict(index)
+
+    def _meta(self, offset: int, meta_length: int) -> dict:
+        start = offset + RECORD_HEADER.size
+        return json.loads(self.map[start:start + meta_length].decode("utf-8"))
+
+    def __len__(self) -> int:
+        return sum(len(offsets) for offsets in self.index.values())
+
+    def record(self, offset: int) -> Record:
+        """
+        Read the record at an offset.
+        """
+
+        meta_length, body_length = RECORD_HEADER.unpack_from(self.map, offset)
+        start = offset + RECORD_HEADER.size + meta_length
+        return Record(self._meta(offset, meta_length), self.map[start:start + body_length])
+
+    def records(self):
+        """
+        Iterate the records in recorded order.
+        """
+
+        for offset in sorted(offset for offsets in self.index.values() for offset in offsets):
+            yield self.record(offset)
+
+    def close(self) -> None:
+        self.map.close()
+        self.handle.close()
+
+
+class RecordingTransport(BaseTransport, AsyncBaseTransport):
+    """
+    Records request/response pairs with their timing and headers to a cassette,
+    while passing requests to a real transport.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        transport: Optional[BaseTransport] = None,
+        async_transport: Optional[AsyncBaseTransport] = None,
+    ):
+        """
+        Args:
+            path: The cassette file to write.
+            transport: Transport for Client, defaults to HTTPX's.
+            async_transport: Transport for AsyncClient, defaults to HTTPX's.
+        """
+
+        self.writer = CassetteWriter(path)
+        self.transport = transport
+        self.async_transport = async_transport
+
+    def handle_request(self, request: Request) -> Response:
+        if self.transport is None:
+            self.transport = HTTPTransport()
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        response.read()
+        self.writer.write(request, response, started, time.perf_counter() - started)
+        return response
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if self.async_transport is None:
+            self.async_transport = AsyncHTTPTransport()
+        started = time.perf_counter()
+        response = await self.async_transport.handle_async_request(request)
+        await response.aread()
+        self.writer.write(request, response, started, time.perf_counter() - started)
+        return response
+
+    def close(self) -> None:
+        self.writer.close()
+        if self.transport is not None:
+            self.transport.close()
+
+    async def aclose(self) -> None:
+        self.writer.close()
+        if self.async_transport is not None:
+            await self.async_transport.aclose()
+
+
+class ReplayTransport(BaseTransport, AsyncBaseTransport):
+    """
+    Serves recorded responses from a cassette.
+
+    Identical requests are served their recordings in order, the last one is
+    repeated once they run out. Responses are delayed by their recorded time
+    divided by the speed, so latency is deterministic.
+    """
+
+    def __init__(self, cassette: Union[str, Cassette], speed: Optional[float] = 1.0, strict: bool = True):
+        """
+        Args:
+            cassette: The cassette, or the path to its file.
+            speed: Replay speed, 2.0 is twice as fast as recorded. None or 0 to not wait.
+            strict: Raise CassetteMiss for unrecorded requests, else answer with a 404.
+        """
+
+        self.cassette = Cassette(cassette) if isinstance(cassette, str) else cassette
+        self.speed = speed
+        self.strict = strict
+        self.lock = Lock()
+        # Number of times each key was served
+        self.served: Dict[str, int] = defaultdict(int)
+        self.misses = 0
+
+    def _record(self, request: Request) -> Optional[Record]:
+        key = request_key(request)
+        with self.lock:
+            offsets = self.cassette.index.get(key)
+            if not offsets:
+                self.misses += 1
+                if self.strict:
+                    raise CassetteMiss(key)
+                return None
+            position = min(self.served[key], len(offsets) - 1)
+            self.served[key] += 1
+        return self.cassette.record(offsets[position])
+
+    def _delay(self, record: Record) -> float:
+        return record.elapsed / 1000 / self.speed if self.speed else 0
+
+    def handle_request(self, request: Request) -> Response:
+        request.read()
+        record = self._record(request)
+        if record is None:
+            return Response(404, request=request)
+        delay = self._delay(record)
+        if delay > 0:
+            time.sleep(delay)
+        return record.response(request)
+
+    async def handle_async_request(self, request: Request) -> Response:
+        await request.aread()
+        record = self._record(request)
+        if record is None:
+            return Response(404, request=request)
+        delay = self._delay(record)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return record.response(request)
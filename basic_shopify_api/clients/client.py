@@ -1,11 +1,17 @@
 from . import ApiCommon
 from ..options import Options
 from ..models import RestResult, ApiResult, Session
+from ..splitter import SplitPlan
 from ..types import UnionRequestData
-from ..constants import REST, GRAPHQL
-from httpx import Client as HttpxClient
+from ..constants import REST, GRAPHQL, ONE_SECOND
+from ..types import Priority
+from ..deadline import Deadline, DeadlineExceeded
+from httpx import TimeoutException, Client as HttpxClient
 from httpx._types import HeaderTypes
 from httpx._models import Response
+from functools import wraps
+from typing import List, Optional, Union
+import inspect
 
 
 class Client(HttpxClient, ApiCommon):
@@ -30,75 +36,177 @@ class Client(HttpxClient, ApiCommon):
             auth=None if self.options.is_public else (self.session.key, self.session.password),
             **kwargs
         )
+        if self.options.metrics is not None:
+            # Stamp when response headers arrive, to split network time into first byte and body
+            self.event_hooks["response"].append(self._metrics_response_hook)
 
-    def _rest_rate_limit(self) -> None:
+    def _metrics_response_hook(self, response: Response) -> None:
+        """
+        HTTPX response hook for metrics.
+        """
+
+        self._metrics_first_byte(response)
+
+    def _rest_rate_limit(self, deadline: Optional[Deadline] = None) -> None:
         """
         Handle rate limiting of REST.
         """
 
-        limiting_required = self._rest_rate_limit_required()
+        start = self._metrics_start()
+        limiting_required = self._rest_rate_limit_required(deadline)
         if limiting_required is not False:
             # Rate limit was determined to be required, sleep for X ms
             self.options.deferrer.sleep(limiting_required)
+        self._metrics_phase("limiter_wait", REST, start)
 
-    def _graphql_cost_limit(self) -> None:
+    def _graphql_cost_limit(self, request: dict = None, deadline: Optional[Deadline] = None) -> None:
         """
         Handle cost limiting for GraphQL.
         """
 
-        limiting_required = self._graphql_cost_limit_required()
+        start = self._metrics_start()
+        limiting_required = self._graphql_cost_limit_required(request, deadline)
         if limiting_required is not False:
             # Cost limit was determined to be required, sleep for X ms
             self.options.deferrer.sleep(limiting_required)
+        self._metrics_phase("limiter_wait", GRAPHQL, start)
 
-    def _rest_pre_actions(self, **kwargs) -> None:
+    def _rest_pre_actions(
+        self,
+        priority: Priority = None,
+        deadline: Optional[Deadline] = None,
+        **kwargs
+    ) -> None:
         """
         Actions which fire before REST API call.
         """
 
-        # Determine if rate limiting is required and handle it
-        self._rest_rate_limit()
-        # Add to the request times
-        self.options.time_store.append(self.session, self.options.deferrer.current_time())
+        # Wait for a turn at the shop's budget, by priority
+        start = self._metrics_start()
+        with self._scheduler_slot(REST, priority, deadline):
+            self._metrics_phase("queue_wait", REST, start)
+            # Determine if rate limiting is required and handle it
+            self._rest_rate_limit(deadline)
+            # Add to the request times
+            self.options.time_store.append(self.session, self.options.deferrer.current_time())
+        self._metrics_rest_utilisation()
         # Run user-defined actions and pass in the request built
         [meth(self, **kwargs) for meth in self.options.rest_pre_actions]
 
-    def _graphql_pre_actions(self, **kwargs) -> None:
+    def _graphql_pre_actions(
+        self,
+        priority: Priority = None,
+        deadline: Optional[Deadline] = None,
+        **kwargs
+    ) -> None:
         """
         Actions which fire before GraphQL API call.
         """
 
-        # Determine if cost limiting is required and handle it
-        self._graphql_cost_limit()
-        # Add to the request times
-        self.options.time_store.append(self.session, self.options.deferrer.current_time())
+        # Wait for a turn at the shop's budget, by priority
+        start = self._metrics_start()
+        with self._scheduler_slot(GRAPHQL, priority, deadline):
+            self._metrics_phase("queue_wait", GRAPHQL, start)
+            # Determine if cost limiting is required and handle it
+            self._graphql_cost_limit(kwargs, deadline)
+            # Add to the request times
+            self.options.time_store.append(self.session, self.options.deferrer.current_time())
         # Run user-defined actions and pass in the request built
         [meth(self, **kwargs) for meth in self.options.graphql_pre_actions]
 
-    def _rest_post_actions(self, response: Response, retries: int) -> RestResult:
+    def _send_request(
+        self,
+        api: str,
+        meth: callable,
+        priority: Priority = None,
+        deadline: Optional[Deadline] = None,
+        **kwargs
+    ) -> Response:
+        """
+        Send the request, holding a slot of the shared concurrency cap and
+        of the shop's adaptive concurrency limit if setup.
+        With a deadline, the HTTP timeout is the time left.
+        """
+
+        start = self._metrics_start()
+        with self._concurrency_slot(priority, deadline) as limit, self._fair_slot(priority, deadline):
+            self._metrics_phase("slot_wait", api, start)
+            start = self._metrics_start()
+            limit.start()
+            if deadline is None:
+                response = meth(**kwargs)
+            else:
+                timeout = deadline.timeout()
+                try:
+                    response = meth(timeout=timeout, **kwargs)
+                except TimeoutException as e:
+                    raise DeadlineExceeded("send", timeout * ONE_SECOND, 0) from e
+            self._metrics_send(api, start, response)
+            limit.observe(response)
+        return response
+
+    def _rest_post_actions(
+        self,
+        response: Response,
+        retries: int,
+        cached: bool = False,
+        fields: Optional[List[str]] = None,
+    ) -> RestResult:
         """
         Actions which fire after REST API call.
         """
 
         # Parse the response from HTTPX
-        result = self._parse_response(REST, response, retries)
+        result = self._parse_response(REST, response, retries, cached, fields)
         # Run user-defined actions and pass in the result object
         [meth(self, result) for meth in self.options.rest_post_actions]
         return result
 
-    def _graphql_post_actions(self, response: Response, retries: int) -> ApiResult:
+    def _graphql_post_actions(
+        self,
+        response: Response,
+        retries: int,
+        cached: bool = False,
+        request: dict = None,
+    ) -> ApiResult:
         """
         Actions which fire after GraphQL API call.
         """
 
         # Parse the response from HTTPX
-        result = self._parse_response(GRAPHQL, response, retries)
-        # Add to the costs
-        self._cost_update(result.body)
+        result = self._parse_response(GRAPHQL, response, retries, cached)
+        if not cached:
+            # Add to the costs
+            self._cost_update(self._cost_body(result), request)
         # Run user-defined actions and pass in the result object
         [meth(self, result) for meth in self.options.graphql_post_actions]
         return result
 
+    def _graphql_split(
+        self,
+        plan: SplitPlan,
+        headers: HeaderTypes,
+        priority: Priority = None,
+        deadline: Optional[Deadline] = None,
+    ) -> ApiResult:
+        """
+        Run a split query page by page and stitch the pages together.
+        """
+
+        results, cursor = [], None
+        while len(results) < self.options.query_splitter.max_pages:
+            query, variables = plan.page(cursor)
+            result = self.graphql(query, variables, headers, priority, deadline=deadline)
+            if result.errors is not None:
+                # Page failed, nothing to stitch
+                return result
+
+            results.append(result)
+            cursor = plan.next_cursor(result.body)
+            if cursor is None:
+                break
+        return plan.stitch(results)
+
     def _retry_request(meth: callable) -> callable:
         """
         Determine if retry is required.
@@ -107,28 +215,69 @@ class Client(HttpxClient, ApiCommon):
         If not, return the result.
         """
 
+        signature = inspect.signature(meth)
+
+        @wraps(meth)
         def wrapper(*args, **kwargs) -> ApiResult:
             # Get the instance
             inst: Client = args[0]
+            # Bind the arguments, the deadline may be passed by position
+            bound = signature.bind(*args, **kwargs)
+            # Resolve the deadline once on the deferrer's clock, so retries share it
+            clock = inst.options.deferrer.current_time
+            deadline = bound.arguments["deadline"] = Deadline.of(bound.arguments.get("deadline"), clock)
             # Get the number of retries so far
-            retries: int = kwargs.get("_retries", 0)
+            retries: int = bound.arguments.get("_retries", 0)
             # Run the call (rest or graphql)
-            result: ApiResult = meth(*args, **kwargs)
+            result: ApiResult = meth(*bound.args, **bound.kwargs)
             # Get the response and determine if retry is required
             response: Response = result.response
             retry = inst._retry_required(response, retries)
 
             if retry is not False:
-                # Retry is needed, sleep for X ms
+                # Retry is needed, fail now if the sleep leaves no time for it, else sleep for X ms
+                inst._deadline_check(deadline, retry, "retry_sleep")
+                start = inst._metrics_start()
                 inst.options.deferrer.sleep(retry)
+                inst._metrics_phase("retry_sleep", meth.__name__, start)
+                if start is not None:
+                    inst.options.metrics.increment("retries", api=meth.__name__)
 
                 # Re-run the request
-                kwargs["_retries"] = retries + 1
+                bound.arguments["_retries"] = retries + 1
                 inst_meth = getattr(inst, meth.__name__)
-                return inst_meth(*args[1:], **kwargs)
+                return inst_meth(*bound.args[1:], **bound.kwargs)
             return result
         return wrapper
 
+    def _coalesce_request(meth: callable) -> callable:
+        """
+        Determine if the call can share an identical in-flight call.
+
+        If it can, wait for the in-flight call's result.
+        If not, run the call.
+        """
+
+        signature = inspect.signature(meth)
+
+        @wraps(meth)
+        def wrapper(*args, **kwargs) -> ApiResult:
+            # Get the instance
+            inst: Client = args[0]
+            if inst.options.coalescer is None:
+                return meth(*args, **kwargs)
+
+            # Build the key from all arguments, defaults included
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {name: value for name, value in bound.arguments.items() if name != "self"}
+            key = inst._coalesce_key(meth.__name__, arguments)
+            if key is None:
+                return meth(*args, **kwargs)
+            return inst.options.coalescer.run(key, lambda: meth(*args, **kwargs))
+        return wrapper
+
+    @_coalesce_request
     @_retry_request
     def rest(
         self,
@@ -136,33 +285,59 @@ class Client(HttpxClient, ApiCommon):
         path: str,
         params: UnionRequestData = None,
         headers: HeaderTypes = {},
+        fields: Union[None, str, List[str]] = None,
+        priority: Priority = None,
+        deadline: Union[None, float, Deadline] = None,
         _retries: int = 0
     ) -> RestResult:
         """
         Fire a REST API call.
+        If fields are given, only they are requested and kept in the result.
+        Priority orders the call against others waiting for the shop's budget.
+        A deadline, in seconds or a Deadline, bounds the limiter waits, retry sleeps, and HTTP timeout together.
         """
 
+        deadline = Deadline.of(deadline, self.options.deferrer.current_time)
         # Dynamically map to HTTPX's method for get/post/put/etc
         meth = getattr(self, method)
+        # Merge requested fields into the params
+        params, fields = self._rest_fields(method, params, fields)
         # Build the request based on the method and inputs
         kwargs = self._build_request(method, path, params, headers)
+        # Serve a fresh cached response (GET only) without touching the limiter
+        cache_key, cache_entry = self._rest_cache_lookup(method, kwargs)
+        if self._rest_cache_fresh(cache_entry):
+            return self._rest_post_actions(
+                self._rest_cache_response(cache_entry, kwargs), _retries, True, fields
+            )
         # Run the pre-actions
-        self._rest_pre_actions(**kwargs)
-        # Run the call and post-actions, and return the result
-        return self._rest_post_actions(meth(**kwargs), _retries)
+        self._rest_pre_actions(priority, deadline, **kwargs)
+        # Run the call
+        response, cached = self._send_request(REST, meth, priority, deadline, **kwargs), False
+        if cache_key is not None:
+            # Store the response, or use the cached body if revalidated
+            response, cached = self._rest_cache_update(cache_key, cache_entry, response, kwargs)
+        # Run the post-actions, and return the result
+        return self._rest_post_actions(response, _retries, cached, fields)
 
+    @_coalesce_request
     @_retry_request
     def graphql(
         self,
         query: str,
         variables: dict = None,
         headers: HeaderTypes = {},
+        priority: Priority = None,
+        deadline: Union[None, float, Deadline] = None,
         _retries: int = 0,
     ) -> ApiResult:
         """
         Fire a GraphQL call.
+        Priority orders the call against others waiting for the shop's budget.
+        A deadline, in seconds or a Deadline, bounds the limiter waits, retry sleeps, and HTTP timeout together.
         """
 
+        deadline = Deadline.of(deadline, self.options.deferrer.current_time)
         # Build the request
         kwargs = self._build_request(
             "post",
@@ -170,7 +345,24 @@ class Client(HttpxClient, ApiCommon):
             {"query": query, "variables": variables},
             headers,
         )
+        # Serve a fresh cached result (queries only) without touching the limiter
+        cache_key, cache_entry = self._graphql_cache_lookup(query, variables)
+        if cache_entry is not None:
+            return self._graphql_post_actions(self._graphql_cache_response(cache_entry, kwargs), _retries, True)
+        # Split the query if predicted to be over the max cost
+        plan = self._graphql_split_plan(query, variables)
+        if plan is not None:
+            return self._graphql_split(plan, headers, priority, deadline)
         # Run the pre-actions
-        self._graphql_pre_actions(**kwargs)
-        # Run the call and post-actions, and return the result
-        return self._graphql_post_actions(self.post(**kwargs), _retries)
+        self._graphql_pre_actions(priority, deadline, **kwargs)
+        # Run the call and post-actions
+        response = self._send_request(GRAPHQL, self.post, priority, deadline, **kwargs)
+        result = self._graphql_post_actions(response, _retries, request=kwargs)
+        # Split the query if reported to be over the max cost
+        plan = self._graphql_split_plan(query, variables, result)
+        if plan is not None:
+            return self._graphql_split(plan, headers, priority, deadline)
+        if cache_key is not None:
+            # Store the result for next time
+            self._graphql_cache_store(cache_key, query, result)
+        return result
@@ -3,15 +3,58 @@ from ..constants import NOT_AUTHABLE_PATTERN, \
     LINK_PATTERN, \
     ACCESS_TOKEN_HEADER, \
     ONE_SECOND, \
-    RETRY_HEADER
-from ..types import UnionRequestData, ParsedBody
+    RETRY_HEADER, \
+    FIRST_BYTE_EXTENSION
+from ..types import UnionRequestData, ParsedBody, Priority
 from ..models import RestLink, RestResult, ApiResult
-from ..constants import REST, LINK_HEADER
+from ..options import Options
+from ..constants import REST, GRAPHQL, LINK_HEADER
+from ..cache import CacheEntry, NOT_MODIFIED
+from ..utils import is_mutation, field_tree, project_fields
+from ..estimator import static_cost
+from ..splitter import SplitPlan, max_cost_exceeded
+from ..metrics import throttled
+from ..scheduler import Slot
+from ..deadline import Deadline, DeadlineExceeded
+from ..concurrency import ConcurrencySlot
 from httpx._types import HeaderTypes
 from httpx._models import Response
-from typing import Pattern, Union, Optional
+from typing import Pattern, Union, Optional, Tuple, List
 import re
 
+# Patterns compiled once for all clients
+REGEX_NOT_AUTHABLE = re.compile(NOT_AUTHABLE_PATTERN)
+REGEX_NOT_VERSIONABLE = re.compile(NOT_VERSIONABLE_PATTERN)
+REGEX_LINK = re.compile(LINK_PATTERN)
+
+
+class RequestTemplate:
+    """
+    Parts of a request which only change with the options or session,
+    built once per client and rebuilt when either changes.
+    """
+
+    # Most versioned paths remembered, cleared when full
+    MAX_PATHS = 1024
+
+    def __init__(self, options: Options, password: str, headers: dict):
+        # Options the template was built from, and their revision at the time
+        self.options = options
+        self.revision = options.revision
+        # Access token the template was built with
+        self.password = password
+        # Options headers merged with the access token header (public)
+        self.headers = headers
+        # Versioned path by path
+        self.paths = {}
+
+    def current(self, options: Options, password: str) -> bool:
+        """
+        Determine if the template still matches the options and session.
+        """
+
+        return self.options is options and self.revision == options.revision and self.password == password
+
 
 class ApiCommon:
     """
@@ -25,7 +68,7 @@ class ApiCommon:
         Compile NOT_AUTHABLE_PATTERN once.
         """
 
-        return re.compile(NOT_AUTHABLE_PATTERN)
+        return REGEX_NOT_AUTHABLE
 
     @property
     def _regex_not_versionable(self) -> Pattern:
@@ -33,7 +76,7 @@ class ApiCommon:
         Compile NOT_VERSIONABLE_PATH once.
         """
 
-        return re.compile(NOT_VERSIONABLE_PATTERN)
+        return REGEX_NOT_VERSIONABLE
 
     @property
     def _regex_link(self) -> Pattern:
@@ -41,7 +84,7 @@ class ApiCommon:
         Compile LINK_PATTERN once.
         """
 
-        return re.compile(LINK_PATTERN)
+        return REGEX_LINK
 
     def is_authable(self, path: str) -> bool:
         """
@@ -85,12 +128,33 @@ class ApiCommon:
         if ignore_check:
             return self.replace_path(path)
 
-        ignore_versioning = (
-            not self.is_authable(path) or
-            not self.is_versionable(path) or
-            self.options.version in path
-        )
-        return path if ignore_versioning else self.replace_path(path)
+        paths = self._request_template().paths
+        versioned = paths.get(path)
+        if versioned is None:
+            ignore_versioning = (
+                not self.is_authable(path) or
+                not self.is_versionable(path) or
+                self.options.version in path
+            )
+            versioned = path if ignore_versioning else self.replace_path(path)
+            if len(paths) >= RequestTemplate.MAX_PATHS:
+                paths.clear()
+            paths[path] = versioned
+        return versioned
+
+    def _request_template(self) -> RequestTemplate:
+        """
+        Get the request template, rebuilding it if the options or session changed since.
+        """
+
+        options, password = self.options, self.session.password
+        template = getattr(self, "_template", None)
+        if template is None or not template.current(options, password):
+            headers = dict(options.headers)
+            if options.is_public:
+                headers[ACCESS_TOKEN_HEADER] = password
+            template = self._template = RequestTemplate(options, password, headers)
+        return template
 
     def _build_headers(self, headers: HeaderTypes) -> HeaderTypes:
         """
@@ -102,9 +166,8 @@ class ApiCommon:
             headers: Dict of headers to add to the request.
         """
 
-        if self.options.is_public:
-            headers = {ACCESS_TOKEN_HEADER: self.session.password, **headers}
-        return {**self.options.headers, **headers}
+        template = self._request_template().headers
+        return {**template, **headers} if headers else dict(template)
 
     def _build_request(
         self,
@@ -129,6 +192,35 @@ class ApiCommon:
             kwargs["json"] = params
         return kwargs
 
+    def _rest_fields(
+        self,
+        method: str,
+        params: UnionRequestData,
+        fields: Union[None, str, List[str]],
+    ) -> Tuple[UnionRequestData, Optional[List[str]]]:
+        """
+        Merge the requested fields into the params as Shopify's "fields" param (GET only).
+        Fields already in the params are kept, as are pagination params.
+        Returns the params and the fields to project the result to.
+
+        Args:
+            fields: List of fields (or comma separated), dotted names select nested keys.
+        """
+
+        if not fields or method != "get":
+            return params, None
+
+        if isinstance(fields, str):
+            fields = fields.split(",")
+        params = dict(params or {})
+        existing = params.get("fields")
+        if existing:
+            fields = [*(existing.split(",") if isinstance(existing, str) else existing), *fields]
+        fields = [field.strip() for field in fields if field.strip()]
+        # Shopify only selects top-level fields, nested ones are projected after decoding
+        params["fields"] = ",".join(field_tree(fields))
+        return params, fields
+
     def _rest_extract_link(self, headers: HeaderTypes) -> RestLink:
         """
         REST responses, if paginated, will contain a header which will
@@ -142,7 +234,15 @@ class ApiCommon:
                 link[result[1][0:4]] = result[0]
         return RestLink(**link)
 
-    def _rest_rate_limit_required(self) -> Union[bool, int]:
+    def _deadline_check(self, deadline: Optional[Deadline], wait: float, phase: str) -> None:
+        """
+        Raise DeadlineExceeded if waiting for X ms would leave no time to finish the call.
+        """
+
+        if deadline is not None:
+            deadline.check(wait, phase)
+
+    def _rest_rate_limit_required(self, deadline: Optional[Deadline] = None) -> Union[bool, int]:
         """
         Determines if rate limiting is required.
 
@@ -153,6 +253,9 @@ class ApiCommon:
 
         If the request is inside the window, we must sleep the difference.
         If the request is outside the window, we allow it and reset the request times.
+
+        With a deadline, DeadlineExceeded is raised before the request times are reset,
+        so the window still applies to the calls which follow.
         """
 
         all_time = self.options.time_store.all(self.session)
@@ -163,15 +266,38 @@ class ApiCommon:
         # We've reached the limit, lets see if the request happened within or outside the window of time
         current_time = self.options.deferrer.current_time()
         window_time = all_time[0] + ONE_SECOND
+        limiting_required = False if current_time > window_time else window_time - current_time
+        if limiting_required is not False:
+            # Fail now if the wait leaves no time for the call
+            self._deadline_check(deadline, limiting_required, "limiter_wait")
 
         # Reset the request times, return result... False = no limiting, else limit for X ms
         self.options.time_store.reset(self.session)
-        return False if current_time > window_time else window_time - current_time
+        return limiting_required
+
+    def _rest_spare(self) -> bool:
+        """
+        Determine if the shop's REST rate budget has room for another call now, without waiting.
+        If so, the room is taken.
+        """
+
+        if len(self.options.time_store.all(self.session)) >= self.options.rest_limit:
+            return False
+        self.options.time_store.append(self.session, self.options.deferrer.current_time())
+        return True
 
-    def _graphql_cost_limit_required(self) -> Union[bool, int]:
+    def _graphql_cost_limit_required(
+        self,
+        request: Optional[dict] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Union[bool, int]:
         """
         Determine if cost limiting is required.
 
+        If a cost estimator is setup, the predicted cost of the query is reserved
+        against the shop's bucket, and limiting is required if the bucket can not cover it.
+        Else, the cost of the last request is used as follows.
+
         First we check if the number of requests is empty or the costs are empty.
         If they are, we allow the request to continue as normal.
 
@@ -182,8 +308,30 @@ class ApiCommon:
         If its under the limit, we allow it through without limiting.
 
         In both cases, request times and costing is reset.
+
+        With a deadline, DeadlineExceeded is raised before anything is reset,
+        and a reservation made for the call is released.
         """
 
+        estimator = self.options.cost_estimator
+        if estimator is not None and request is not None:
+            # Reserve the predicted cost before sending
+            query, variables = request["json"]["query"], request["json"]["variables"]
+            limiting_required = estimator.reserve(self.session, query, variables, self.options.deferrer.current_time())
+            if limiting_required is not False:
+                try:
+                    # Fail now if the wait leaves no time for the call
+                    self._deadline_check(deadline, limiting_required, "limiter_wait")
+                except DeadlineExceeded:
+                    # The call will not be sent, give back what it reserved
+                    estimator.release(self.session, query, variables, self.options.deferrer.current_time())
+                    raise
+
+            # The estimator's bucket replaces the stores, reset them so they do not grow
+            self.options.time_store.reset(self.session)
+            self.options.cost_store.reset(self.session)
+            return limiting_required
+
         all_time = self.options.time_store.all(self.session)
         all_cost = self.options.cost_store.all(self.session)
         if len(all_time) == 0 or len(all_cost) == 0:
@@ -194,26 +342,309 @@ class ApiCommon:
         last_time, last_cost = all_time[-1], all_cost[-1]
         time_diff = self.options.deferrer.current_time() - last_time
         points_per_sec = self.options.graphql_limit
+        limiting_required = False if time_diff > ONE_SECOND or last_cost < points_per_sec else ONE_SECOND - time_diff
+        if limiting_required is not False:
+            # Fail now if the wait leaves no time for the call
+            self._deadline_check(deadline, limiting_required, "limiter_wait")
 
         # Reset request times and costing, return if sleeping should happen or not
         self.options.time_store.reset(self.session)
         self.options.cost_store.reset(self.session)
-        return False if time_diff > ONE_SECOND or last_cost < points_per_sec else ONE_SECOND - time_diff
+        return limiting_required
 
-    def _cost_update(self, body: Optional[ParsedBody]) -> None:
+    def _cost_body(self, result: ApiResult) -> Optional[ParsedBody]:
+        """
+        Get the body to read costs from. Bodies with errors are dropped by parsing,
+        but throttled and errored calls still report their cost, so the JSON is decoded again.
+        """
+
+        if result.body is not None or result.response is None:
+            return result.body
+        try:
+            body = result.response.json()
+        except Exception:
+            return None
+        return body if isinstance(body, dict) else None
+
+    def _cost_update(self, body: Optional[ParsedBody], request: Optional[dict] = None) -> None:
         """
         Read the body and grab the "actualQueryCost" to use for cost limiting.
+        If a cost estimator is setup, it learns from the costs for the query.
         """
 
-        if body is None or "extensions" not in body:
+        if body is None or "cost" not in body.get("extensions", {}):
             return
-        self.options.cost_store.append(self.session, int(body["extensions"]["cost"]["actualQueryCost"]))
+        actual_cost = body["extensions"]["cost"].get("actualQueryCost")
+        if actual_cost is not None:
+            # Throttled calls were not run, and cost nothing
+            self.options.cost_store.append(self.session, int(actual_cost))
+
+        throttle_status = body["extensions"]["cost"].get("throttleStatus")
+        if self.options.metrics is not None and throttle_status is not None:
+            # Share of the bucket in use
+            maximum = float(throttle_status["maximumAvailable"])
+            used = maximum - float(throttle_status["currentlyAvailable"])
+            self.options.metrics.utilise(self.session.domain, GRAPHQL, used / maximum if maximum > 0 else 0.0)
+
+        estimator = self.options.cost_estimator
+        if estimator is not None and request is not None:
+            estimator.record(
+                self.session,
+                request["json"]["query"],
+                request["json"]["variables"],
+                body,
+                self.options.deferrer.current_time(),
+            )
+
+    def _rest_cache_lookup(self, method: str, request: dict) -> Tuple[Optional[str], Optional[CacheEntry]]:
+        """
+        Find a cached response for a REST GET call, if caching is enabled.
+        When the entry is stale, its validators are added to the request headers
+        so Shopify can answer with a 304 instead of the full body.
+        """
+
+        cache = self.options.rest_cache
+        if cache is None or method != "get":
+            return None, None
+
+        key = cache.key(self.session, request["url"], request.get("params"))
+        entry = cache.lookup(key)
+        if entry is not None and not cache.is_fresh(entry):
+            request["headers"] = {**request["headers"], **entry.validators()}
+        return key, entry
+
+    def _rest_cache_fresh(self, entry: Optional[CacheEntry]) -> bool:
+        """
+        Determine if the entry can be served without a request.
+        """
+
+        return entry is not None and self.options.rest_cache.is_fresh(entry)
+
+    def _rest_cache_response(self, entry: CacheEntry, request: dict) -> Response:
+        """
+        Rebuild the HTTPX response for a cached entry.
+        """
+
+        return self.options.rest_cache.response(entry, "get", f"{self.session.base_url}{request['url']}")
+
+    def _rest_cache_update(
+        self,
+        key: str,
+        entry: Optional[CacheEntry],
+        response: Response,
+        request: dict,
+    ) -> Tuple[Response, bool]:
+        """
+        Refresh the entry on a 304 and swap in the cached body, else store the new response.
+        Returns the response to parse and if it came from the cache.
+        """
+
+        cache = self.options.rest_cache
+        if response.status_code == NOT_MODIFIED and entry is not None:
+            entry = cache.refresh(key, entry)
+            return self._rest_cache_response(entry, request), True
+
+        cache.store(key, response)
+        return response, False
+
+    def _graphql_cache_lookup(
+        self,
+        query: str,
+        variables: Optional[dict],
+    ) -> Tuple[Optional[str], Optional[CacheEntry]]:
+        """
+        Find a fresh cached result for a GraphQL query, if caching is enabled.
+        Mutations are never cached and return no key.
+        """
+
+        cache = self.options.graphql_cache
+        if cache is None or not cache.cacheable(query):
+            return None, None
+
+        key = cache.key(self.session, query, variables, self.options.version)
+        entry = cache.lookup(key)
+        return key, entry if entry is not None and cache.is_fresh(entry) else None
 
-    def _parse_response(self, api: str, response: Response, retries: int) -> Union[ApiResult, RestResult]:
+    def _graphql_cache_response(self, entry: CacheEntry, request: dict) -> Response:
+        """
+        Rebuild the HTTPX response for a cached entry.
+        """
+
+        return self.options.graphql_cache.response(entry, "post", f"{self.session.base_url}{request['url']}")
+
+    def _graphql_cache_store(self, key: str, query: str, result: ApiResult) -> None:
+        """
+        Store a successful GraphQL result.
+        """
+
+        if result.errors is None:
+            cache = self.options.graphql_cache
+            cache.store(key, result.response, cache.ttl_for(query), result.body)
+
+    def _graphql_split_plan(
+        self,
+        query: str,
+        variables: Optional[dict],
+        result: Optional[ApiResult] = None,
+    ) -> Optional[SplitPlan]:
+        """
+        Determine if a query needs to be split, if splitting is enabled.
+
+        Without a result, the cost is predicted (cost estimator or static estimate).
+        With a result, the cost is read from a MAX_COST_EXCEEDED error.
+        """
+
+        splitter = self.options.query_splitter
+        if splitter is None or is_mutation(query):
+            return None
+
+        if result is None:
+            estimator = self.options.cost_estimator
+            cost = estimator.estimate(query, variables) if estimator is not None else static_cost(query, variables)
+            if cost <= splitter.max_cost:
+                return None
+            return splitter.plan(query, variables, cost)
+
+        exceeded = max_cost_exceeded(result)
+        if exceeded is None:
+            return None
+        return splitter.plan(query, variables, *exceeded)
+
+    def _coalesce_key(self, api: str, arguments: dict) -> Optional[str]:
+        """
+        Build the coalescing key for a call, or None if it should not be coalesced.
+        Only first attempts of reads are coalesced: REST GET calls and GraphQL queries.
+        """
+
+        coalescer = self.options.coalescer
+        if coalescer is None or arguments.get("_retries", 0) > 0:
+            return None
+        if api == REST and arguments["method"] != "get":
+            return None
+        if api == GRAPHQL and is_mutation(arguments["query"]):
+            return None
+
+        # Followers share the leader's call, whatever their priority or deadline
+        arguments = {
+            name: value for name, value in arguments.items() if name not in ("_retries", "priority", "deadline")
+        }
+        return coalescer.key(self.session, api, arguments)
+
+    def _scheduler_slot(self, api: str, priority: Priority = None, deadline: Optional[Deadline] = None) -> Slot:
+        """
+        Get the turn at the shop's budget for the API, for use with "with" or "async with".
+        Does nothing if no scheduler is setup.
+        """
+
+        return Slot(self.options.scheduler, f"{self.session.domain}:{api}", priority, deadline, "queue_wait")
+
+    def _fair_slot(self, priority: Priority = None, deadline: Optional[Deadline] = None) -> Slot:
+        """
+        Get a slot of the shared concurrency cap for the shop, for use with "with" or "async with".
+        Does nothing if no fair scheduler is setup.
+        """
+
+        return Slot(self.options.fair_scheduler, self.session.domain, priority, deadline, "slot_wait")
+
+    def _concurrency_slot(self, priority: Priority = None, deadline: Optional[Deadline] = None) -> ConcurrencySlot:
+        """
+        Get a slot under the shop's adaptive limit of calls in flight, for use with "with" or "async with".
+        Does nothing if no adaptive concurrency is setup.
+        """
+
+        return ConcurrencySlot(
+            self.options.concurrency, self.session.domain, priority, self._metrics_concurrency, deadline
+        )
+
+    def _metrics_concurrency(self, limit: float) -> None:
+        """
+        Record the shop's adaptive limit of calls in flight, if metrics are enabled.
+        """
+
+        metrics = self.options.metrics
+        if metrics is not None:
+            metrics.set("concurrency_limit", limit, shop=self.session.domain)
+
+    def _metrics_start(self) -> Optional[float]:
+        """
+        Get the time a phase starts, or None if metrics are disabled.
+        """
+
+        metrics = self.options.metrics
+        return None if metrics is None else metrics.clock()
+
+    def _metrics_phase(self, phase: str, api: str, start: Optional[float]) -> None:
+        """
+        Record the time spent in a phase since it started, if metrics are enabled.
+        """
+
+        if start is not None:
+            metrics = self.options.metrics
+            metrics.observe(phase, metrics.clock() - start, api)
+
+    def _metrics_send(self, api: str, start: Optional[float], response: Response) -> None:
+        """
+        Record the network time of a call. It is split into time to first byte and
+        time reading the body when the response hook stamped the response.
+        """
+
+        if start is None:
+            return
+
+        metrics = self.options.metrics
+        now = metrics.clock()
+        metrics.observe("send", now - start, api)
+        first_byte_at = response.extensions.get(FIRST_BYTE_EXTENSION)
+        if first_byte_at is not None:
+            metrics.observe("first_byte", first_byte_at - start, api)
+            metrics.observe("body", now - first_byte_at, api)
+
+    def _metrics_first_byte(self, response: Response) -> None:
+        """
+        Stamp the time the response headers arrived, before the body is read.
+        """
+
+        metrics = self.options.metrics
+        if metrics is not None:
+            response.extensions[FIRST_BYTE_EXTENSION] = metrics.clock()
+
+    def _metrics_rest_utilisation(self) -> None:
+        """
+        Record the share of the REST rate limit in use for the shop.
+        """
+
+        metrics = self.options.metrics
+        if metrics is not None:
+            used = len(self.options.time_store.all(self.session))
+            metrics.utilise(self.session.domain, REST, min(used / self.options.rest_limit, 1.0))
+
+    def _metrics_call(self, api: str, status: int, errors, cached: bool) -> None:
+        """
+        Count the call by status, and count it if throttled.
+        """
+
+        metrics = self.options.metrics
+        if metrics is None:
+            return
+
+        metrics.increment("requests", api=api, status=str(status), cached=str(cached).lower())
+        if not cached and throttled(status, errors):
+            metrics.increment("throttled", api=api, shop=self.session.domain)
+
+    def _parse_response(
+        self,
+        api: str,
+        response: Response,
+        retries: int,
+        cached: bool = False,
+        fields: Optional[List[str]] = None,
+    ) -> Union[ApiResult, RestResult]:
         """
         Get the response from HTTPX and parse it for a JSON body and errors.
+        If fields are given, the body is projected to them.
         """
 
+        start = self._metrics_start()
         try:
             # Try to decode the JSON
             errors = None
@@ -222,18 +653,26 @@ class ApiCommon:
                 # JSON body has an "error" or "errors" key, grab it, kill the body
                 errors = body.get("errors", body.get("error", None))
                 body = None
+            elif fields and isinstance(body, dict):
+                # Keep only the requested keys
+                body = project_fields(body, fields)
         except Exception as e:
             # Error decoding for some reason, get the exception and kill the body
             errors = e
             body = None
 
-        # Return the HTTPX response, HTTP status code, JSON body, errors body/exception, and number of retires
+        self._metrics_phase("decode", api, start)
+        self._metrics_call(api, response.status_code, errors, cached)
+
+        # Return the HTTPX response, HTTP status code, JSON body, errors body/exception, number of retires,
+        # and if the response was served from cache
         kwargs = {
             "response": response,
             "status": response.status_code,
             "body": body,
             "errors": errors,
             "retries": retries,
+            "cached": cached,
         }
         if api == REST:
             # Include "link" for REST calls
@@ -0,0 +1,142 @@
+from threading import Lock, Event
+from typing import Any, Callable, Awaitable, Dict, Optional
+from .models import Session
+import asyncio
+import json
+
+
+class _Call:
+    """
+    An in-flight call which followers wait on.
+    """
+
+    def __init__(self):
+        self.event = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class LeaderCancelled(Exception):
+    """
+    The leader of an async call was cancelled, followers run the call again.
+    """
+
+    pass
+
+
+class Coalescer:
+    """
+    Collapses identical in-flight reads (singleflight).
+
+    The first caller for a key (the leader) runs the request, any callers for the
+    same key while it is in flight (followers) wait for and share the leader's result.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        # In-flight calls for threads
+        self.calls: Dict[str, _Call] = {}
+        # In-flight calls for coroutines
+        self.futures: Dict[str, asyncio.Future] = {}
+        # Number of calls which ran the request
+        self.leaders = 0
+        # Number of calls which shared a leader's result instead of running the request
+        self.collapsed = 0
+
+    @staticmethod
+    def key(session: Session, api: str, arguments: dict) -> str:
+        """
+        Build the key identifying a call for a shop.
+        """
+
+        arguments = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{session.domain}:{api}:{arguments}"
+
+    @property
+    def inflight(self) -> int:
+        return len(self.calls) + len(self.futures)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "collapsed": self.collapsed,
+            "inflight": self.inflight,
+        }
+
+    def run(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Run a call (sync), or wait for the identical call already in flight.
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+                self.leaders += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+    async def arun(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a call (async), or wait for the identical call already in flight.
+        """
+
+        loop = asyncio.get_running_loop()
+        # Futures belong to a loop, keep calls from different loops apart
+        loop_key = f"{id(loop)}:{key}"
+        with self.lock:
+            future = self.futures.get(loop_key)
+            leader = future is None
+            if leader:
+                future = loop.create_future()
+                self.futures[loop_key] = future
+                self.leaders += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            try:
+                # Shield so a cancelled follower does not cancel the shared future
+                return await asyncio.shield(future)
+            except LeaderCancelled:
+                # Nobody cancelled this call, run it again (the first to resume leads)
+                return await self.arun(key, func)
+
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled, let the followers run the call again
+            future.set_exception(LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved, followers may not exist to consume it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.futures[loop_key]
@@ -0,0 +1,307 @@
+"""
+Column-oriented buffers for paginated results, for analytics over many records.
+
+Records are flattened ("customer.id") into one column per field as pages arrive.
+Numbers and booleans go to typed arrays (8 bytes or less a value), strings are
+dictionary-encoded (a 4 byte code a value, each distinct string kept once), and
+anything else (lists of line items, for example) is kept as is.
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Union
+from .models import ApiResult
+
+# Array typecodes by column kind
+TYPECODES = {int: "q", float: "d", bool: "b"}
+# Column kinds by value type, other types are kept as objects
+KINDS = {int: int, float: float, bool: bool, str: str}
+# Code of a missing string
+NULL_CODE = -1
+
+
+class Column:
+    """
+    A column of values, typed by its first value.
+    """
+
+    def __init__(self, kind: Optional[type], rows: int = 0):
+        """
+        Args:
+            kind: Type of the values: int, float, bool, str, or object. None to type by the first value.
+            rows: Number of missing values to start with.
+        """
+
+        self.kind = kind
+        # Values: an array for numbers, codes for strings, or a list
+        self.data: Union[array, list] = self._empty(kind)
+        # Rows with no value, only kept once there is one
+        self.nulls: Optional[bytearray] = None
+        # Distinct strings, and their codes
+        self.strings: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.extend_nulls(rows)
+
+    @staticmethod
+    def _empty(kind: Optional[type]) -> Union[array, list]:
+        if kind in TYPECODES:
+            return array(TYPECODES[kind])
+        if kind is str:
+            return array("i")
+        return []
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def extend_nulls(self, rows: int) -> None:
+        """
+        Add missing values.
+        """
+
+        if rows <= 0:
+            return
+        if self.nulls is None:
+            self.nulls = bytearray(len(self.data))
+        self.nulls.extend(b"\x01" * rows)
+        if self.kind is str:
+            self.data.extend([NULL_CODE] * rows)
+        elif self.kind in TYPECODES:
+            self.data.extend([0] * rows)
+        else:
+            self.data.extend([None] * rows)
+
+    def append(self, value: Any) -> None:
+        if value is None:
+            self.extend_nulls(1)
+            return
+        kind = KINDS.get(type(value), object)
+        if kind is self.kind:
+            pass
+        elif self.kind is None:
+            self._retype(kind)
+        elif kind is not self.kind and self.kind is not object:
+            if self.kind is float and kind is int:
+                value = float(value)
+            else:
+                self._promote(kind)
+
+        if self.kind is str:
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.strings)
+                self.strings.append(value)
+            self.data.append(code)
+        else:
+            self.data.append(value)
+        if self.nulls is not None:
+            self.nulls.append(0)
+
+    def _retype(self, kind: type) -> None:
+        # Type a column of only missing values
+        rows = len(self.data)
+        self.kind = kind
+        self.data = self._empty(kind)
+        self.nulls = None
+        self.extend_nulls(rows)
+
+    def _promote(self, kind: type) -> None:
+        # Ints and floats mix as floats, anything else falls back to a list
+        values = self.values()
+        self.kind = float if {self.kind, kind} == {int, float} else object
+        self.data = self._empty(self.kind)
+        self.strings, self.codes = [], {}
+        nulls, self.nulls = self.nulls, None
+        for index, value in enumerate(values):
+            if nulls is not None and nulls[index]:
+                self.extend_nulls(1)
+            else:
+                self.append(value)
+
+    def values(self) -> list:
+        """
+        Get the values, with None for missing values and strings decoded.
+        """
+
+        nulls = self.nulls
+        if self.kind is str:
+            strings = self.strings
+            return [None if code == NULL_CODE else strings[code] for code in self.data]
+        if nulls is None:
+            return list(self.data)
+        return [None if nulls[index] else value for index, value in enumerate(self.data)]
+
+    def numpy(self):
+        """
+        Get the values as a NumPy array: numbers and booleans without copying, strings as their
+        codes (see `strings`), and anything else as objects. Missing numbers are 0, see `nulls`.
+        """
+
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover
+            raise ImportError("NumPy is required for numpy(), install basic_shopify_api[numpy]")
+
+        if isinstance(self.data, array):
+            dtypes = {"q": numpy.int64, "d": numpy.float64, "b": numpy.bool_, "i": numpy.int32}
+            return numpy.frombuffer(self.data, dtype=dtypes[self.data.typecode])
+        return numpy.array(self.data, dtype=object)
+
+
+def unwrap(value: Any) -> Any:
+    """
+    Unwrap GraphQL connections ({"edges": [{"node": ...}]} or {"nodes": [...]}) to lists of nodes.
+    """
+
+    if isinstance(value, dict):
+        if "edges" in value and isinstance(value["edges"], list):
+            return [unwrap(edge.get("node")) for edge in value["edges"]]
+        if "nodes" in value and isinstance(value["nodes"], list):
+            return [unwrap(node) for node in value["nodes"]]
+        return {key: unwrap(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [unwrap(item) for item in value]
+    return value
+
+
+class ColumnarResult:
+    """
+    Collects records from paginated REST or GraphQL results into columns.
+
+    Example:
+        columns = ColumnarResult(fields=["id", "total_price", "customer.id"], types={"total_price": float})
+        result = client.rest("get", "/admin/api/orders.json", {"limit": 250})
+        columns.add(result)
+        ...
+        sum(columns["total_price"].data)
+    """
+
+    def __init__(
+        self,
+        fields: Optional[List[str]] = None,
+        types: Optional[Dict[str, type]] = None,
+        separator: str = ".",
+    ):
+        """
+        Args:
+            fields: Flattened fields to keep, all fields if not given.
+            types: Type to convert a field's values to, example: {"total_price": float} for REST's string prices.
+            separator: Joins nested keys in field names.
+        """
+
+        self.fields = set(fields) if fields else None
+        self.types = types or {}
+        self.separator = separator
+        # Prefixes of the kept fields, to skip nested records which have none
+        self.prefixes = None
+        if fields:
+            self.prefixes = {
+                separator.join(field.split(separator)[:depth])
+                for field in fields
+                for depth in range(1, field.count(separator) + 1)
+            }
+        self.columns: Dict[str, Column] = {}
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, field: str) -> Column:
+        return self.columns[field]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.columns
+
+    def flatten(self, record: dict, prefix: str = "", flat: Optional[dict] = None) -> dict:
+        """
+        Flatten a record's nested dicts into one level of joined keys.
+        """
+
+        flat = {} if flat is None else flat
+        for key, value in record.items():
+            name = f"{prefix}{key}"
+            if isinstance(value, dict) and name not in self.types:
+                if self.prefixes is None or name in self.prefixes:
+                    self.flatten(value, f"{name}{self.separator}", flat)
+            elif self.fields is None or name in self.fields:
+                flat[name] = value
+        return flat
+
+    def append(self, record: dict) -> None:
+        """
+        Add a record as a row. GraphQL nodes should be unwrapped first, as `add` does.
+        """
+
+        flat = self.flatten(record)
+        for name, value in flat.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = Column(self.types.get(name), self.rows)
+            if value is not None and name in self.types:
+                value = self.types[name](value)
+            column.append(value)
+        self.rows += 1
+        if len(flat) < len(self.columns):
+            for column in self.columns.values():
+                if len(column) < self.rows:
+                    # Field missing from the record
+                    column.extend_nulls(1)
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def add(self, result: ApiResult, key: Optional[str] = None) -> int:
+        """
+        Add the records of a page, returning the number added.
+
+        Args:
+            result: REST or GraphQL result.
+            key: REST: key of the records in the body, GraphQL: dotted path of the connection
+                under "data". Found if not given: the only list (REST), or the first connection (GraphQL).
+        """
+
+        records = records_of(result.body, key)
+        before = self.rows
+        self.extend(records)
+        return self.rows - before
+
+    def to_dict(self) -> Dict[str, list]:
+        """
+        Get the columns as lists of values.
+        """
+
+        return {name: column.values() for name, column in self.columns.items()}
+
+
+def records_of(body: Optional[dict], key: Optional[str] = None) -> List[dict]:
+    """
+    Find the records in a REST or GraphQL body.
+    """
+
+    if not body:
+        return []
+    if "data" in body and isinstance(body["data"], dict):
+        value = body["data"]
+        if key is not None:
+            for part in key.split("."):
+                value = value[part]
+            return unwrap(value)
+        connection = _connection(value)
+        return [] if connection is None else unwrap(connection)
+
+    if key is not None:
+        return body[key]
+    lists = [value for value in body.values() if isinstance(value, list)]
+    return lists[0] if len(lists) == 1 else []
+
+
+def _connection(value: Any) -> Optional[dict]:
+    # First GraphQL connection, depth first
+    if not isinstance(value, dict):
+        return None
+    if "edges" in value or "nodes" in value:
+        return value
+    for item in value.values():
+        connection = _connection(item)
+        if connection is not None:
+            return connection
+    return None
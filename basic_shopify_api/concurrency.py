@@ -0,0 +1,238 @@
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Union
+from .scheduler import _Scheduler, _Waiter, Slot
+from .constants import CALL_LIMIT_HEADER
+from .utils import perf_time
+from .deadline import Deadline
+from httpx import TransportError
+
+# Marker of a GraphQL THROTTLED error, found without decoding the body
+THROTTLED_MARKER = b'"THROTTLED"'
+
+
+class _Window:
+    """
+    A shop's congestion window: its limit of calls in flight and recent latencies.
+    """
+
+    def __init__(self, limit: float, samples: int):
+        self.limit = limit
+        # Number of calls in flight
+        self.inflight = 0
+        # Recent latencies in ms, the lowest is the baseline
+        self.latencies: Deque[float] = deque(maxlen=samples)
+        # Time of the last cut, signals from calls sent before it are ignored
+        self.cut_at = float("-inf")
+
+
+class AdaptiveConcurrency(_Scheduler):
+    """
+    Limits the calls in flight per shop, adapting the limit like TCP congestion control (AIMD).
+
+    While responses are healthy, the limit grows additively: by `increase` per limit's worth
+    of responses, about one call per round trip. When a response shows congestion (a 429/5xx,
+    a THROTTLED error, the REST bucket filling past `usage`, latency past `tolerance` times the
+    recent baseline, or a failed send) the limit is cut by `decrease`. Signals from calls sent
+    before the last cut are ignored, so one burst of throttling only cuts the limit once.
+    """
+
+    def __init__(
+        self,
+        initial: float = 4,
+        minimum: float = 1,
+        maximum: float = 40,
+        increase: float = 1,
+        decrease: float = 0.5,
+        tolerance: float = 2.0,
+        slack: float = 20,
+        usage: float = 0.8,
+        samples: int = 50,
+        ageing: float = 2000,
+        clock=perf_time,
+    ):
+        """
+        Args:
+            initial: Starting limit of calls in flight, per shop.
+            minimum: Lowest the limit is cut to.
+            maximum: Highest the limit grows to.
+            increase: Growth of the limit per limit's worth of healthy responses.
+            decrease: Factor to cut the limit by on congestion.
+            tolerance: Latency over the baseline (lowest of recent latencies) by this factor is congestion.
+            slack: Time in ms added to the latency allowed, so small jitter is not congestion.
+            usage: Share of the REST bucket in use, from the call limit header, which is congestion.
+            samples: Number of recent latencies kept for the baseline.
+            ageing: Time in ms a waiter waits to move up one priority class, within its shop.
+            clock: Callable returning a monotonic time in ms.
+        """
+
+        if not 0 < decrease < 1:
+            raise ValueError(f"Decrease: {decrease} must be between 0 and 1")
+        if not 0 < minimum <= initial <= maximum:
+            raise ValueError(f"Limits: {minimum} <= {initial} <= {maximum} must hold, above 0")
+
+        super().__init__(ageing, clock)
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.slack = slack
+        self.usage = usage
+        self.samples = samples
+        # Congestion windows by shop
+        self.windows: Dict[str, _Window] = {}
+        # Number of cuts, by shop
+        self.cuts: Dict[str, int] = {}
+
+    def limit(self, key: str) -> float:
+        """
+        Get the current limit of calls in flight for the shop.
+        """
+
+        window = self.windows.get(key)
+        return self.initial if window is None else window.limit
+
+    @property
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "limits": {key: window.limit for key, window in self.windows.items()},
+                "inflight": {key: window.inflight for key, window in self.windows.items() if window.inflight},
+                "cuts": dict(self.cuts),
+                "waiting": sum(1 for queue in self.queues.values() for entry in queue if not entry[2].cancelled),
+            }
+
+    def _window(self, key: str) -> _Window:
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = _Window(self.initial, self.samples)
+        return window
+
+    def _admit(self, window: _Window, waiter: _Waiter) -> None:
+        window.inflight += 1
+        waiter.admitted = True
+
+    def _dispatch(self, key: str, window: _Window) -> None:
+        # Hand free room under the limit to waiters, a limit of 2.5 allows 2 in flight
+        while window.inflight < int(window.limit):
+            waiter = self._pop(key)
+            if waiter is None:
+                return
+            self._admit(window, waiter)
+            waiter.wake()
+
+    def _enter(self, key: str, waiter: _Waiter) -> bool:
+        with self.lock:
+            window = self._window(key)
+            if window.inflight < int(window.limit) and key not in self.queues:
+                self._admit(window, waiter)
+                return True
+            self._push(key, waiter)
+            return False
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            window = self.windows[key]
+            window.inflight -= 1
+            self._dispatch(key, window)
+
+    def congested(self, response, latency: float, baseline: float) -> bool:
+        """
+        Determine if a response shows congestion. None is a failed send.
+        """
+
+        if response is None or response.status_code == 429 or response.status_code >= 500:
+            return True
+        if latency > baseline * self.tolerance + self.slack:
+            return True
+        call_limit = response.headers.get(CALL_LIMIT_HEADER)
+        if call_limit:
+            used, _, size = call_limit.partition("/")
+            if size and int(used) >= int(size) * self.usage:
+                return True
+        return THROTTLED_MARKER in response.content
+
+    def record(self, key: str, sent_at: float, response=None) -> float:
+        """
+        Adapt the shop's limit to the outcome of a call sent at a time, returning the new limit.
+        A response of None is a failed send.
+        """
+
+        now = self.clock()
+        latency = now - sent_at
+        with self.lock:
+            window = self._window(key)
+            baseline = min(window.latencies, default=latency)
+            window.latencies.append(latency)
+            if self.congested(response, latency, baseline):
+                if sent_at > window.cut_at:
+                    # Multiplicative decrease, once per round of calls
+                    window.limit = max(self.minimum, window.limit * self.decrease)
+                    window.cut_at = now
+                    self.cuts[key] = self.cuts.get(key, 0) + 1
+            elif window.inflight >= int(window.limit):
+                # Additive increase, only while the limit is what holds calls back
+                window.limit = min(self.maximum, window.limit + self.increase / window.limit)
+                self._dispatch(key, window)
+            return window.limit
+
+    def slot(self, key: str, priority: Union[None, int, str] = None) -> "ConcurrencySlot":
+        return ConcurrencySlot(self, key, priority)
+
+
+class ConcurrencySlot(Slot):
+    """
+    Slot under a shop's adaptive limit, which reports the outcome of its call.
+    Without a limiter, it does nothing.
+    """
+
+    def __init__(
+        self,
+        scheduler: Optional[AdaptiveConcurrency],
+        key: str,
+        priority: Union[None, int, str] = None,
+        on_limit: Optional[Callable[[float], None]] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        """
+        Args:
+            on_limit: Called with the shop's limit after each change.
+            deadline: Deadline of the call, bounds waiting for room under the limit.
+        """
+
+        super().__init__(scheduler, key, priority, deadline, "slot_wait")
+        self.on_limit = on_limit
+        # Time the call was sent, and if its outcome was recorded
+        self.sent_at: Optional[float] = None
+        self.recorded = False
+
+    def start(self) -> None:
+        """
+        Mark the call as sent.
+        """
+
+        if self.scheduler is not None:
+            self.sent_at = self.scheduler.clock()
+
+    def observe(self, response) -> None:
+        """
+        Record the call's response.
+        """
+
+        if self.scheduler is None or self.sent_at is None:
+            return
+        self.recorded = True
+        limit = self.scheduler.record(self.key, self.sent_at, response)
+        if self.on_limit is not None:
+            self.on_limit(limit)
+
+    def __exit__(self, *exc) -> None:
+        if exc[0] is not None and issubclass(exc[0], TransportError) and not self.recorded:
+            # Failed send, example: a timeout or refused connection
+            # (the caller's own deadline or cancellation says nothing about the shop)
+            self.observe(None)
+        super().__exit__(*exc)
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__(*exc)
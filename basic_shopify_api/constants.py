@@ -24,3 +24,7 @@ ONE_SECOND = 1000
 REST = "rest"
 # GraphQL API type
 GRAPHQL = "graphql"
+# Response extension holding the time the response headers arrived, for metrics
+FIRST_BYTE_EXTENSION = "basic_shopify_api.first_byte_at"
+# Header supplied by Shopify for REST API calls with the shop's bucket usage, example: 32/40
+CALL_LIMIT_HEADER = "x-shopify-shop-api-call-limit"
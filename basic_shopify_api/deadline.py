@@ -0,0 +1,72 @@
+from typing import Union
+from .constants import ONE_SECOND
+from .utils import perf_time
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a call can not finish within its deadline.
+    """
+
+    def __init__(self, phase: str, needed: float, remaining: float):
+        """
+        Args:
+            phase: Where the call was: queue_wait, limiter_wait, slot_wait, retry_sleep, or send.
+            needed: Time in ms the phase needed.
+            remaining: Time in ms left of the deadline.
+        """
+
+        super().__init__(f"Deadline exceeded: {phase} needs {needed:.0f}ms, {remaining:.0f}ms remaining")
+        self.phase = phase
+        self.needed = needed
+        self.remaining = remaining
+
+
+class Deadline:
+    """
+    The time a call must finish by, shared by its limiter waits, retry sleeps, and HTTP timeouts.
+    """
+
+    def __init__(self, budget: float, clock=perf_time):
+        """
+        Args:
+            budget: Time in seconds the call has, from now.
+            clock: Callable returning a monotonic time in ms, clients use their deferrer's.
+        """
+
+        self.clock = clock
+        self.expires_at = clock() + budget * ONE_SECOND
+
+    @classmethod
+    def of(cls, deadline: Union[None, float, "Deadline"], clock=perf_time) -> Union[None, "Deadline"]:
+        """
+        Get the deadline for a budget in seconds on a clock, passing deadlines and None through.
+        """
+
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(deadline, clock)
+
+    def remaining(self) -> float:
+        """
+        Get the time in ms left.
+        """
+
+        return max(self.expires_at - self.clock(), 0)
+
+    def check(self, wait: float, phase: str) -> None:
+        """
+        Raise if waiting for a time in ms would leave no time to finish the call.
+        """
+
+        remaining = self.remaining()
+        if wait >= remaining:
+            raise DeadlineExceeded(phase, wait, remaining)
+
+    def timeout(self) -> float:
+        """
+        Get the HTTP timeout in seconds for the time left, raising if there is none.
+        """
+
+        self.check(0, "send")
+        return self.remaining() / ONE_SECOND
@@ -1,11 +1,16 @@
 import time
 import asyncio
+import heapq
 from abc import ABCMeta, abstractmethod
+from typing import List
 from .types import SleepTime
 
+# Wall time at zero on the monotonic clock, taken once per process
+WALL_EPOCH = time.time() - time.monotonic()
+
 
 class Deferrer(metaclass=ABCMeta):
-    def current_time(self) -> int:
+    def current_time(self) -> float:
         """
         Get the current time in ms.
         """
@@ -30,8 +35,92 @@ class Deferrer(metaclass=ABCMeta):
 
 
 class SleepDeferrer(Deferrer):
+    def current_time(self) -> float:
+        """
+        Get the current time in ms from a high resolution monotonic clock, which does not
+        jump when the system clock is adjusted. It is anchored to the wall time when the
+        process started, so stored times can be shared between processes and restarts.
+        """
+
+        return (WALL_EPOCH + time.monotonic()) * 1000
+
     def sleep(self, length: SleepTime) -> None:
         time.sleep(length / 1000.0)
 
     async def asleep(self, length: SleepTime) -> None:
-        asyncio.sleep(length / 1000.0)
+        await asyncio.sleep(length / 1000.0)
+
+
+class VirtualDeferrer(Deferrer):
+    """
+    Simulated time, to run hours of rate limited traffic in seconds: sleeping moves
+    the clock forward instead of waiting.
+
+    Sync sleeps move the clock straight away, for one thread. Async sleeps wait until the
+    other tasks are blocked on virtual sleeps too, then the clock jumps to the earliest
+    wake time, like a discrete event simulation. Tasks should not wait on real time
+    (network, timers), only on each other and virtual sleeps.
+    """
+
+    def __init__(self, start: float = 0, settle: int = 8):
+        """
+        Args:
+            start: Time in ms to start at.
+            settle: Loop iterations without a new sleep before the clock moves, so woken tasks
+                run until they sleep again.
+        """
+
+        self.now = float(start)
+        self.settle = settle
+        # Async sleepers: (wake time, sequence, future)
+        self.sleepers: List[tuple] = []
+        self.sequence = 0
+        # If the clock is being moved for async sleepers
+        self.ticking = False
+
+    def current_time(self) -> float:
+        return self.now
+
+    def advance(self, length: SleepTime) -> None:
+        """
+        Move the clock forward by X ms.
+        """
+
+        self.now += max(length, 0)
+
+    def sleep(self, length: SleepTime) -> None:
+        self.advance(length)
+
+    async def asleep(self, length: SleepTime) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.sequence += 1
+        heapq.heappush(self.sleepers, (self.now + max(length, 0), self.sequence, future))
+        if not self.ticking:
+            self.ticking = True
+            loop.call_soon(self._tick, loop, self.sequence, 0)
+        await future
+
+    def _tick(self, loop: asyncio.AbstractEventLoop, sequence: int, idle: int) -> None:
+        if sequence != self.sequence or idle < self.settle:
+            # Tasks are still running, wait for them to block
+            loop.call_soon(self._tick, loop, self.sequence, 0 if sequence != self.sequence else idle + 1)
+            return
+
+        while self.sleepers and self.sleepers[0][2].done():
+            # Cancelled while asleep
+            heapq.heappop(self.sleepers)
+        if not self.sleepers:
+            self.ticking = False
+            return
+
+        # Everything is asleep, wake the earliest sleepers
+        self.now = max(self.now, self.sleepers[0][0])
+        while self.sleepers and self.sleepers[0][0] <= self.now:
+            future = heapq.heappop(self.sleepers)[2]
+            if not future.done():
+                future.set_result(None)
+        if self.sleepers:
+            loop.call_soon(self._tick, loop, self.sequence, 0)
+        else:
+            self.ticking = False
@@ -0,0 +1,326 @@
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Union
+from .models import Session
+from .types import ParsedBody
+from .utils import normalize_query, query_tokens
+import hashlib
+import json
+
+# Fields which wrap a connection's nodes without adding cost
+FREE_FIELDS = ("edges", "pageInfo")
+# Base cost of a connection field
+CONNECTION_COST = 2
+# Base cost of an object field
+OBJECT_COST = 1
+# Base cost of a mutation
+MUTATION_COST = 10
+
+
+def variable_shape(value: Any) -> Any:
+    """
+    Reduce variables to their shape: keys and value types, without the values.
+    """
+
+    if isinstance(value, dict):
+        return {key: variable_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [variable_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def fingerprint(query: str, variables: Optional[dict] = None) -> str:
+    """
+    Fingerprint a query by its normalized text and the shape of its variables.
+    """
+
+    shape = json.dumps(variable_shape(variables or {}), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(f"{normalize_query(query)}|{shape}".encode("utf-8")).hexdigest()
+
+
+def _page_size(tokens: List[str], i: int, variables: dict) -> Tuple[Optional[int], int]:
+    """
+    Read a field's arguments starting at "(", returning the first/last value and the index after ")".
+    """
+
+    size = None
+    depth = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("(", "[", "{"):
+            depth += 1
+        elif token in (")", "]", "}"):
+            depth -= 1
+            if depth == 0:
+                return size, i + 1
+        elif depth == 1 and token in ("first", "last") and i + 2 < len(tokens) and tokens[i + 1] == ":":
+            value = tokens[i + 2]
+            if value.startswith("$"):
+                value = variables.get(value[1:])
+            try:
+                size = int(value)
+            except (TypeError, ValueError):
+                pass
+        i += 1
+    return size, i
+
+
+def _skip_directives(tokens: List[str], i: int) -> int:
+    """
+    Skip "@directive(...)" entries.
+    """
+
+    while i < len(tokens) and tokens[i].startswith("@"):
+        i += 1
+        if i < len(tokens) and tokens[i] == "(":
+            _, i = _page_size(tokens, i, {})
+    return i
+
+
+def _fragment_cost(tokens: List[str], i: int, variables: dict) -> Tuple[int, int]:
+    """
+    Cost a fragment starting at "...", returning the cost and the index after it.
+    Spreads of named fragments are unknown and cost nothing, inline fragments cost their selection.
+    """
+
+    i += 1
+    if i < len(tokens) and tokens[i] == "on":
+        i += 2
+    elif i < len(tokens) and tokens[i] != "{" and not tokens[i].startswith("@"):
+        i += 1
+    i = _skip_directives(tokens, i)
+    if i < len(tokens) and tokens[i] == "{":
+        return _selection_cost(tokens, i, variables)
+    return 0, i
+
+
+def _selection_cost(tokens: List[str], i: int, variables: dict) -> Tuple[int, int]:
+    """
+    Cost a selection set starting at "{", returning the cost and the index after "}".
+    """
+
+    cost = 0
+    i += 1
+    while i < len(tokens) and tokens[i] != "}":
+        if tokens[i] == "...":
+            child, i = _fragment_cost(tokens, i, variables)
+            cost += child
+            continue
+
+        name = tokens[i]
+        i += 1
+        if i < len(tokens) and tokens[i] == ":":
+            # Aliased, the field name follows
+            name = tokens[i + 1]
+            i += 2
+
+        size = None
+        if i < len(tokens) and tokens[i] == "(":
+            size, i = _page_size(tokens, i, variables)
+        i = _skip_directives(tokens, i)
+
+        if i < len(tokens) and tokens[i] == "{":
+            child, i = _selection_cost(tokens, i, variables)
+            if size is not None:
+                cost += CONNECTION_COST + size * child
+            elif name in FREE_FIELDS:
+                cost += child
+            else:
+                cost += OBJECT_COST + child
+    return cost, i + 1
+
+
+def static_cost(query: str, variables: Optional[dict] = None) -> int:
+    """
+    Estimate the requested cost of a query from its shape.
+
+    Objects cost 1, connections cost 2 plus their node cost multiplied by
+    the `first`/`last` argument, and scalars are free. Mutations cost 10 as a base.
+    """
+
+    tokens = query_tokens(query)
+    if "{" not in tokens:
+        return 0
+
+    start = tokens.index("{")
+    cost, _ = _selection_cost(tokens, start, variables or {})
+    if tokens[0] == "mutation":
+        cost += MUTATION_COST
+    return cost
+
+
+class CostStats:
+    """
+    Running stats of requested and actual costs for a query fingerprint.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.requested_mean = 0.0
+        self.requested_max = 0.0
+        self.actual_mean = 0.0
+        self.actual_max = 0.0
+
+    def update(self, requested: float, actual: float) -> None:
+        self.count += 1
+        self.requested_mean += (requested - self.requested_mean) / self.count
+        self.actual_mean += (actual - self.actual_mean) / self.count
+        self.requested_max = max(self.requested_max, requested)
+        self.actual_max = max(self.actual_max, actual)
+
+
+class CostBucket:
+    """
+    A shop's GraphQL leaky bucket as last reported by throttleStatus,
+    with reservations deducted for calls about to be sent.
+    """
+
+    def __init__(self, maximum: float, restore_rate: float, now: float):
+        self.maximum = maximum
+        self.restore_rate = restore_rate
+        self.available = maximum
+        self.updated_at = now
+
+    def current(self, now: float) -> float:
+        """
+        Get the points available now, including points restored since the last update.
+        """
+
+        restored = self.restore_rate * max(now - self.updated_at, 0) / 1000
+        return min(self.maximum, self.available + restored)
+
+    def reserve(self, cost: float, now: float) -> Union[bool, float]:
+        """
+        Deduct the cost, returning False if it is available now, else the ms to wait.
+        """
+
+        available = self.current(now)
+        self.available = available - cost
+        self.updated_at = now
+        if available >= cost:
+            return False
+        return (cost - available) / self.restore_rate * 1000
+
+    def release(self, cost: float, now: float) -> None:
+        """
+        Give back a reservation for a call which was not sent.
+        """
+
+        self.available = min(self.maximum, self.current(now) + cost)
+        self.updated_at = now
+
+    def settle(self, throttle_status: dict, now: float) -> None:
+        """
+        Replace the local view with what Shopify reported.
+        """
+
+        self.maximum = float(throttle_status["maximumAvailable"])
+        self.available = float(throttle_status["currentlyAvailable"])
+        self.restore_rate = float(throttle_status["restoreRate"])
+        self.updated_at = now
+
+
+class CostEstimator:
+    """
+    Predicts the cost of GraphQL queries before they are sent, and reserves it
+    against the shop's bucket so limiting happens before a call is throttled.
+
+    Costs are learned per query fingerprint (normalized text and variable shape).
+    Until a fingerprint has been seen, a static estimate from the query is used.
+    """
+
+    def __init__(
+        self,
+        use_static: bool = True,
+        default_cost: float = 50,
+        maximum: float = 1000,
+        restore_rate: float = 50,
+    ):
+        """
+        Args:
+            use_static: Estimate unseen queries from their `first`/`last` arguments.
+            default_cost: Cost to predict for unseen queries when not using static estimates.
+            maximum: Bucket size assumed until Shopify reports one.
+            restore_rate: Points restored per second assumed until Shopify reports one.
+        """
+
+        self.use_static = use_static
+        self.default_cost = default_cost
+        self.maximum = maximum
+        self.restore_rate = restore_rate
+        self.stats: Dict[str, CostStats] = {}
+        self.buckets: Dict[str, CostBucket] = {}
+        self.lock = Lock()
+
+    def bucket(self, session: Session, now: float) -> CostBucket:
+        if session.domain not in self.buckets:
+            self.buckets[session.domain] = CostBucket(self.maximum, self.restore_rate, now)
+        return self.buckets[session.domain]
+
+    def estimate(self, query: str, variables: Optional[dict] = None) -> float:
+        """
+        Predict the requested cost of a query.
+        """
+
+        stats = self.stats.get(fingerprint(query, variables))
+        if stats is not None:
+            return stats.requested_mean
+        if self.use_static:
+            return static_cost(query, variables)
+        return self.default_cost
+
+    def reserve(
+        self,
+        session: Session,
+        query: str,
+        variables: Optional[dict],
+        now: float,
+    ) -> Union[bool, float]:
+        """
+        Reserve the predicted cost, returning False if no limiting is required, else the ms to wait.
+        """
+
+        cost = self.estimate(query, variables)
+        with self.lock:
+            return self.bucket(session, now).reserve(cost, now)
+
+    def release(
+        self,
+        session: Session,
+        query: str,
+        variables: Optional[dict],
+        now: float,
+    ) -> None:
+        """
+        Release the predicted cost reserved for a call which was not sent.
+        """
+
+        cost = self.estimate(query, variables)
+        with self.lock:
+            self.bucket(session, now).release(cost, now)
+
+    def record(
+        self,
+        session: Session,
+        query: str,
+        variables: Optional[dict],
+        body: ParsedBody,
+        now: float,
+    ) -> None:
+        """
+        Learn from the cost extension of a response and settle the shop's bucket,
+        which is settled for throttled responses too.
+        """
+
+        if body is None or "extensions" not in body or "cost" not in body["extensions"]:
+            return
+
+        cost = body["extensions"]["cost"]
+        key = fingerprint(query, variables)
+        with self.lock:
+            if cost.get("actualQueryCost") is not None:
+                # Throttled calls were not run, there is no cost to learn from
+                if key not in self.stats:
+                    self.stats[key] = CostStats()
+                self.stats[key].update(float(cost["requestedQueryCost"]), float(cost["actualQueryCost"]))
+            if "throttleStatus" in cost:
+                self.bucket(session, now).settle(cost["throttleStatus"], now)
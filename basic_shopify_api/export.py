@@ -0,0 +1,335 @@
+"""
+Export a REST resource for many shops to NDJSON files, one per shop.
+
+Shops are sharded over a process pool. Each process paginates its shops concurrently
+with AsyncClient, writing each page as it arrives, so memory stays constant however
+large the export. Each shop has its own limiter, so its rate budget is respected.
+
+Usage:
+    python -m basic_shopify_api export --shops shops.json --resource products --output exports/
+    python -m basic_shopify_api export --shops shops.ndjson --resource orders --param status=any \\
+        --fields id,created_at,total_price --processes 8 --concurrency 20
+
+The shops file is a JSON list, or NDJSON, of {"domain": ..., "key": ..., "password": ...}
+where the password is the access token (public apps only need it).
+"""
+
+from typing import Callable, Dict, List, Optional, TextIO
+from .models import Session
+from .options import Options
+from .constants import DEFAULT_VERSION, DEFAULT_MODE, ALT_MODE
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Time in seconds between progress reports
+PROGRESS_INTERVAL = 1.0
+# Progress updates for the parent process, set in pool workers
+_progress_queue = None
+
+
+class ExportJob:
+    """
+    What to export and how, shared by every worker.
+    """
+
+    def __init__(
+        self,
+        resource: str,
+        output: str,
+        params: Optional[dict] = None,
+        fields: Optional[List[str]] = None,
+        key: Optional[str] = None,
+        limit: int = 250,
+        concurrency: int = 10,
+        version: str = DEFAULT_VERSION,
+        mode: str = DEFAULT_MODE,
+        rest_limit: int = 2,
+    ):
+        """
+        Args:
+            resource: Resource path under /admin/api, example: products, or products/1/variants.
+            output: Directory to write <domain>.ndjson files to.
+            params: Query params for the first page.
+            fields: Fields to request and keep.
+            key: Key of the records in the response body, defaults to the resource's last part.
+            limit: Records per page.
+            concurrency: Shops exported at once, per process.
+            version: API version.
+            mode: public or private.
+            rest_limit: REST calls per second, per shop.
+        """
+
+        self.resource = resource.strip("/").replace(".json", "")
+        self.output = output
+        self.params = params or {}
+        self.fields = fields
+        self.key = key or self.resource.split("/")[-1]
+        self.limit = limit
+        self.concurrency = concurrency
+        self.version = version
+        self.mode = mode
+        self.rest_limit = rest_limit
+
+    @property
+    def path(self) -> str:
+        return f"/admin/api/{self.resource}.json"
+
+    def output_path(self, domain: str) -> str:
+        return os.path.join(self.output, f"{domain}.ndjson")
+
+    def options(self) -> Options:
+        options = Options()
+        options.version = self.version
+        options.mode = self.mode
+        options.rest_limit = self.rest_limit
+        return options
+
+
+def load_sessions(path: str) -> List[Session]:
+    """
+    Read shops from a JSON list, or NDJSON, of {"domain", "key", "password", "secret"}.
+    """
+
+    with open(path, encoding="utf-8") as handle:
+        content = handle.read().strip()
+    if content.startswith("["):
+        entries = json.loads(content)
+    else:
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [Session(**entry) for entry in entries]
+
+
+def shard(sessions: List[Session], shards: int) -> List[List[Session]]:
+    """
+    Split sessions into shards, round-robin, dropping empty ones.
+    """
+
+    return [shard for shard in (sessions[i::shards] for i in range(max(shards, 1))) if shard]
+
+
+async def export_shop(client, job: ExportJob, progress: Optional[Callable[[str, int], None]] = None) -> dict:
+    """
+    Export a shop's records, page by page, to its NDJSON file.
+    The file is written under a ".part" name and renamed once complete.
+    """
+
+    domain = client.session.domain
+    path = job.output_path(domain)
+    partial = f"{path}.part"
+    summary = {"shop": domain, "records": 0, "pages": 0, "error": None}
+    params = {"limit": job.limit, **job.params}
+    with open(partial, "w", encoding="utf-8") as handle:
+        while params is not None:
+            result = await client.rest("get", job.path, params, fields=job.fields)
+            if result.errors is not None or result.body is None:
+                summary["error"] = f"{result.status[0]}: {result.errors}"
+                break
+
+            records = result.body.get(job.key) or []
+            handle.writelines(f"{json.dumps(record, separators=(',', ':'))}\n" for record in records)
+            summary["records"] += len(records)
+            summary["pages"] += 1
+            if progress is not None:
+                progress(domain, len(records))
+            # Only the limit (and fields) may be sent with page_info
+            params = {"limit": job.limit, "page_info": result.link.next} if result.link.next else None
+
+    if summary["error"] is None:
+        os.replace(partial, path)
+    else:
+        os.remove(partial)
+    return summary
+
+
+async def export_shard_async(
+    sessions: List[Session],
+    job: ExportJob,
+    progress: Optional[Callable[[str, int], None]] = None,
+    **client_kwargs
+) -> List[dict]:
+    """
+    Export a shard of shops, up to the job's concurrency at once.
+    """
+
+    from .clients import AsyncClient
+
+    semaphore = asyncio.Semaphore(job.concurrency)
+
+    async def export(session: Session) -> dict:
+        async with semaphore:
+            try:
+                async with AsyncClient(session, job.options(), **client_kwargs) as client:
+                    return await export_shop(client, job, progress)
+            except Exception as e:
+                return {"shop": session.domain, "records": 0, "pages": 0, "error": repr(e)}
+
+    return await asyncio.gather(*[export(session) for session in sessions])
+
+
+def _init_worker(queue) -> None:
+    global _progress_queue
+    _progress_queue = queue
+
+
+def _report_progress(domain: str, records: int) -> None:
+    _progress_queue.put((domain, records))
+
+
+def export_shard(sessions: List[Session], job: ExportJob) -> List[dict]:
+    """
+    Export a shard of shops in a pool worker.
+    """
+
+    return asyncio.run(export_shard_async(sessions, job, _report_progress))
+
+
+class Progress:
+    """
+    Counts records as pages arrive and reports throughput.
+    """
+
+    def __init__(self, shops: int, stream: TextIO):
+        self.shops = shops
+        self.stream = stream
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.records = 0
+        self.pages = 0
+        self.done = 0
+
+    def update(self, domain: str, records: int) -> None:
+        self.records += records
+        self.pages += 1
+        self.report()
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.reported < PROGRESS_INTERVAL:
+            return
+        self.reported = now
+        elapsed = max(now - self.started, 1e-9)
+        self.stream.write(
+            f"\r{self.done}/{self.shops} shops, {self.records:,} records, {self.pages:,} pages, "
+            f"{self.records / elapsed:,.1f} records/s"
+        )
+        self.stream.flush()
+
+
+def run(
+    sessions: List[Session],
+    job: ExportJob,
+    processes: Optional[int] = None,
+    stream: TextIO = sys.stderr,
+    **client_kwargs
+) -> List[dict]:
+    """
+    Export the shops, sharded over a process pool.
+
+    Args:
+        processes: Number of worker processes, defaults to the CPU count. 0 runs in this process.
+        stream: Where to write progress.
+        client_kwargs: Passed to AsyncClient, only when running in this process.
+    """
+
+    os.makedirs(job.output, exist_ok=True)
+    progress = Progress(len(sessions), stream)
+    if processes == 0:
+        results = asyncio.run(export_shard_async(sessions, job, progress.update, **client_kwargs))
+        progress.done = len(results)
+    else:
+        results = _run_pool(sessions, job, processes or os.cpu_count() or 1, progress)
+    progress.report(force=True)
+    stream.write("\n")
+    return results
+
+
+def _run_pool(sessions: List[Session], job: ExportJob, processes: int, progress: Progress) -> List[dict]:
+    # Imported here, only the pool needs them
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from multiprocessing import Queue
+    from queue import Empty
+
+    queue = Queue()
+    shards = shard(sessions, processes)
+    results: List[dict] = []
+    with ProcessPoolExecutor(len(shards), initializer=_init_worker, initargs=(queue,)) as pool:
+        pending = {pool.submit(export_shard, shop_shard, job) for shop_shard in shards}
+        while pending:
+            finished, pending = wait(pending, timeout=PROGRESS_INTERVAL / 4, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results.extend(future.result())
+                progress.done = len(results)
+            try:
+                while True:
+                    progress.update(*queue.get_nowait())
+            except Empty:
+                pass
+    return results
+
+
+def params_from(values: List[str]) -> Dict[str, str]:
+    """
+    Parse "key=value" params.
+    """
+
+    params = {}
+    for value in values:
+        key, _, param = value.partition("=")
+        params[key] = param
+    return params
+
+
+def configure(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the export command's arguments.
+    """
+
+    parser.add_argument("--shops", required=True, help="JSON list, or NDJSON, of shop sessions")
+    parser.add_argument("--resource", required=True, help="Resource to export, example: products")
+    parser.add_argument("--output", default="exports", help="Directory for the <domain>.ndjson files")
+    parser.add_argument("--param", action="append", default=[], help="Query param for the first page, key=value")
+    parser.add_argument("--fields", help="Comma separated fields to request and keep")
+    parser.add_argument("--key", help="Key of the records in the response body, defaults to the resource")
+    parser.add_argument("--limit", type=int, default=250, help="Records per page")
+    parser.add_argument("--processes", type=int, help="Worker processes, defaults to the CPU count")
+    parser.add_argument("--concurrency", type=int, default=10, help="Shops exported at once, per process")
+    parser.add_argument("--version", default=DEFAULT_VERSION, help="API version")
+    parser.add_argument("--mode", choices=(DEFAULT_MODE, ALT_MODE), default=DEFAULT_MODE, help="API mode")
+    parser.add_argument("--rest-limit", type=int, default=2, help="REST calls per second, per shop")
+    parser.set_defaults(command=command)
+
+
+def command(args: argparse.Namespace) -> int:
+    """
+    Run the export command, returning the exit code.
+    """
+
+    job = ExportJob(
+        args.resource,
+        args.output,
+        params=params_from(args.param),
+        fields=args.fields.split(",") if args.fields else None,
+        key=args.key,
+        limit=args.limit,
+        concurrency=args.concurrency,
+        version=args.version,
+        mode=args.mode,
+        rest_limit=args.rest_limit,
+    )
+    started = time.monotonic()
+    results = run(load_sessions(args.shops), job, args.processes)
+    elapsed = time.monotonic() - started
+
+    failed = [result for result in results if result["error"] is not None]
+    records = sum(result["records"] for result in results)
+    for result in failed:
+        sys.stderr.write(f"{result['shop']}: {result['error']}\n")
+    sys.stderr.write(
+        f"Exported {records:,} records from {len(results) - len(failed)}/{len(results)} shops "
+        f"in {elapsed:.1f}s ({records / max(elapsed, 1e-9):,.1f} records/s)\n"
+    )
+    return 1 if failed else 0
@@ -0,0 +1,134 @@
+from collections import deque
+from threading import Lock
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from .utils import perf_time
+import asyncio
+import re
+
+# IDs in a path, replaced to group calls by path template
+ID_PATTERN = re.compile(r"/\d+(?=[/.]|$)")
+
+
+def path_template(path: str) -> str:
+    """
+    Get the template of a path, example: /admin/api/2020-04/products/1.json is /admin/api/2020-04/products/{id}.json
+    """
+
+    return ID_PATTERN.sub("/{id}", path)
+
+
+class Hedger:
+    """
+    Hedges REST GET calls (AsyncClient): if a call has not answered within a percentile
+    of recent latencies for its path template, a second copy is sent. The first response
+    wins, and the other call is cancelled.
+
+    A hedge is only sent while the shop's REST rate budget has room for it, and it uses
+    that room up, so hedging never causes rate limiting.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        samples: int = 200,
+        min_samples: int = 20,
+        min_delay: float = 5,
+        clock=perf_time,
+    ):
+        """
+        Args:
+            percentile: Percentile of latency, per path template, to wait for before hedging.
+            samples: Number of recent latencies kept, per path template.
+            min_samples: Number of latencies needed before a path template is hedged.
+            min_delay: Lowest time in ms waited before hedging.
+            clock: Callable returning a monotonic time in ms.
+        """
+
+        if not 0 < percentile < 100:
+            raise ValueError(f"Percentile: {percentile} must be between 0 and 100")
+
+        self.percentile = percentile
+        self.samples = samples
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.clock = clock
+        self.lock = Lock()
+        # Recent latencies in ms, by path template
+        self.latencies: Dict[str, Deque[float]] = {}
+        # Number of calls, hedges sent, and hedges which answered first
+        self.calls = 0
+        self.hedged = 0
+        self.won = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"calls": self.calls, "hedged": self.hedged, "won": self.won}
+
+    def observe(self, template: str, latency: float) -> None:
+        """
+        Record the latency of a call for a path template.
+        """
+
+        with self.lock:
+            latencies = self.latencies.get(template)
+            if latencies is None:
+                latencies = self.latencies[template] = deque(maxlen=self.samples)
+            latencies.append(latency)
+
+    def delay(self, template: str) -> Optional[float]:
+        """
+        Get the time in ms to wait before hedging a call for a path template,
+        or None if there are not enough latencies yet.
+        """
+
+        with self.lock:
+            latencies = self.latencies.get(template)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    async def run(self, template: str, send: Callable[[], Awaitable], spare: Callable[[], bool]):
+        """
+        Send a call, hedging it if it is slow and spare() allows it.
+
+        Args:
+            template: Path template of the call.
+            send: Sends a copy of the call.
+            spare: Determines if the budget has room for a hedge, and takes it if so.
+        """
+
+        self.calls += 1
+        delay = self.delay(template)
+        started = self.clock()
+        primary = asyncio.ensure_future(send())
+        tasks = {primary: started}
+        try:
+            if delay is not None:
+                await asyncio.wait([primary], timeout=delay / 1000)
+                if not primary.done() and spare():
+                    self.hedged += 1
+                    tasks[asyncio.ensure_future(send())] = self.clock()
+            winner = await self._first(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.observe(template, self.clock() - tasks[winner])
+        if winner is not primary:
+            self.won += 1
+        return winner.result()
+
+    @staticmethod
+    async def _first(tasks: Dict[asyncio.Future, float]) -> asyncio.Future:
+        """
+        Wait for the first call to answer. A call which failed only wins if they all failed.
+        """
+
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None or not pending:
+                    return task
@@ -0,0 +1,239 @@
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .utils import perf_time
+
+# Bucket upper bounds in ms for phase timings
+PHASE_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# Bucket upper bounds for budget utilisation (used / limit)
+UTILISATION_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+# Phases of a call which are timed
+PHASES = ("queue_wait", "limiter_wait", "slot_wait", "send", "first_byte", "body", "decode", "retry_sleep")
+# Error code returned by GraphQL when the bucket is empty
+THROTTLED_CODE = "THROTTLED"
+
+# Labels of a series, as sorted (name, value) pairs
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Counts of observations per bucket, with their sum.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # Last count is for observations over the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """
+        Get the count of observations less than or equal to each bucket, then the total.
+        """
+
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics:
+    """
+    Records per-call phase timings, budget utilisation per shop,
+    and throttle counts, exporting them in Prometheus text format.
+
+    Timings are recorded in ms and exported in seconds.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "basic_shopify_api",
+        clock: Callable[[], float] = perf_time,
+        phase_buckets: Sequence[float] = PHASE_BUCKETS,
+        utilisation_buckets: Sequence[float] = UTILISATION_BUCKETS,
+    ):
+        """
+        Args:
+            prefix: Prefix of the exported metric names.
+            clock: Callable returning a monotonic time in ms.
+            phase_buckets: Bucket upper bounds in ms for phase timings.
+            utilisation_buckets: Bucket upper bounds for budget utilisation.
+        """
+
+        self.prefix = prefix
+        self.clock = clock
+        self.phase_buckets = phase_buckets
+        self.utilisation_buckets = utilisation_buckets
+        self.lock = Lock()
+        # Phase timings by (phase, api)
+        self.phases: Dict[Labels, Histogram] = {}
+        # Budget utilisation by (shop, api)
+        self.utilisation: Dict[Labels, Histogram] = {}
+        # Counters by name, then labels
+        self.counters: Dict[str, Dict[Labels, int]] = {"requests": {}, "throttled": {}, "retries": {}}
+        # Gauges by name, then labels
+        self.gauges: Dict[str, Dict[Labels, float]] = {"concurrency_limit": {}}
+
+    def observe(self, phase: str, value: float, api: str) -> None:
+        """
+        Record the time in ms spent in a phase of a call.
+        """
+
+        labels = (("api", api), ("phase", phase))
+        with self.lock:
+            histogram = self.phases.get(labels)
+            if histogram is None:
+                histogram = self.phases[labels] = Histogram(self.phase_buckets)
+            histogram.observe(value)
+
+    def utilise(self, shop: str, api: str, ratio: float) -> None:
+        """
+        Record how much of a shop's budget is used (0 to 1).
+        """
+
+        labels = (("api", api), ("shop", shop))
+        with self.lock:
+            histogram = self.utilisation.get(labels)
+            if histogram is None:
+                histogram = self.utilisation[labels] = Histogram(self.utilisation_buckets)
+            histogram.observe(ratio)
+
+    def increment(self, name: str, **labels: str) -> None:
+        """
+        Increment a counter: requests, throttled, or retries.
+        """
+
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counter = self.counters[name]
+            counter[key] = counter.get(key, 0) + 1
+
+    def count(self, name: str, **labels: str) -> int:
+        """
+        Get the total of a counter, for the series matching the labels.
+        """
+
+        return sum(
+            value for key, value in self.counters[name].items()
+            if all(item in key for item in labels.items())
+        )
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """
+        Set a gauge: concurrency_limit.
+        """
+
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges[name][key] = value
+
+    def gauge(self, name: str, **labels: str) -> Optional[float]:
+        """
+        Get the value of a gauge, for the series with the labels.
+        """
+
+        return self.gauges[name].get(tuple(sorted(labels.items())))
+
+    def histogram(self, phase: str, api: str) -> Histogram:
+        """
+        Get the histogram of a phase.
+        """
+
+        return self.phases.get((("api", api), ("phase", phase)), Histogram(self.phase_buckets))
+
+    def export(self) -> str:
+        """
+        Export all metrics in Prometheus text format.
+        """
+
+        with self.lock:
+            lines = []
+            self._export_histograms(
+                lines,
+                "call_phase_seconds",
+                "Time spent in each phase of an API call.",
+                self.phases,
+                1000,
+            )
+            self._export_histograms(
+                lines,
+                "budget_utilisation",
+                "Share of the shop's rate/cost budget in use when a call is made.",
+                self.utilisation,
+                1,
+            )
+            helps = {
+                "requests": "API calls made, by status.",
+                "throttled": "API calls throttled (429 or THROTTLED).",
+                "retries": "API calls retried.",
+            }
+            for name, counter in self.counters.items():
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# HELP {metric} {helps[name]}")
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in sorted(counter.items()):
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+            helps = {"concurrency_limit": "Adaptive limit of calls in flight for the shop."}
+            for name, gauge in self.gauges.items():
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {metric} {helps[name]}")
+                lines.append(f"# TYPE {metric} gauge")
+                for labels, value in sorted(gauge.items()):
+                    lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _export_histograms(
+        self,
+        lines: List[str],
+        name: str,
+        help_text: str,
+        histograms: Dict[Labels, Histogram],
+        scale: float,
+    ) -> None:
+        metric = f"{self.prefix}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, histogram in sorted(histograms.items()):
+            counts = histogram.cumulative()
+            for bound, count in zip([*histogram.buckets, None], counts):
+                le = "+Inf" if bound is None else _number(bound / scale)
+                lines.append(f"{metric}_bucket{_labels((*labels, ('le', le)))} {count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {_number(histogram.sum / scale)}")
+            lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+
+
+def _number(value: float) -> str:
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def throttled(status: int, errors) -> bool:
+    """
+    Determine if a call was throttled: a 429, or a GraphQL THROTTLED error.
+    """
+
+    if status == 429:
+        return True
+    if not isinstance(errors, list):
+        return False
+    return any(
+        isinstance(error, dict) and error.get("extensions", {}).get("code") == THROTTLED_CODE
+        for error in errors
+    )
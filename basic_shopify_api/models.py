@@ -30,12 +30,14 @@ class ApiResult:
         body: ParsedBody,
         errors: ParsedError,
         retries: int = 0,
+        cached: bool = False,
     ):
         self.response = response
         self.status = status,
         self.body = body
         self.errors = errors
         self.retries = retries
+        self.cached = cached
 
 
 class RestResult(ApiResult):
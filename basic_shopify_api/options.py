@@ -2,11 +2,72 @@ from http import HTTPStatus
 from .store import TimeMemoryStore, CostMemoryStore
 from .deferrer import SleepDeferrer
 from .constants import DEFAULT_VERSION, DEFAULT_MODE, ALT_MODE, VERSION_PATTERN
+from typing import Any
 import re
 
 
+class Headers(dict):
+    """
+    Headers which bump the revision of their options when changed,
+    so clients know when to rebuild their request template.
+    """
+
+    def __init__(self, options: "Options", *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Options the headers belong to
+        self._options = options
+
+    def _changed(self) -> None:
+        """
+        Count a change against the options.
+        """
+
+        self._options.revision += 1
+
+    def __reduce__(self):
+        # Copies and pickles are plain dicts, detached from the options
+        return dict, (dict(self),)
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs) -> None:
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def clear(self) -> None:
+        super().clear()
+        self._changed()
+
+
 class Options(object):
     def __init__(self):
+        # Number of changes made, bumped on every assignment
+        self.revision = 0
         # Number of retries that should happen if failed
         self.max_retries = 2
         # Retry if status is 422, 5xx
@@ -39,11 +100,58 @@ class Options(object):
         self.graphql_pre_actions = []
         # Methods to run after firing GraphQL API calls
         self.graphql_post_actions = []
+        # Response cache for REST GET calls (ResponseCache), None to disable
+        self.rest_cache = None
+        # Result cache for GraphQL queries (GraphQLCache), None to disable
+        self.graphql_cache = None
+        # Coalescing of identical in-flight REST GET and GraphQL query calls (Coalescer), None to disable
+        self.coalescer = None
+        # Preflight cost estimation and reservation for GraphQL (CostEstimator), None to disable
+        self.cost_estimator = None
+        # Splitting of GraphQL queries over the single query max cost (QuerySplitter), None to disable
+        self.query_splitter = None
+        # Phase timings, budget utilisation, and throttle counts (Metrics), None to disable
+        self.metrics = None
+        # Ordering of calls waiting for a shop's budget by priority (PriorityScheduler), None to disable
+        self.scheduler = None
+        # Process-wide concurrency cap shared fairly between shops (FairScheduler), None to disable
+        self.fair_scheduler = None
+        # Per-shop limit of calls in flight, adapted to congestion (AdaptiveConcurrency), None to disable
+        self.concurrency = None
+        # Hedging of slow REST GET calls, AsyncClient only (Hedger), None to disable
+        self.hedger = None
         # Version to use for API calls
         self._version = DEFAULT_VERSION
         # Mode to use... public or private
         self._mode = DEFAULT_MODE
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        """
+        Keep headers change-counted and bump the revision on every assignment.
+        """
+
+        if name == "headers" and not (isinstance(value, Headers) and value._options is self):
+            value = Headers(self, value)
+        super().__setattr__(name, value)
+        if name != "revision":
+            # Tolerates options made without __init__ (example: by copy or pickle)
+            super().__setattr__("revision", self.__dict__.get("revision", 0) + 1)
+
+    def __getstate__(self) -> dict:
+        """
+        State for copying and pickling, with plain headers.
+        """
+
+        return {**self.__dict__, "headers": dict(self.headers)}
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restore state from copying and pickling, with headers tracked by the new options.
+        """
+
+        self.__dict__.update(state)
+        self.__dict__["headers"] = Headers(self, state["headers"])
+
     @property
     def version(self) -> str:
         return self._version
@@ -0,0 +1,172 @@
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+from .models import Session
+from .options import Options
+import atexit
+import json
+import logging
+import os
+import time
+
+# Version of the snapshot file format
+SNAPSHOT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class LimiterSnapshot:
+    """
+    Saves limiter state to a local file, and restores it on startup, so a restarted
+    worker does not fire at full speed into shops whose buckets are nearly full.
+
+    Saved are the request times and costs of the time/cost stores, and the GraphQL
+    buckets of the cost estimator (the last throttleStatus, with reservations). Times
+    are saved as ages, and on restore are moved back by the time passed since the save,
+    so request windows expire and buckets restore as if the worker had kept running.
+    """
+
+    def __init__(self, path: str, options: Options, interval: float = 30, wall_clock=time.time):
+        """
+        Args:
+            path: File to save to, written atomically.
+            options: Options holding the stores and cost estimator to save and restore.
+            interval: Time in seconds between periodic saves.
+            wall_clock: Callable returning the wall time in seconds, to measure the time passed between runs.
+        """
+
+        self.path = path
+        self.options = options
+        self.interval = interval
+        self.wall_clock = wall_clock
+        self.lock = Lock()
+        # Set to stop periodic saves
+        self.stopped = Event()
+        self.thread: Optional[Thread] = None
+
+    def snapshot(self) -> dict:
+        """
+        Get the limiter state, with times as ages in ms.
+        """
+
+        now = self.options.deferrer.current_time()
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": self.wall_clock(),
+            "times": _ages(self.options.time_store.container, now),
+            "costs": {
+                domain: list(costs) for domain, costs in list(self.options.cost_store.container.items()) if costs
+            },
+            "buckets": {},
+        }
+        estimator = self.options.cost_estimator
+        if estimator is not None:
+            with estimator.lock:
+                state["buckets"] = {
+                    domain: [bucket.maximum, bucket.available, bucket.restore_rate, now - bucket.updated_at]
+                    for domain, bucket in list(estimator.buckets.items())
+                }
+        return state
+
+    def restore(self, state: dict) -> None:
+        """
+        Restore the limiter state, moving times back by the time passed since it was saved.
+        """
+
+        if state.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version: {state.get('version')} is not {SNAPSHOT_VERSION}")
+
+        now = self.options.deferrer.current_time()
+        passed = max(self.wall_clock() - state["saved_at"], 0) * 1000
+        for domain, ages in state["times"].items():
+            session = Session(domain)
+            self.options.time_store.reset(session)
+            for age in ages:
+                self.options.time_store.append(session, now - age - passed)
+        for domain, costs in state["costs"].items():
+            session = Session(domain)
+            self.options.cost_store.reset(session)
+            for cost in costs:
+                self.options.cost_store.append(session, cost)
+
+        estimator = self.options.cost_estimator
+        if estimator is not None:
+            with estimator.lock:
+                for domain, (maximum, available, restore_rate, age) in state["buckets"].items():
+                    bucket = estimator.bucket(Session(domain), now)
+                    bucket.maximum = maximum
+                    bucket.available = available
+                    bucket.restore_rate = restore_rate
+                    bucket.updated_at = now - age - passed
+
+    def save(self) -> None:
+        """
+        Write the limiter state to the file.
+        """
+
+        with self.lock:
+            partial = f"{self.path}.part"
+            with open(partial, "w", encoding="utf-8") as handle:
+                json.dump(self.snapshot(), handle, separators=(",", ":"))
+            os.replace(partial, self.path)
+
+    def load(self) -> bool:
+        """
+        Restore the limiter state from the file, returning if it was restored.
+        A missing or unreadable file is ignored, starting with empty state.
+        """
+
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                state = json.load(handle)
+            self.restore(state)
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def start(self, at_exit: bool = True) -> None:
+        """
+        Restore the limiter state, and save it periodically in a background thread.
+
+        Args:
+            at_exit: Also save when the interpreter exits.
+        """
+
+        self.load()
+        self.stopped.clear()
+        self.thread = Thread(target=self._run, name="limiter-snapshot", daemon=True)
+        self.thread.start()
+        if at_exit:
+            atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Stop periodic saves, and save one last time.
+        """
+
+        atexit.unregister(self.stop)
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        self.save()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.save()
+            except Exception:
+                # Keep saving periodically, the next save may succeed (example: disk space freed)
+                logger.exception("Saving limiter snapshot to %s failed", self.path)
+
+    def __enter__(self) -> "LimiterSnapshot":
+        self.start(at_exit=False)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _ages(container: Dict[str, List[float]], now: float) -> Dict[str, List[float]]:
+    # Times as ages in ms, shops without times are left out
+    # (copied first, client threads add shops and times while saving)
+    return {domain: [now - value for value in list(values)] for domain, values in list(container.items()) if values}
@@ -0,0 +1,393 @@
+from abc import ABC, abstractmethod
+from threading import Lock, Event
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Union
+from .utils import perf_time
+from .deadline import Deadline, DeadlineExceeded
+import asyncio
+import heapq
+
+# Priority classes, lower goes first
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+PRIORITIES = {"interactive": INTERACTIVE, "default": DEFAULT, "background": BACKGROUND}
+
+
+def priority_class(priority: Union[None, int, str]) -> int:
+    """
+    Resolve a priority name or number to its class, None is the default class.
+    """
+
+    if priority is None:
+        return DEFAULT
+    if isinstance(priority, str):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priority: {priority} is not one of {', '.join(PRIORITIES)}")
+        return PRIORITIES[priority]
+    return int(priority)
+
+
+class _Waiter:
+    """
+    A caller waiting for its turn, woken by an event (threads) or a future (coroutines).
+    """
+
+    def __init__(self, priority: int, event: Optional[Event] = None, future: Optional[asyncio.Future] = None):
+        self.priority = priority
+        self.event = event
+        self.future = future
+        self.cancelled = False
+        # Set once handed the turn
+        self.admitted = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            loop = self.future.get_loop()
+            loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _Scheduler(ABC):
+    """
+    Shared waiting for schedulers: waiters are queued per key in a heap, ordered by priority with ageing.
+    """
+
+    def __init__(self, ageing: float = 2000, clock=perf_time):
+        """
+        Args:
+            ageing: Time in ms a waiter waits to move up one priority class.
+            clock: Callable returning a monotonic time in ms.
+        """
+
+        self.ageing = ageing
+        self.clock = clock
+        self.lock = Lock()
+        # Waiters by key
+        self.queues: Dict[str, List[tuple]] = {}
+        # Sequence of waiters, keeps equal deadlines first in, first out
+        self.sequence = 0
+
+    @property
+    def waiting(self) -> int:
+        with self.lock:
+            return sum(1 for queue in self.queues.values() for entry in queue if not entry[2].cancelled)
+
+    def _push(self, key: str, waiter: _Waiter) -> None:
+        # Comparing priority - waited / ageing between waiters does not depend on the
+        # current time, so waiters can be ordered once by when their class would be reached
+        self.sequence += 1
+        deadline = self.clock() + waiter.priority * self.ageing
+        heapq.heappush(self.queues.setdefault(key, []), (deadline, self.sequence, waiter))
+
+    def _pop(self, key: str) -> Optional[_Waiter]:
+        # Next waiter for the key which was not cancelled, the key's queue is removed once empty
+        queue = self.queues.get(key)
+        while queue:
+            _, _, waiter = heapq.heappop(queue)
+            if not waiter.cancelled:
+                if not queue:
+                    del self.queues[key]
+                return waiter
+        self.queues.pop(key, None)
+        return None
+
+    @abstractmethod
+    def _enter(self, key: str, waiter: _Waiter) -> bool:
+        """
+        Take a turn if free, else queue the waiter. Returns if the turn was taken.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def release(self, key: str) -> None:
+        """
+        End a turn for the key, handing it to the next waiter.
+        """
+
+        pass  # pragma: no cover
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Stop waiting after a timeout, unless handed the turn meanwhile. Returns if the turn was taken.
+        """
+
+        with self.lock:
+            waiter.cancelled = not waiter.admitted
+            return waiter.admitted
+
+    def acquire(self, key: str, priority: Union[None, int, str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a turn for the key (sync), for up to timeout ms if given. Returns if the turn was taken.
+        """
+
+        waiter = _Waiter(priority_class(priority), event=Event())
+        if self._enter(key, waiter):
+            return True
+        if waiter.event.wait(None if timeout is None else timeout / 1000):
+            return True
+        return self._abandon(waiter)
+
+    async def aacquire(
+        self,
+        key: str,
+        priority: Union[None, int, str] = None,
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """
+        Wait for a turn for the key (async), for up to timeout ms if given. Returns if the turn was taken.
+        """
+
+        waiter = _Waiter(priority_class(priority), future=asyncio.get_running_loop().create_future())
+        if self._enter(key, waiter):
+            return True
+        try:
+            if timeout is None:
+                await waiter.future
+                return True
+            # Unlike wait_for, does not cancel the future on timeout
+            done, _ = await asyncio.wait({waiter.future}, timeout=timeout / 1000)
+        except asyncio.CancelledError:
+            with self.lock:
+                waiter.cancelled = True
+            if waiter.admitted:
+                # Handed the turn while being cancelled, pass it on
+                self.release(key)
+            raise
+        return bool(done) or self._abandon(waiter)
+
+    def slot(self, key: str, priority: Union[None, int, str] = None) -> "Slot":
+        return Slot(self, key, priority)
+
+
+class PriorityScheduler(_Scheduler):
+    """
+    Orders callers waiting for a shop's rate/cost budget by priority.
+
+    Callers go through the limiter one at a time per shop and API, the waiter with the
+    best priority goes next. Waiting improves a caller's priority by one class every
+    `ageing` ms, so background work is delayed by interactive work but not starved.
+    """
+
+    def __init__(self, ageing: float = 2000, clock=perf_time):
+        """
+        Args:
+            ageing: Time in ms a waiter waits to move up one priority class.
+            clock: Callable returning a monotonic time in ms.
+        """
+
+        super().__init__(ageing, clock)
+        # Keys with a caller taking its turn
+        self.busy: Set[str] = set()
+        # Number of callers let through, by priority class
+        self.admitted: Dict[int, int] = {}
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "admitted": dict(self.admitted),
+            "waiting": self.waiting,
+        }
+
+    def _admit(self, key: str, waiter: _Waiter) -> None:
+        self.busy.add(key)
+        self.admitted[waiter.priority] = self.admitted.get(waiter.priority, 0) + 1
+        waiter.admitted = True
+
+    def _enter(self, key: str, waiter: _Waiter) -> bool:
+        with self.lock:
+            if key not in self.busy and key not in self.queues:
+                self._admit(key, waiter)
+                return True
+            self._push(key, waiter)
+            return False
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            self.busy.discard(key)
+            waiter = self._pop(key)
+            if waiter is not None:
+                self._admit(key, waiter)
+                waiter.wake()
+
+
+class FairScheduler(_Scheduler):
+    """
+    Shares a process-wide cap on concurrent calls between shops, by deficit round-robin.
+
+    Shops with waiting calls take turns: each turn, a shop's deficit is topped up by its
+    weight, and it sends a call for each whole point. A shop with weight 2 sends two calls
+    for every one sent by a shop with weight 1, and a shop with a huge backlog can not hold
+    every slot while small shops wait. Slots are never left idle while calls are waiting.
+    Within a shop, calls are ordered by priority with ageing.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 10,
+        weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1,
+        ageing: float = 2000,
+        clock=perf_time,
+    ):
+        """
+        Args:
+            max_concurrency: Number of calls allowed in flight at once, across all shops.
+            weights: Weight by shop domain, shops not listed get the default weight.
+            default_weight: Weight of shops not listed.
+            ageing: Time in ms a waiter waits to move up one priority class, within its shop.
+            clock: Callable returning a monotonic time in ms.
+        """
+
+        super().__init__(ageing, clock)
+        self.max_concurrency = max_concurrency
+        self.weights: Dict[str, float] = {}
+        for key, weight in (weights or {}).items():
+            self.set_weight(key, weight)
+        self.default_weight = self._check_weight(default_weight)
+        # Number of calls in flight, in total and by shop
+        self.inflight = 0
+        self.running: Dict[str, int] = {}
+        # Shops with waiters in round-robin order, and their deficit
+        self.rounds: Deque[str] = deque()
+        self.deficits: Dict[str, float] = {}
+        # Number of calls let through, by shop
+        self.admitted: Dict[str, int] = {}
+
+    @staticmethod
+    def _check_weight(weight: float) -> float:
+        if weight <= 0:
+            raise ValueError(f"Weight: {weight} must be above 0")
+        return weight
+
+    def set_weight(self, key: str, weight: float) -> None:
+        """
+        Set a shop's weight.
+        """
+
+        self.weights[key] = self._check_weight(weight)
+
+    def weight(self, key: str) -> float:
+        return self.weights.get(key, self.default_weight)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "shops_waiting": len(self.rounds),
+            "admitted": dict(self.admitted),
+        }
+
+    def _admit(self, key: str, waiter: _Waiter) -> None:
+        self.inflight += 1
+        self.running[key] = self.running.get(key, 0) + 1
+        self.admitted[key] = self.admitted.get(key, 0) + 1
+        waiter.admitted = True
+
+    def _dispatch(self) -> None:
+        """
+        Hand free slots to waiters, in deficit round-robin order.
+        """
+
+        while self.inflight < self.max_concurrency and self.rounds:
+            key = self.rounds[0]
+            if self.deficits.get(key, 0) < 1:
+                # Start of the shop's turn
+                self.deficits[key] = self.deficits.get(key, 0) + self.weight(key)
+                if self.deficits[key] < 1:
+                    self.rounds.rotate(-1)
+                    continue
+
+            waiter = self._pop(key)
+            if waiter is not None:
+                self.deficits[key] -= 1
+                self._admit(key, waiter)
+                waiter.wake()
+            if key not in self.queues:
+                # Nothing left waiting, the shop leaves the rounds and its deficit is dropped
+                self.rounds.popleft()
+                del self.deficits[key]
+            elif self.deficits[key] < 1:
+                # End of the shop's turn
+                self.rounds.rotate(-1)
+
+    def _enter(self, key: str, waiter: _Waiter) -> bool:
+        with self.lock:
+            if self.inflight < self.max_concurrency and not self.rounds:
+                self._admit(key, waiter)
+                return True
+            if key not in self.queues:
+                self.rounds.append(key)
+            self._push(key, waiter)
+            self._dispatch()
+            return waiter.admitted
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            self.inflight -= 1
+            self.running[key] -= 1
+            if self.running[key] == 0:
+                del self.running[key]
+            self._dispatch()
+
+
+class Slot:
+    """
+    Context manager holding a turn for the key, usable with "with" and "async with".
+    Without a scheduler, it does nothing.
+    With a deadline, waiting for the turn is bounded by the time left.
+    """
+
+    def __init__(
+        self,
+        scheduler: Optional[_Scheduler],
+        key: str,
+        priority: Union[None, int, str] = None,
+        deadline: Optional[Deadline] = None,
+        phase: str = "queue_wait",
+    ):
+        """
+        Args:
+            deadline: Deadline of the call, DeadlineExceeded is raised for the phase if it passes while waiting.
+            phase: Name of the wait, for DeadlineExceeded.
+        """
+
+        self.scheduler = scheduler
+        self.key = key
+        self.priority = priority
+        self.deadline = deadline
+        self.phase = phase
+
+    def _timeout(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline.remaining()
+
+    def _taken(self, taken: bool, timeout: Optional[float]) -> None:
+        if not taken:
+            raise DeadlineExceeded(self.phase, timeout, 0)
+
+    def __enter__(self) -> "Slot":
+        if self.scheduler is not None:
+            timeout = self._timeout()
+            self._taken(self.scheduler.acquire(self.key, self.priority, timeout), timeout)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.scheduler is not None:
+            self.scheduler.release(self.key)
+
+    async def __aenter__(self) -> "Slot":
+        if self.scheduler is not None:
+            timeout = self._timeout()
+            self._taken(await self.scheduler.aacquire(self.key, self.priority, timeout), timeout)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self.scheduler is not None:
+            self.scheduler.release(self.key)
@@ -0,0 +1,439 @@
+from copy import deepcopy
+from typing import List, Optional, Tuple, Dict
+from .models import ApiResult
+from .estimator import static_cost
+from .utils import query_tokens, closing_index
+import json
+
+# Error code returned when a query is over the single query max cost
+MAX_COST_ERROR = "MAX_COST_EXCEEDED"
+
+# Error code for a split query whose reduced nested connections had more nodes
+TRUNCATED_ERROR = "SPLIT_TRUNCATED"
+
+
+def max_cost_exceeded(result: ApiResult) -> Optional[Tuple[float, float]]:
+    """
+    Find a MAX_COST_EXCEEDED error in a result, returning the query's cost and the max cost.
+    """
+
+    if not isinstance(result.errors, list):
+        return None
+    for error in result.errors:
+        extensions = error.get("extensions", {}) if isinstance(error, dict) else {}
+        if extensions.get("code") == MAX_COST_ERROR:
+            return float(extensions["cost"]), float(extensions["maxCost"])
+    return None
+
+
+class Connection:
+    """
+    A connection field in a query, sized by `first` or `last`.
+    """
+
+    def __init__(
+        self,
+        path: List[str],
+        direction: str,
+        size: int,
+        size_index: int,
+        variable: Optional[str],
+        args_close: int,
+        cursor_index: Optional[int],
+        selection_open: int,
+    ):
+        # Response keys from the root to this connection
+        self.path = path
+        # "first" or "last"
+        self.direction = direction
+        self.size = size
+        # Token index of the size value, and the variable name if the size is a variable
+        self.size_index = size_index
+        self.variable = variable
+        # Token index of the closing ")" of the arguments
+        self.args_close = args_close
+        # Token index of an existing after/before value
+        self.cursor_index = cursor_index
+        # Token index of the opening "{" of the selection
+        self.selection_open = selection_open
+
+    @property
+    def depth(self) -> int:
+        return len(self.path)
+
+    @property
+    def cursor_arg(self) -> str:
+        return "after" if self.direction == "first" else "before"
+
+    @property
+    def page_info(self) -> Tuple[str, str]:
+        return ("hasNextPage", "endCursor") if self.direction == "first" else ("hasPreviousPage", "startCursor")
+
+
+def _arguments(tokens: List[str], start: int, end: int, variables: dict) -> dict:
+    """
+    Read the size and cursor arguments between "(" at start and ")" at end.
+    """
+
+    found = {}
+    depth = 0
+    for i in range(start, end):
+        if tokens[i] in ("(", "[", "{"):
+            depth += 1
+        elif tokens[i] in (")", "]", "}"):
+            depth -= 1
+        elif depth == 1 and tokens[i + 1] == ":" and tokens[i] in ("first", "last", "after", "before"):
+            value = tokens[i + 2]
+            variable = value[1:] if value.startswith("$") else None
+            found[tokens[i]] = (i + 2, variable, variables.get(variable) if variable else value)
+    return found
+
+
+def _skip_directives(tokens: List[str], i: int) -> int:
+    """
+    Skip "@directive(...)" entries.
+    """
+
+    while tokens[i].startswith("@"):
+        i = closing_index(tokens, i + 1) + 1 if tokens[i + 1] == "(" else i + 1
+    return i
+
+
+def _connection(
+    path: List[str],
+    arguments: dict,
+    args_close: Optional[int],
+    selection_open: int,
+) -> Optional[Connection]:
+    """
+    Build a connection from a field's arguments, None if the field is not sized.
+    """
+
+    direction = "first" if "first" in arguments else "last" if "last" in arguments else None
+    if direction is None:
+        return None
+
+    size_index, variable, size = arguments[direction]
+    cursor = arguments.get("after" if direction == "first" else "before")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return None
+    return Connection(
+        path=path,
+        direction=direction,
+        size=size,
+        size_index=size_index,
+        variable=variable,
+        args_close=args_close,
+        cursor_index=cursor[0] if cursor else None,
+        selection_open=selection_open,
+    )
+
+
+def _connections(
+    tokens: List[str],
+    i: int,
+    path: List[str],
+    variables: dict,
+    found: List[Connection],
+) -> int:
+    """
+    Collect connections in the selection starting at "{", returning the index after "}".
+    """
+
+    i += 1
+    while i < len(tokens) and tokens[i] != "}":
+        if tokens[i] == "...":
+            # Inline fragments share the path, named spreads are skipped
+            i += 1
+            if tokens[i] == "on":
+                i += 2
+            elif tokens[i] != "{" and not tokens[i].startswith("@"):
+                i += 1
+            i = _skip_directives(tokens, i)
+            if tokens[i] == "{":
+                i = _connections(tokens, i, path, variables, found)
+            continue
+
+        key = tokens[i]
+        i += 1
+        if tokens[i] == ":":
+            i += 2
+
+        arguments = {}
+        args_close = None
+        if tokens[i] == "(":
+            args_close = closing_index(tokens, i)
+            arguments = _arguments(tokens, i, args_close, variables)
+            i = args_close + 1
+        i = _skip_directives(tokens, i)
+
+        if tokens[i] == "{":
+            connection = _connection([*path, key], arguments, args_close, i)
+            if connection is not None:
+                found.append(connection)
+            i = _connections(tokens, i, [*path, key], variables, found)
+    return i + 1
+
+
+class SplitPlan:
+    """
+    How to run a query in pieces: the outermost connection is paged at a size that fits
+    under the max cost (with nested connections reduced if required), and the pages are
+    stitched back into one result.
+
+    Reduced nested connections are not paged. Their pageInfo is requested, and if any
+    had more nodes, the stitched result has a SPLIT_TRUNCATED error alongside the data.
+    """
+
+    def __init__(
+        self,
+        tokens: List[str],
+        variables: dict,
+        connections: List[Connection],
+        sizes: Dict[int, int],
+        top: Connection,
+    ):
+        self.tokens = tokens
+        self.variables = variables
+        self.connections = connections
+        # Size per connection (by size_index)
+        self.sizes = sizes
+        self.top = top
+        # Nested connections asking for fewer nodes than the original query
+        self.reduced = [c for c in connections if c is not top and sizes[c.size_index] < c.size]
+        # Number of nodes the original query asked for
+        self.total = top.size
+        self.collected = 0
+
+    @property
+    def page_size(self) -> int:
+        return self.sizes[self.top.size_index]
+
+    def page(self, cursor: Optional[str] = None) -> Tuple[str, dict]:
+        """
+        Build the query and variables for the next page.
+        """
+
+        sizes = {**self.sizes, self.top.size_index: min(self.page_size, self.total - self.collected)}
+        return render(self.tokens, self.variables, self.connections, sizes, self.top, cursor, self.reduced)
+
+    def _connection(self, body: Optional[dict]) -> Optional[dict]:
+        value = (body or {}).get("data")
+        for key in self.top.path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value if isinstance(value, dict) else None
+
+    @staticmethod
+    def _truncated(body: Optional[dict], connection: Connection) -> bool:
+        """
+        Determine if any instance of a nested connection in a page has more nodes.
+        """
+
+        values = [(body or {}).get("data")]
+        for key in connection.path:
+            found = []
+            for value in values:
+                value = value.get(key) if isinstance(value, dict) else None
+                found.extend(value if isinstance(value, list) else [value])
+            values = found
+        has_more, _ = connection.page_info
+        return any(isinstance(value, dict) and value.get("pageInfo", {}).get(has_more) for value in values)
+
+    def next_cursor(self, body: Optional[dict]) -> Optional[str]:
+        """
+        Count the nodes of a page, returning the cursor for the next page or None if done.
+        """
+
+        connection = self._connection(body)
+        if connection is None:
+            return None
+
+        self.collected += len(connection.get("edges", connection.get("nodes", [])))
+        has_more, cursor_key = self.top.page_info
+        page_info = connection.get("pageInfo", {})
+        if self.collected >= self.total or not page_info.get(has_more):
+            return None
+        return page_info.get(cursor_key)
+
+    def stitch(self, results: List[ApiResult]) -> ApiResult:
+        """
+        Join the pages into one result.
+        """
+
+        last = results[-1]
+        # Pages for "last" are fetched backwards
+        pages = results if self.top.direction == "first" else list(reversed(results))
+        body = deepcopy(pages[0].body)
+        connection = self._connection(body)
+        if connection is None:
+            # A parent of the connection is null, there is nothing to join
+            return results[0]
+        for page in pages[1:]:
+            page_connection = self._connection(page.body) or {}
+            for key in ("edges", "nodes"):
+                if key in connection and key in page_connection:
+                    connection[key].extend(page_connection[key])
+        if "pageInfo" in connection:
+            last_connection = self._connection(last.body) or {}
+            connection["pageInfo"] = {**connection["pageInfo"], **last_connection.get("pageInfo", {})}
+        if last.body is not None and "extensions" in last.body:
+            body["extensions"] = last.body["extensions"]
+
+        errors = None
+        truncated = [
+            ".".join(reduced.path)
+            for reduced in self.reduced
+            if any(self._truncated(page.body, reduced) for page in pages)
+        ]
+        if truncated:
+            # Data is returned, but some nested connections are missing nodes
+            errors = [{
+                "message": f"Query was split, nested connections have more nodes: {', '.join(truncated)}",
+                "extensions": {"code": TRUNCATED_ERROR, "paths": truncated},
+            }]
+
+        return ApiResult(
+            response=last.response,
+            status=last.status[0],
+            body=body,
+            errors=errors,
+            retries=sum(result.retries for result in results),
+        )
+
+
+def render(
+    tokens: List[str],
+    variables: dict,
+    connections: List[Connection],
+    sizes: Dict[int, int],
+    top: Optional[Connection] = None,
+    cursor: Optional[str] = None,
+    reduced: Optional[List[Connection]] = None,
+) -> Tuple[str, dict]:
+    """
+    Rebuild a query with new connection sizes. For the top connection, the cursor
+    is set and its pageInfo is requested. For reduced connections, pageInfo is requested
+    to know if nodes were left out.
+    """
+
+    output = list(tokens)
+    variables = dict(variables)
+    for connection in connections:
+        size = sizes[connection.size_index]
+        if connection.variable is not None:
+            variables[connection.variable] = size
+        else:
+            output[connection.size_index] = str(size)
+
+    if top is not None:
+        has_more, cursor_key = top.page_info
+        output[top.selection_open] = f"{{ pageInfo {{ {has_more} {cursor_key} }}"
+        if cursor is not None:
+            if top.cursor_index is None:
+                output[top.args_close] = f"{top.cursor_arg} : {json.dumps(cursor)} )"
+            elif tokens[top.cursor_index].startswith("$"):
+                variables[tokens[top.cursor_index][1:]] = cursor
+            else:
+                output[top.cursor_index] = json.dumps(cursor)
+    for connection in reduced or []:
+        has_more, _ = connection.page_info
+        output[connection.selection_open] = f"{{ pageInfo {{ {has_more} }}"
+    return " ".join(output), variables
+
+
+class QuerySplitter:
+    """
+    Runs GraphQL queries which are over the single query max cost in pieces.
+    """
+
+    def __init__(self, max_cost: float = 1000, max_pages: int = 100):
+        """
+        Args:
+            max_cost: Shopify's single query max cost, until reported by an error.
+            max_pages: Maximum number of pages to run for one query.
+        """
+
+        self.max_cost = max_cost
+        self.max_pages = max_pages
+        # Number of queries split
+        self.splits = 0
+
+    def plan(
+        self,
+        query: str,
+        variables: Optional[dict],
+        cost: float,
+        max_cost: Optional[float] = None,
+    ) -> Optional[SplitPlan]:
+        """
+        Find the largest page size for the outermost connection which fits under the max cost,
+        reducing nested connections if a page size of 1 does not fit.
+        Returns None if the query can not be split.
+
+        Args:
+            query: The query.
+            variables: The variables for the query.
+            cost: The (reported or predicted) cost of the query.
+            max_cost: The max cost, if reported.
+        """
+
+        max_cost = max_cost or self.max_cost
+        variables = variables or {}
+        tokens = query_tokens(query)
+        if "{" not in tokens:
+            return None
+        connections: List[Connection] = []
+        try:
+            _connections(tokens, tokens.index("{"), [], variables, connections)
+        except IndexError:
+            # Malformed query, let Shopify report it
+            return None
+        if not connections:
+            return None
+
+        # Scale static estimates to what was reported
+        static = static_cost(query, variables)
+        factor = cost / static if static > 0 else 1.0
+        top = min(connections, key=lambda connection: connection.depth)
+        sizes = {connection.size_index: connection.size for connection in connections}
+
+        def fits(candidate: Dict[int, int]) -> bool:
+            return static_cost(*render(tokens, variables, connections, candidate)) * factor <= max_cost
+
+        sizes[top.size_index] = 1
+        if not self._reduce_nested(connections, top, sizes, fits):
+            return None
+
+        # Largest top size that fits
+        low, high = 1, top.size
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits({**sizes, top.size_index: middle}):
+                low = middle
+            else:
+                high = middle - 1
+        sizes[top.size_index] = low
+        if low >= top.size and all(sizes[c.size_index] == c.size for c in connections):
+            # Nothing to reduce
+            return None
+
+        self.splits += 1
+        return SplitPlan(tokens, variables, connections, sizes, top)
+
+    @staticmethod
+    def _reduce_nested(connections: List[Connection], top: Connection, sizes: Dict[int, int], fits) -> bool:
+        """
+        Halve the largest nested connection until the sizes fit, returns False if they never do.
+        """
+
+        while not fits(sizes):
+            nested = [c for c in connections if c is not top and sizes[c.size_index] > 1]
+            if not nested:
+                return False
+            largest = max(nested, key=lambda connection: sizes[connection.size_index])
+            sizes[largest.size_index] //= 2
+        return True
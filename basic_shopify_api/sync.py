@@ -0,0 +1,552 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import inspect
+import json
+import time
+
+
+class SyncError(Exception):
+    """
+    A page of a sync failed.
+    """
+
+    pass
+
+
+class Checkpoint:
+    """
+    Where a shop's sync of a resource is up to.
+    """
+
+    def __init__(
+        self,
+        high_water: Optional[str] = None,
+        cursor: Optional[str] = None,
+        since: Optional[str] = None,
+        run_high_water: Optional[str] = None,
+        started_at: Optional[str] = None,
+    ):
+        """
+        Args:
+            high_water: Where the next run starts from, the start of the last completed run.
+            cursor: Next page of the current run, None when no run is in progress.
+            since: Updated at the current run started from.
+            run_high_water: Latest updated at seen in the current run.
+            started_at: Time the current run started, less the overlap.
+        """
+
+        self.high_water = high_water
+        self.cursor = cursor
+        self.since = since
+        self.run_high_water = run_high_water
+        self.started_at = started_at
+
+    def as_dict(self) -> dict:
+        return {
+            "high_water": self.high_water,
+            "cursor": self.cursor,
+            "since": self.since,
+            "run_high_water": self.run_high_water,
+            "started_at": self.started_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Checkpoint":
+        return cls(**data)
+
+
+def parse_time(value: str) -> datetime:
+    """
+    Parse an ISO 8601 time from REST (with offset) or GraphQL (with Z).
+    """
+
+    return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+
+
+def format_time(timestamp: float) -> str:
+    """
+    Format a Unix timestamp as an ISO 8601 time in UTC (with Z).
+    """
+
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def latest(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    """
+    Get the later of two ISO 8601 times, either may be None.
+    """
+
+    if first is None or second is None:
+        return first or second
+    return first if parse_time(first) >= parse_time(second) else second
+
+
+def record_digest(record: dict) -> str:
+    """
+    Digest a record's content, key order does not matter.
+    """
+
+    content = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class CheckpointStore(ABC):
+    """
+    Stores checkpoints and record digests, by shop and resource.
+    """
+
+    @abstractmethod
+    def load(self, shop: str, resource: str) -> Optional[Checkpoint]:
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def save(self, shop: str, resource: str, checkpoint: Checkpoint, digests: Dict[str, str]) -> None:
+        """
+        Save a checkpoint along with the digests of the records handled since the last save.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def digests(self, shop: str, resource: str, ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Get the stored digests of records, by ID.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def reset(self, shop: str, resource: str, digests: bool = False) -> None:
+        """
+        Forget a checkpoint, so the next sync starts over. Digests are kept unless asked,
+        so records unchanged since they were last handled are still skipped.
+        """
+
+        pass  # pragma: no cover
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    def __init__(self):
+        self.lock = Lock()
+        self.checkpoints: Dict[Tuple[str, str], dict] = {}
+        self.records: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+    def load(self, shop: str, resource: str) -> Optional[Checkpoint]:
+        with self.lock:
+            data = self.checkpoints.get((shop, resource))
+        return None if data is None else Checkpoint.from_dict(data)
+
+    def save(self, shop: str, resource: str, checkpoint: Checkpoint, digests: Dict[str, str]) -> None:
+        with self.lock:
+            self.checkpoints[(shop, resource)] = checkpoint.as_dict()
+            self.records.setdefault((shop, resource), {}).update(digests)
+
+    def digests(self, shop: str, resource: str, ids: Iterable[str]) -> Dict[str, str]:
+        with self.lock:
+            stored = self.records.get((shop, resource), {})
+            return {id: stored[id] for id in ids if id in stored}
+
+    def reset(self, shop: str, resource: str, digests: bool = False) -> None:
+        with self.lock:
+            self.checkpoints.pop((shop, resource), None)
+            if digests:
+                self.records.pop((shop, resource), None)
+
+
+class SqliteCheckpointStore(CheckpointStore):
+    # Number of IDs per digest lookup, under SQLite's variable limit
+    CHUNK = 500
+
+    def __init__(self, path: str):
+        """
+        Store checkpoints and digests in a SQLite database, kept across restarts.
+        """
+
+        # Imported here, only the SQLite store needs it
+        import sqlite3
+
+        self.path = path
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints "
+            "(shop TEXT NOT NULL, resource TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (shop, resource))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS digests (shop TEXT NOT NULL, resource TEXT NOT NULL, id TEXT NOT NULL, "
+            "digest TEXT NOT NULL, PRIMARY KEY (shop, resource, id)) WITHOUT ROWID"
+        )
+
+    def load(self, shop: str, resource: str) -> Optional[Checkpoint]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM checkpoints WHERE shop = ? AND resource = ?",
+                (shop, resource),
+            ).fetchone()
+        return None if row is None else Checkpoint.from_dict(json.loads(row[0]))
+
+    def save(self, shop: str, resource: str, checkpoint: Checkpoint, digests: Dict[str, str]) -> None:
+        with self.lock:
+            # One transaction, so the checkpoint never runs ahead of the digests
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO digests (shop, resource, id, digest) VALUES (?, ?, ?, ?)",
+                    [(shop, resource, id, digest) for id, digest in digests.items()],
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO checkpoints (shop, resource, data) VALUES (?, ?, ?)",
+                    (shop, resource, json.dumps(checkpoint.as_dict())),
+                )
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def digests(self, shop: str, resource: str, ids: Iterable[str]) -> Dict[str, str]:
+        ids = list(ids)
+        found = {}
+        with self.lock:
+            for i in range(0, len(ids), self.CHUNK):
+                chunk = ids[i:i + self.CHUNK]
+                rows = self.connection.execute(
+                    "SELECT id, digest FROM digests WHERE shop = ? AND resource = ? "
+                    f"AND id IN ({', '.join('?' * len(chunk))})",
+                    (shop, resource, *chunk),
+                )
+                found.update(rows)
+        return found
+
+    def reset(self, shop: str, resource: str, digests: bool = False) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM checkpoints WHERE shop = ? AND resource = ?", (shop, resource))
+            if digests:
+                self.connection.execute("DELETE FROM digests WHERE shop = ? AND resource = ?", (shop, resource))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class SyncStats:
+    def __init__(self, resumed: bool = False):
+        # If the run continued from a saved cursor
+        self.resumed = resumed
+        self.pages = 0
+        # Records received, and those skipped as unchanged
+        self.records = 0
+        self.skipped = 0
+
+    @property
+    def changed(self) -> int:
+        return self.records - self.skipped
+
+    def as_dict(self) -> dict:
+        return {
+            "resumed": self.resumed,
+            "pages": self.pages,
+            "records": self.records,
+            "changed": self.changed,
+            "skipped": self.skipped,
+        }
+
+
+class _Sync(ABC):
+    """
+    Incremental sync of a resource: pages records updated since the last run, passes changed
+    records to a handler, and saves a checkpoint after each page so a crashed run resumes.
+
+    Pages are not in updated at order, so a record updated during a run, after its page was
+    fetched, can be older than the latest updated at seen. The next run therefore starts from
+    when this run started (less an overlap for clock skew), and the records seen again are
+    skipped by their digests.
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore,
+        resource: str,
+        id_field: str,
+        updated_field: str,
+        skip_unchanged: bool = True,
+        overlap: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.resource = resource
+        self.id_field = id_field
+        self.updated_field = updated_field
+        self.skip_unchanged = skip_unchanged
+        self.overlap = overlap
+        self.clock = clock
+
+    def _start(self, shop: str) -> Tuple[Checkpoint, SyncStats]:
+        checkpoint = self.store.load(shop, self.resource) or Checkpoint()
+        if checkpoint.cursor is not None:
+            return checkpoint, SyncStats(resumed=True)
+        # New run, from the high-water mark of the last one
+        checkpoint.since = checkpoint.high_water
+        checkpoint.run_high_water = None
+        checkpoint.started_at = format_time(self.clock() - self.overlap)
+        return checkpoint, SyncStats()
+
+    def _failed(self, checkpoint: Checkpoint, result, restarted: bool) -> None:
+        """
+        Handle a failed page: restart the run from its start if the page was from a saved cursor
+        which has expired, else raise.
+        """
+
+        if checkpoint.cursor is None or restarted or not self._expired(result):
+            raise SyncError(f"{result.status[0]}: {result.errors}")
+        checkpoint.cursor = None
+
+    def _expired(self, result) -> bool:
+        """
+        Determine if a failed page was from an expired cursor.
+        """
+
+        return False
+
+    def _changed(self, shop: str, records: List[dict], stats: SyncStats) -> Tuple[List[dict], Dict[str, str]]:
+        """
+        Filter records to those changed since last handled, returning them and their digests.
+        """
+
+        stats.pages += 1
+        stats.records += len(records)
+        ids = [str(record[self.id_field]) for record in records]
+        digests = {id: record_digest(record) for id, record in zip(ids, records)}
+        if not self.skip_unchanged:
+            return records, digests
+
+        stored = self.store.digests(shop, self.resource, digests)
+        changed = [record for id, record in zip(ids, records) if stored.get(id) != digests[id]]
+        stats.skipped += len(records) - len(changed)
+        return changed, {id: digest for id, digest in digests.items() if stored.get(id) != digest}
+
+    def _advance(
+        self,
+        shop: str,
+        checkpoint: Checkpoint,
+        records: List[dict],
+        cursor: Optional[str],
+        digests: Dict[str, str],
+    ) -> bool:
+        """
+        Save the checkpoint after a handled page, returning if the run is complete.
+        """
+
+        for record in records:
+            checkpoint.run_high_water = latest(checkpoint.run_high_water, record.get(self.updated_field))
+        checkpoint.cursor = cursor
+        if cursor is None:
+            # Run complete, the next starts from when this one started
+            if checkpoint.started_at is not None:
+                checkpoint.high_water = checkpoint.started_at
+            else:
+                # Run from a checkpoint saved without a start time
+                checkpoint.high_water = latest(checkpoint.high_water, checkpoint.run_high_water)
+            checkpoint.since = checkpoint.run_high_water = checkpoint.started_at = None
+        self.store.save(shop, self.resource, checkpoint, digests)
+        return cursor is None
+
+    @abstractmethod
+    def _request(self, client, checkpoint: Checkpoint) -> Tuple[str, tuple, dict]:
+        """
+        Get the client method name, args and kwargs for the next page.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def _page(self, result) -> Tuple[List[dict], Optional[str]]:
+        """
+        Get the records of a page and the cursor of the next page.
+        """
+
+        pass  # pragma: no cover
+
+    def run(self, client, handler: Callable[[List[dict]], Any]) -> SyncStats:
+        """
+        Sync with a Client, passing each page's changed records to the handler.
+        """
+
+        shop = client.session.domain
+        checkpoint, stats = self._start(shop)
+        restarted = False
+        while True:
+            name, args, kwargs = self._request(client, checkpoint)
+            result = getattr(client, name)(*args, **kwargs)
+            if result.errors is not None or result.body is None:
+                self._failed(checkpoint, result, restarted)
+                restarted = True
+                continue
+
+            records, cursor = self._page(result)
+            changed, digests = self._changed(shop, records, stats)
+            if changed:
+                handler(changed)
+            if self._advance(shop, checkpoint, records, cursor, digests):
+                return stats
+
+    async def arun(self, client, handler: Callable[[List[dict]], Any]) -> SyncStats:
+        """
+        Sync with an AsyncClient, passing each page's changed records to the handler (sync or async).
+        """
+
+        shop = client.session.domain
+        checkpoint, stats = self._start(shop)
+        restarted = False
+        while True:
+            name, args, kwargs = self._request(client, checkpoint)
+            result = await getattr(client, name)(*args, **kwargs)
+            if result.errors is not None or result.body is None:
+                self._failed(checkpoint, result, restarted)
+                restarted = True
+                continue
+
+            records, cursor = self._page(result)
+            changed, digests = self._changed(shop, records, stats)
+            if changed:
+                handled = handler(changed)
+                if inspect.isawaitable(handled):
+                    await handled
+            if self._advance(shop, checkpoint, records, cursor, digests):
+                return stats
+
+
+class RestSync(_Sync):
+    """
+    Incremental sync of a REST resource, filtered by updated_at_min.
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore,
+        resource: str,
+        params: Optional[dict] = None,
+        key: Optional[str] = None,
+        limit: int = 250,
+        fields: Optional[List[str]] = None,
+        id_field: str = "id",
+        updated_field: str = "updated_at",
+        skip_unchanged: bool = True,
+        overlap: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            store: Where checkpoints and digests are kept.
+            resource: Resource path under /admin/api, example: products.
+            params: Query params for the first page, example: {"status": "any"}.
+            key: Key of the records in the response body, defaults to the resource's last part.
+            limit: Records per page.
+            fields: Fields to request and keep, must include the ID and updated at fields.
+            id_field: Field identifying a record.
+            updated_field: Field with the time a record was last updated.
+            skip_unchanged: Skip records with the same digest as when last handled.
+            overlap: Seconds the next run starts before this run started, for clock skew with Shopify.
+            clock: Callable returning the current Unix time in seconds.
+        """
+
+        resource = resource.strip("/").replace(".json", "")
+        super().__init__(store, resource, id_field, updated_field, skip_unchanged, overlap, clock)
+        self.params = params or {}
+        self.key = key or resource.split("/")[-1]
+        self.limit = limit
+        self.fields = fields
+
+    def _request(self, client, checkpoint: Checkpoint) -> Tuple[str, tuple, dict]:
+        if checkpoint.cursor is not None:
+            # Only the limit (and fields) may be sent with page_info
+            params = {"limit": self.limit, "page_info": checkpoint.cursor}
+        else:
+            params = {"limit": self.limit, **self.params}
+            if checkpoint.since is not None:
+                # Inclusive, records seen in the last run are skipped as unchanged
+                params["updated_at_min"] = checkpoint.since
+        return "rest", ("get", f"/admin/api/{self.resource}.json", params), {"fields": self.fields}
+
+    def _page(self, result) -> Tuple[List[dict], Optional[str]]:
+        return result.body.get(self.key) or [], result.link.next
+
+    def _expired(self, result) -> bool:
+        # Shopify answers an invalid page_info with a 400
+        return result.status[0] == 400
+
+
+class GraphQLSync(_Sync):
+    """
+    Incremental sync of a GraphQL connection, filtered with an updated_at search query.
+
+    The query must take $first (Int), $after (String), and $query (String) variables and pass them
+    to the connection, which must select pageInfo { hasNextPage endCursor } and edges { node } or nodes.
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore,
+        resource: str,
+        query: str,
+        connection: Optional[str] = None,
+        variables: Optional[dict] = None,
+        search: Optional[str] = None,
+        first: int = 250,
+        id_field: str = "id",
+        updated_field: str = "updatedAt",
+        skip_unchanged: bool = True,
+        overlap: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            store: Where checkpoints and digests are kept.
+            resource: Name of the sync, for checkpoints.
+            query: The GraphQL query.
+            connection: Dotted path to the connection under data, defaults to the resource.
+            variables: Other variables for the query.
+            search: Search terms added to the updated_at filter, example: "status:active".
+            first: Nodes per page.
+            id_field: Field identifying a node.
+            updated_field: Field with the time a node was last updated.
+            skip_unchanged: Skip nodes with the same digest as when last handled.
+            overlap: Seconds the next run starts before this run started, for clock skew with Shopify.
+            clock: Callable returning the current Unix time in seconds.
+        """
+
+        super().__init__(store, resource, id_field, updated_field, skip_unchanged, overlap, clock)
+        self.query = query
+        self.connection = (connection or resource).split(".")
+        self.variables = variables or {}
+        self.search = search
+        self.first = first
+
+    def _search(self, since: Optional[str]) -> Optional[str]:
+        # Inclusive, nodes seen in the last run are skipped as unchanged
+        terms = [f"updated_at:>='{since}'"] if since is not None else []
+        if self.search:
+            terms.append(self.search)
+        return " AND ".join(terms) or None
+
+    def _request(self, client, checkpoint: Checkpoint) -> Tuple[str, tuple, dict]:
+        variables = {
+            **self.variables,
+            "first": self.first,
+            "after": checkpoint.cursor,
+            "query": self._search(checkpoint.since),
+        }
+        return "graphql", (self.query, variables), {}
+
+    def _page(self, result) -> Tuple[List[dict], Optional[str]]:
+        connection = result.body["data"]
+        for key in self.connection:
+            connection = connection[key]
+        if "edges" in connection:
+            records = [edge["node"] for edge in connection["edges"]]
+        else:
+            records = connection.get("nodes") or []
+        page_info = connection.get("pageInfo") or {}
+        return records, page_info.get("endCursor") if page_info.get("hasNextPage") else None
@@ -13,3 +13,5 @@ ParsedBody = Optional[dict]
 ParsedError = Optional[Union[dict, Exception]]
 # Time to sleep for deferrer
 SleepTime = Union[float, int]
+# Priority class of a call, a name (interactive, default, background) or number
+Priority = Optional[Union[int, str]]
@@ -1,8 +1,13 @@
-from typing import Union
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Union, List, Iterable, Tuple
 import hashlib
 import hmac
 import base64
+import re
+import time
 
+if TYPE_CHECKING:  # pragma: no cover
+    from concurrent.futures import Executor
 
 # Encoding format
 e = "utf-8"
@@ -42,38 +47,260 @@ def create_hmac(
     return hmac_local.hexdigest().encode(e)
 
 
-def hmac_verify(source: str, secret: str, params: dict, hmac_header: str = None) -> bool:
+def build_hmac_query(params: dict, skip: str, join_key: str) -> bytes:
+    """
+    Build the sorted query string to sign for 0Auth/URL and proxy requests.
+    The key holding the signature is skipped, the params are not modified.
+    """
+
+    query_string = []
+    for key in sorted(params.keys()):
+        if key == skip:
+            continue
+        value = params[key]
+        # Join arrays together by ","
+        query_value = ",".join(value) if isinstance(value, (tuple, list)) else value
+        query_string.append(f"{key}={query_value}")
+    return join_key.join(query_string).encode(e)
+
+
+class HmacVerifier:
+    """
+    Verifies HMACs for one secret.
+
+    The keyed HMAC state is computed once and copied for each verification,
+    instead of re-keying for every payload.
+    """
+
+    def __init__(self, secret: Union[str, bytes]):
+        key = secret.encode(e) if isinstance(secret, str) else secret
+        self._base = hmac.new(key, digestmod=hashlib.sha256)
+
+    def digest(self, data: Union[bytes, Iterable[bytes]]) -> bytes:
+        """
+        Get the HMAC digest for raw bytes or an iterator of byte chunks.
+        """
+
+        hmac_local = self._base.copy()
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            hmac_local.update(data)
+        else:
+            for chunk in data:
+                hmac_local.update(chunk)
+        return hmac_local.digest()
+
+    def webhook(self, body: Union[bytes, str, Iterable[bytes]], hmac_header: Union[str, bytes]) -> bool:
+        """
+        Verify a webhook body (prefer the raw bytes) against the X-Shopify-Hmac-Sha256 header.
+        """
+
+        if isinstance(body, str):
+            body = body.encode(e)
+        if isinstance(hmac_header, str):
+            hmac_header = hmac_header.encode(e)
+        return hmac.compare_digest(base64.b64encode(self.digest(body)), hmac_header)
+
+    def standard(self, params: dict) -> bool:
+        """
+        Verify 0Auth/URL query params, signed in the "hmac" param.
+        """
+
+        hmac_local = self.digest(build_hmac_query(params, "hmac", "&")).hex()
+        return hmac.compare_digest(hmac_local.encode(e), params.get("hmac", "").encode(e))
+
+    def proxy(self, params: dict) -> bool:
+        """
+        Verify proxy query params, signed in the "signature" param.
+        """
+
+        hmac_local = self.digest(build_hmac_query(params, "signature", "")).hex()
+        return hmac.compare_digest(hmac_local.encode(e), params.get("signature", "").encode(e))
+
+
+@lru_cache(maxsize=256)
+def hmac_verifier(secret: Union[str, bytes]) -> HmacVerifier:
+    """
+    Get the (cached) verifier for a secret.
+    """
+
+    return HmacVerifier(secret)
+
+
+def hmac_verify(source: str, secret: str, params: Union[dict, str, bytes], hmac_header: str = None) -> bool:
     """
     Verify if the HMAC is correct.
+    The params are not modified.
     """
 
+    verifier = hmac_verifier(secret)
     if source == "standard":
         # Standard 0Auth/URL method
-        hmac_param = params["hmac"].encode(e)
-        params.pop("hmac", None)
-        kwargs = {
-            "data": params,
-            "build_query": True,
-            "build_query_with_join": True,
-        }
+        return verifier.standard(params)
     elif source == "proxy":
         # Proxy app request method
-        hmac_param = params["signature"].encode(e)
-        params.pop("signature", None)
-        kwargs = {
-            "data": params,
-            "build_query": True,
-            "build_query_with_join": False,
-        }
+        return verifier.proxy(params)
     elif source == "webhook":
         # Webhook data method
-        hmac_param = hmac_header.encode(e)
-        kwargs = {
-            "data": params.encode(e),
-            "raw": True,
-            "encode": True,
-        }
-
-    # Create the HMAC and compare to what was supplied
-    hmac_local = create_hmac(**kwargs, secret=secret)
-    return hmac.compare_digest(hmac_local, hmac_param)
+        return verifier.webhook(params, hmac_header)
+    raise ValueError(f"Source must be one of standard, proxy, or webhook; got {source}")
+
+
+def verify_webhooks(
+    secret: Union[str, bytes],
+    webhooks: Iterable[Tuple[Union[bytes, str], Union[str, bytes]]],
+    max_workers: int = None,
+    executor: "Executor" = None,
+) -> List[bool]:
+    """
+    Verify many webhooks in a thread pool, returns the results in order.
+    Hashing releases the GIL for large payloads, so threads verify in parallel.
+
+    Args:
+        secret: The app's secret key.
+        webhooks: Pairs of raw body and X-Shopify-Hmac-Sha256 header.
+        max_workers: Number of threads when no executor is supplied.
+        executor: An existing executor to use.
+    """
+
+    verifier = hmac_verifier(secret)
+
+    def verify(webhook: Tuple[Union[bytes, str], Union[str, bytes]]) -> bool:
+        return verifier.webhook(*webhook)
+
+    if executor is not None:
+        return list(executor.map(verify, webhooks))
+    # Imported here, it is slow to import and single verifications do not need it
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(verify, webhooks))
+
+
+def perf_time() -> float:
+    """
+    Get a monotonic time in ms, for measuring latency.
+    """
+
+    return time.perf_counter() * 1000
+
+
+# Tokens of a GraphQL document: strings, comments, ignored (whitespace and commas), spreads, names/values, punctuation
+QUERY_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|#[^\n]*|[\s,]+|\.\.\.|[$@A-Za-z0-9_.+\-]+|.')
+
+
+def query_tokens(query: str) -> List[str]:
+    """
+    Split a GraphQL document into tokens, dropping comments and ignored characters.
+    """
+
+    return [
+        token for token in QUERY_TOKEN_PATTERN.findall(query)
+        if not token.startswith("#") and token.strip(" \t\r\n,") != ""
+    ]
+
+
+def closing_index(tokens: List[str], index: int) -> int:
+    """
+    Find the index of the token closing the bracket at index.
+    """
+
+    depth = 0
+    for i in range(index, len(tokens)):
+        if tokens[i] in ("(", "[", "{"):
+            depth += 1
+        elif tokens[i] in (")", "]", "}"):
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a GraphQL document so formatting differences produce the same string.
+    String values are left untouched.
+    """
+
+    return " ".join(query_tokens(query))
+
+
+def is_mutation(query: str) -> bool:
+    """
+    Determine if a GraphQL document is a mutation.
+    """
+
+    tokens = query_tokens(query)
+    index = 0
+    while index < len(tokens):
+        # Each definition starts with its keyword (or a shorthand query's selection set)
+        if tokens[index] == "mutation":
+            return True
+        # Skip to the definition's selection set, then past it
+        while index < len(tokens) and tokens[index] != "{":
+            if tokens[index] in ("(", "["):
+                index = closing_index(tokens, index)
+            index += 1
+        index = closing_index(tokens, index) + 1
+    return False
+
+
+def field_tree(fields: Iterable[str]) -> dict:
+    """
+    Build a tree of requested fields, dotted names select nested keys.
+    Example: ["id", "variants.id"] becomes {"id": None, "variants": {"id": None}},
+    where None keeps the whole value.
+    """
+
+    tree: dict = {}
+    for field in fields:
+        if not field.strip():
+            continue
+        node = tree
+        *parents, leaf = [part.strip() for part in field.split(".")]
+        for part in parents:
+            if part in node and node[part] is None:
+                # Already keeping the whole value
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[leaf] = None
+    return tree
+
+
+@lru_cache(maxsize=256)
+def projection(fields: Tuple[str, ...]) -> Callable:
+    """
+    Build (and cache) a function projecting a resource, or each resource in a list, to the fields.
+    """
+
+    return _projection(field_tree(fields))
+
+
+def _projection(tree: dict) -> Callable:
+    # Whole values are copied in one comprehension, nested keys are projected by their own function
+    leaves = [key for key, branch in tree.items() if branch is None]
+    nested = [(key, _projection(branch)) for key, branch in tree.items() if branch is not None]
+
+    def project_one(value):
+        if not isinstance(value, dict):
+            return value
+        projected = {key: value[key] for key in leaves if key in value}
+        for key, project_nested in nested:
+            if key in value:
+                projected[key] = project_nested(value[key])
+        return projected
+
+    def project(value):
+        if isinstance(value, list):
+            return [project_one(item) for item in value]
+        return project_one(value)
+    return project
+
+
+def project_fields(body: dict, fields: Iterable[str]) -> dict:
+    """
+    Project a REST body to the requested fields. The body's envelope is kept,
+    example: {"products": [...]}, and each resource inside it is projected.
+    """
+
+    project = projection(tuple(fields))
+    return {key: project(value) for key, value in body.items()}
@@ -0,0 +1,466 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from queue import Queue, Full
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+from .utils import hmac_verifier, perf_time
+import json
+import time
+
+# Header with the HMAC of the body
+HMAC_HEADER = "x-shopify-hmac-sha256"
+# Header identifying a webhook, the same across Shopify's retries of it
+WEBHOOK_ID_HEADER = "x-shopify-webhook-id"
+# Header with the webhook's topic
+TOPIC_HEADER = "x-shopify-topic"
+# Header with the shop's domain
+SHOP_DOMAIN_HEADER = "x-shopify-shop-domain"
+# Header with the API version the payload was built with
+API_VERSION_HEADER = "x-shopify-api-version"
+# Seconds to tell Shopify to wait before retrying when the queue is full
+RETRY_AFTER = 1
+
+
+class Webhook:
+    """
+    A verified webhook waiting to be handled.
+    """
+
+    def __init__(self, body: bytes, headers: Dict[str, str], received_at: float):
+        self.body = body
+        # Lowercased header names
+        self.headers = headers
+        self.received_at = received_at
+
+    @property
+    def webhook_id(self) -> Optional[str]:
+        return self.headers.get(WEBHOOK_ID_HEADER)
+
+    @property
+    def topic(self) -> Optional[str]:
+        return self.headers.get(TOPIC_HEADER)
+
+    @property
+    def shop_domain(self) -> Optional[str]:
+        return self.headers.get(SHOP_DOMAIN_HEADER)
+
+    @property
+    def api_version(self) -> Optional[str]:
+        return self.headers.get(API_VERSION_HEADER)
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class IdempotencyIndex(ABC):
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = None):
+        """
+        Setup the limits.
+
+        Args:
+            max_entries: Number of webhook IDs to remember before forgetting the oldest.
+            ttl: Time in ms to remember a webhook ID for, None to keep until over the limit.
+                 Shopify retries a webhook for up to 48 hours.
+        """
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def now(self) -> float:
+        # Entries can outlive the process (disk), so a wall-clock is used
+        return time.time() * 1000
+
+    @abstractmethod
+    def add(self, webhook_id: str) -> bool:
+        """
+        Remember a webhook ID, returning False if it was already seen.
+        """
+
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def discard(self, webhook_id: str) -> None:
+        """
+        Forget a webhook ID, so a retry of it is accepted.
+        """
+
+        pass  # pragma: no cover
+
+
+class MemoryIdempotencyIndex(IdempotencyIndex):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Webhook ID to time seen, oldest first
+        self.container: OrderedDict = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.container)
+
+    def add(self, webhook_id: str) -> bool:
+        now = self.now()
+        with self.lock:
+            seen_at = self.container.get(webhook_id)
+            if seen_at is not None and (self.ttl is None or now - seen_at <= self.ttl):
+                return False
+            self.container[webhook_id] = now
+            self.container.move_to_end(webhook_id)
+            while len(self.container) > self.max_entries:
+                self.container.popitem(last=False)
+            return True
+
+    def discard(self, webhook_id: str) -> None:
+        with self.lock:
+            self.container.pop(webhook_id, None)
+
+
+class DiskIdempotencyIndex(IdempotencyIndex):
+    def __init__(self, path: str, prune_every: Optional[int] = None, **kwargs):
+        """
+        Store webhook IDs in a SQLite database, shared between processes and restarts.
+
+        Args:
+            prune_every: Number of inserts between forgetting IDs over the limit (or past the TTL),
+                default: 1% of max_entries. The table can hold up to this many IDs over the limit.
+        """
+
+        # Imported here, only the disk index needs it
+        import sqlite3
+
+        super().__init__(**kwargs)
+        self.path = path
+        self.prune_every = prune_every if prune_every is not None else max(1, self.max_entries // 100)
+        # Inserts since the last prune
+        self.inserts = 0
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS webhooks (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS webhooks_seen_at ON webhooks (seen_at)")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM webhooks").fetchone()[0]
+
+    def add(self, webhook_id: str) -> bool:
+        now = self.now()
+        with self.lock:
+            if self.ttl is not None:
+                # Seen too long ago to be a retry
+                self.connection.execute(
+                    "DELETE FROM webhooks WHERE id = ? AND seen_at < ?",
+                    (webhook_id, now - self.ttl),
+                )
+            added = self.connection.execute(
+                "INSERT OR IGNORE INTO webhooks (id, seen_at) VALUES (?, ?)",
+                (webhook_id, now),
+            ).rowcount == 1
+            if added:
+                self.inserts += 1
+                if self.inserts >= self.prune_every:
+                    self._prune(now)
+            return added
+
+    def _prune(self, now: float) -> None:
+        """
+        Forget IDs past the TTL, and the oldest over the limit, by seen_at cutoffs on its index (lock must be held).
+        """
+
+        self.inserts = 0
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM webhooks WHERE seen_at < ?", (now - self.ttl,))
+        cutoff = self.connection.execute(
+            "SELECT seen_at FROM webhooks ORDER BY seen_at DESC LIMIT 1 OFFSET ?",
+            (self.max_entries,),
+        ).fetchone()
+        if cutoff is not None:
+            self.connection.execute("DELETE FROM webhooks WHERE seen_at <= ?", cutoff)
+
+    def discard(self, webhook_id: str) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM webhooks WHERE id = ?", (webhook_id,))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class Latency:
+    """
+    Running latency in ms.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.max = 0.0
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        self.mean += (value - self.mean) / self.count
+        self.max = max(self.max, value)
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "max": self.max}
+
+
+class WebhookStats:
+    def __init__(self):
+        self.lock = Lock()
+        # Webhooks received, before verification
+        self.received = 0
+        # Webhooks queued for handling
+        self.accepted = 0
+        # Webhooks acknowledged without handling, as their ID was seen
+        self.duplicates = 0
+        # Webhooks rejected for a bad HMAC
+        self.rejected = 0
+        # Webhooks turned away as the queue was full
+        self.dropped = 0
+        # Webhooks handled, and handlers which raised
+        self.handled = 0
+        self.failed = 0
+        # Time from receiving a webhook to acknowledging it
+        self.ack_latency = Latency()
+        # Time from receiving a webhook to a worker picking it up
+        self.queue_latency = Latency()
+        # Highest queue depth seen
+        self.max_depth = 0
+
+    def increment(self, name: str) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            getattr(self, name).update(value)
+
+    def depth(self, depth: int) -> None:
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "handled": self.handled,
+            "failed": self.failed,
+            "ack_latency": self.ack_latency.as_dict(),
+            "queue_latency": self.queue_latency.as_dict(),
+            "max_depth": self.max_depth,
+        }
+
+
+class WebhookReceiver:
+    """
+    Receives webhooks for a framework-agnostic WSGI or ASGI endpoint.
+
+    A webhook is verified, checked against the idempotency index by its ID,
+    and put on a bounded queue before it is acknowledged. Workers drain the queue
+    and run the handler. When the queue is full, a 503 is returned so Shopify
+    retries later instead of the receiver falling behind.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        handler: Callable[[Webhook], Any],
+        index: Optional[IdempotencyIndex] = None,
+        max_queue: int = 1000,
+        workers: int = 4,
+        clock: Callable[[], float] = perf_time,
+    ):
+        """
+        Args:
+            secret: The app's secret key.
+            handler: Called with each webhook by a worker.
+            index: Index of seen webhook IDs, defaults to an in-memory index.
+            max_queue: Number of webhooks which can wait for a worker.
+            workers: Number of worker threads.
+            clock: Callable returning the current time in ms, for latency.
+        """
+
+        self.verifier = hmac_verifier(secret)
+        self.handler = handler
+        self.index = index if index is not None else MemoryIdempotencyIndex()
+        self.queue: Queue = Queue(maxsize=max_queue)
+        self.workers = workers
+        self.clock = clock
+        self.threads: List[Thread] = []
+        self.stats = WebhookStats()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    @property
+    def metrics(self) -> dict:
+        """
+        Stats with the current queue depth.
+        """
+
+        return {**self.stats.as_dict(), "depth": self.depth}
+
+    def start(self) -> "WebhookReceiver":
+        """
+        Start the workers.
+        """
+
+        while len(self.threads) < self.workers:
+            thread = Thread(target=self._work, name=f"webhook-worker-{len(self.threads)}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        """
+        Handle what is queued, then stop the workers.
+        """
+
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def __enter__(self) -> "WebhookReceiver":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def join(self) -> None:
+        """
+        Wait until every queued webhook is handled.
+        """
+
+        self.queue.join()
+
+    def _work(self) -> None:
+        while True:
+            webhook = self.queue.get()
+            try:
+                if webhook is None:
+                    return
+                self.stats.observe("queue_latency", self.clock() - webhook.received_at)
+                self.handler(webhook)
+                self.stats.increment("handled")
+            except Exception:
+                self.stats.increment("failed")
+            finally:
+                self.queue.task_done()
+
+    def receive(
+        self,
+        body: Union[bytes, Iterable[bytes]],
+        headers: Mapping[str, str],
+        received_at: Optional[float] = None,
+    ) -> Tuple[int, Dict[str, str]]:
+        """
+        Ingest a webhook, returning the status code and headers to respond with.
+
+        Args:
+            body: The raw body, or an iterator of its chunks.
+            headers: The request headers.
+            received_at: Time in ms the request started, from the clock.
+        """
+
+        received_at = self.clock() if received_at is None else received_at
+        self.stats.increment("received")
+        if not isinstance(body, bytes):
+            body = b"".join(body)
+        headers = {key.lower(): value for key, value in headers.items()}
+        webhook = Webhook(body, headers, received_at)
+
+        status, response_headers = self._ingest(webhook)
+        self.stats.observe("ack_latency", self.clock() - received_at)
+        return status, response_headers
+
+    def _ingest(self, webhook: Webhook) -> Tuple[int, Dict[str, str]]:
+        if not self.verifier.webhook(webhook.body, webhook.headers.get(HMAC_HEADER, "")):
+            self.stats.increment("rejected")
+            return 401, {}
+
+        webhook_id = webhook.webhook_id
+        if webhook_id is not None and not self.index.add(webhook_id):
+            self.stats.increment("duplicates")
+            return 200, {}
+
+        try:
+            self.queue.put_nowait(webhook)
+        except Full:
+            if webhook_id is not None:
+                # Not handled, accept Shopify's retry
+                self.index.discard(webhook_id)
+            self.stats.increment("dropped")
+            return 503, {"retry-after": str(RETRY_AFTER)}
+
+        self.stats.increment("accepted")
+        self.stats.depth(self.depth)
+        return 200, {}
+
+    def wsgi(self, environ: dict, start_response: Callable) -> List[bytes]:
+        """
+        WSGI application.
+        """
+
+        received_at = self.clock()
+        if environ.get("REQUEST_METHOD") != "POST":
+            start_response("405 Method Not Allowed", [("Allow", "POST")])
+            return [b""]
+
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length > 0 else b""
+        headers = {
+            key[5:].replace("_", "-"): value
+            for key, value in environ.items()
+            if key.startswith("HTTP_")
+        }
+        status, response_headers = self.receive(body, headers, received_at)
+        start_response(_status_line(status), list(response_headers.items()))
+        return [b""]
+
+    async def asgi(self, scope: dict, receive: Callable, send: Callable) -> None:
+        """
+        ASGI application.
+        """
+
+        received_at = self.clock()
+        if scope["type"] != "http":
+            return
+        if scope["method"] != "POST":
+            await _asgi_respond(send, 405, {"allow": "POST"})
+            return
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        # Imported here, only ASGI needs it
+        import asyncio
+
+        # Verifying and the index (SQLite for the disk index) block, keep them off the event loop
+        loop = asyncio.get_running_loop()
+        status, response_headers = await loop.run_in_executor(None, self.receive, chunks, headers, received_at)
+        await _asgi_respond(send, status, response_headers)
+
+
+def _status_line(status: int) -> str:
+    reasons = {200: "OK", 401: "Unauthorized", 503: "Service Unavailable"}
+    return f"{status} {reasons[status]}"
+
+
+async def _asgi_respond(send: Callable, status: int, headers: Dict[str, str]) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(key.encode("latin-1"), value.encode("latin-1")) for key, value in headers.items()],
+    })
+    await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,284 @@
+"""
+Benchmark the CPU and memory the client adds per call on top of HTTPX.
+
+Calls go through an in-process mock transport with a deferrer which never sleeps,
+so only the library's own work is measured: building requests and headers,
+versioning paths, limiter bookkeeping, parsing responses and Link headers.
+
+Throughput is reported relative to a fixed pure-Python calibration workload,
+so baselines can be compared across machines (roughly). Benchmarks are measured
+in interleaved rounds, each next to its own calibration, and the median is kept
+along with the spread between rounds. A check allows the larger of the threshold
+and the measured spread, and a regression only fails it if it repeats on a re-run.
+
+Usage:
+    python benchmarks/bench_client.py                 # report
+    python benchmarks/bench_client.py --save          # report and save the baseline
+    python benchmarks/bench_client.py --check         # report and fail on regressions
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from statistics import median
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from httpx import MockTransport, Response  # noqa: E402
+from basic_shopify_api import Client, AsyncClient, Options, Session  # noqa: E402
+from basic_shopify_api.constants import REST  # noqa: E402
+from basic_shopify_api.deferrer import Deferrer  # noqa: E402
+
+# Multiple of the spread between rounds a score may drop by before it is a regression
+SPREADS = 4
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+LINK = (
+    '<https://example.myshopify.com/admin/api/2020-04/products.json?page_info=abc123&limit=50>; rel="previous", '
+    '<https://example.myshopify.com/admin/api/2020-04/products.json?page_info=def456&limit=50>; rel="next"'
+)
+
+
+class NoSleepDeferrer(Deferrer):
+    """
+    Keeps the limiter bookkeeping, without waiting.
+    """
+
+    def sleep(self, length) -> None:
+        pass
+
+    async def asleep(self, length) -> None:
+        pass
+
+
+def fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as handle:
+        return handle.read()
+
+
+def transport() -> MockTransport:
+    shop = fixture("get_shop.json")
+    graphql = fixture("post_graphql.json")
+
+    def handler(request):
+        if request.url.path.endswith("graphql.json"):
+            return Response(200, content=graphql, headers={"content-type": "application/json"})
+        return Response(200, content=shop, headers={"content-type": "application/json", "link": LINK})
+    return MockTransport(handler)
+
+
+def setup():
+    options = Options()
+    options.deferrer = NoSleepDeferrer()
+    session = Session("example.myshopify.com", "abc", "123")
+    return session, options
+
+
+def calibration(n: int) -> None:
+    # Pure-Python reference workload: dict building, string formatting, and JSON
+    for i in range(n):
+        json.loads(json.dumps({f"key{j}": [i, j, str(j)] for j in range(20)}))
+
+
+def looped(call: Callable[[], object]) -> Callable[[int], None]:
+    def run(n):
+        for _ in range(n):
+            call()
+    return run
+
+
+def sync_scenarios(client: Client) -> Dict[str, Callable[[int], None]]:
+    response = client.get("/admin/api/shop.json")
+
+    def limiter():
+        client._rest_rate_limit()
+        client.options.time_store.append(client.session, client.options.deferrer.current_time())
+
+    return {
+        "sync_rest": looped(lambda: client.rest("get", "/admin/api/shop.json", {"fields": "id,name"})),
+        "sync_graphql": looped(lambda: client.graphql("{ shop { name } }")),
+        "build_request": looped(lambda: client._build_request("get", "/admin/api/shop.json", {"fields": "id"}, {})),
+        "build_headers": looped(lambda: client._build_headers({"x-extra": "1"})),
+        "version_path": looped(lambda: client.version_path("/admin/api/products.json")),
+        "parse_response": looped(lambda: client._parse_response(REST, response, 0)),
+        "extract_link": looped(lambda: client._rest_extract_link({"link": LINK})),
+        "limiter": looped(limiter),
+    }
+
+
+def async_scenarios(client: AsyncClient, loop: asyncio.AbstractEventLoop) -> Dict[str, Callable[[int], None]]:
+    async def rest(n):
+        for _ in range(n):
+            await client.rest("get", "/admin/api/shop.json", {"fields": "id,name"})
+
+    async def graphql(n):
+        for _ in range(n):
+            await client.graphql("{ shop { name } }")
+
+    return {
+        "async_rest": lambda n: loop.run_until_complete(rest(n)),
+        "async_graphql": lambda n: loop.run_until_complete(graphql(n)),
+    }
+
+
+def timed(func: Callable[[int], None], number: int) -> float:
+    """
+    Calls per second for one run.
+    """
+
+    start = time.perf_counter()
+    func(number)
+    return number / (time.perf_counter() - start)
+
+
+def memory(func: Callable[[int], None], number: int) -> Dict[str, float]:
+    """
+    Peak traced bytes during one call, and bytes still held per call after many
+    (after collecting cycles, so only growth which is never freed is counted).
+    """
+
+    func(10)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        func(1)
+        peak = tracemalloc.get_traced_memory()[1] - start
+        func(number)
+        gc.collect()
+        retained = (tracemalloc.get_traced_memory()[0] - start) / (number + 1)
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak, "retained_bytes": retained}
+
+
+@contextmanager
+def benchmarks() -> Iterator[Dict[str, Callable[[int], None]]]:
+    """
+    All scenarios, sync and async, with their clients open.
+    """
+
+    loop = asyncio.new_event_loop()
+    with Client(*setup(), transport=transport()) as client:
+        async_client = AsyncClient(*setup(), transport=transport())
+        try:
+            yield {**sync_scenarios(client), **async_scenarios(async_client, loop)}
+        finally:
+            loop.run_until_complete(async_client.aclose())
+            loop.close()
+
+
+def run(number: int, rounds: int, names: Optional[Set[str]] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Measure the benchmarks (all, or the names given) in interleaved rounds.
+    """
+
+    with benchmarks() as funcs:
+        funcs = {name: func for name, func in funcs.items() if names is None or name in names}
+        for func in (calibration, *funcs.values()):
+            func(min(number, 50))
+
+        ops: Dict[str, List[float]] = {name: [] for name in funcs}
+        scores: Dict[str, List[float]] = {name: [] for name in funcs}
+        for _ in range(rounds):
+            for name, func in funcs.items():
+                # Calibrate next to each benchmark, so both see the same machine load
+                reference = timed(calibration, number)
+                ops[name].append(timed(func, number))
+                scores[name].append(ops[name][-1] / reference)
+
+        results = {}
+        for name, func in funcs.items():
+            score = median(scores[name])
+            # Median absolute deviation between rounds, relative to the score
+            spread = median(abs(value - score) for value in scores[name]) / score
+            results[name] = {
+                "ops": median(ops[name]),
+                "score": score,
+                "spread": spread,
+                **memory(func, max(number // 10, 1)),
+            }
+    return results
+
+
+def check(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[Tuple[str, str]]:
+    """
+    Compare against the baseline, returning the benchmarks and regressions past the threshold.
+    Throughput is compared by score (relative to calibration), allowing for the spread measured
+    in both runs, memory by peak bytes.
+    """
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        allowed = max(threshold, SPREADS * (result["spread"] + base.get("spread", 0.0)))
+        if result["score"] < base["score"] * (1 - allowed):
+            regressions.append((
+                name,
+                f"{name}: score {result['score']:.4f} < baseline {base['score']:.4f} (allowed -{allowed:.0%})",
+            ))
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + threshold) + 1024:
+            regressions.append((name, f"{name}: peak {result['peak_bytes']:,} B > baseline {base['peak_bytes']:,} B"))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="Calls per measurement")
+    parser.add_argument("--rounds", type=int, default=7, help="Measurements per benchmark, the median is kept")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed regression (0.25 = 25%%)")
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions")
+    args = parser.parse_args()
+
+    results = run(args.number, args.rounds)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    print(
+        f"{'benchmark':<16} {'calls/s':>12} {'score':>8} {'spread':>7} {'vs base':>8} {'peak B':>9} {'retained B':>11}"
+    )
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = f"{result['score'] / base['score'] - 1:+.0%}" if base else "-"
+        print(
+            f"{name:<16} {result['ops']:>12,.0f} {result['score']:>8.4f} {result['spread']:>7.1%} {change:>8} "
+            f"{result['peak_bytes']:>9,} {result['retained_bytes']:>11,.1f}"
+        )
+
+    if args.save:
+        with open(args.baseline, "w") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.check:
+        regressions = check(results, baseline, args.threshold)
+        if regressions:
+            # Only count regressions which repeat on a re-run of those benchmarks
+            names = {name for name, _ in regressions}
+            print(f"Re-running {', '.join(sorted(names))}")
+            regressions = check(run(args.number, args.rounds, names), baseline, args.threshold)
+        for _, regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark columnar results: memory held for order records kept as dicts, against the same
+records collected into a ColumnarResult, and the time to sum a column of each.
+
+Usage: python benchmarks/bench_columnar.py [--orders N] [--page N]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from basic_shopify_api.columnar import ColumnarResult  # noqa: E402
+
+FIELDS = ["id", "created_at", "financial_status", "currency", "total_price", "customer.id", "customer.state"]
+STATUSES = ["paid", "pending", "refunded", "partially_refunded"]
+
+
+def order(index: int) -> dict:
+    # Fields of an order as decoded from JSON, values vary like real exports
+    return {
+        "id": 4000000000 + index,
+        "created_at": f"2020-04-{index % 28 + 1:02d}T{index % 24:02d}:00:00-04:00",
+        "financial_status": STATUSES[index % len(STATUSES)],
+        "currency": "USD",
+        "total_price": f"{index % 500}.{index % 100:02d}",
+        "customer": {"id": 5000000 + index % 10000, "state": "enabled"},
+    }
+
+
+def pages(orders: int, page: int):
+    for start in range(0, orders, page):
+        yield [order(index) for index in range(start, min(start + page, orders))]
+
+
+def measure(collect, orders: int, page: int):
+    tracemalloc.start()
+    started = time.perf_counter()
+    held = collect(pages(orders, page))
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, size, elapsed
+
+
+def as_dicts(stream):
+    records = []
+    for records_page in stream:
+        records.extend(records_page)
+    return records
+
+
+def as_columns(stream):
+    columns = ColumnarResult(fields=FIELDS, types={"total_price": float})
+    for records_page in stream:
+        columns.extend(records_page)
+    return columns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200000, help="Orders to collect")
+    parser.add_argument("--page", type=int, default=250, help="Orders per page")
+    args = parser.parse_args()
+
+    records, dict_bytes, dict_seconds = measure(as_dicts, args.orders, args.page)
+    started = time.perf_counter()
+    dict_total = sum(float(record["total_price"]) for record in records)
+    dict_sum = time.perf_counter() - started
+    del records
+
+    columns, column_bytes, column_seconds = measure(as_columns, args.orders, args.page)
+    started = time.perf_counter()
+    column_total = sum(columns["total_price"].data)
+    column_sum = time.perf_counter() - started
+    assert round(dict_total, 2) == round(column_total, 2)
+
+    print(f"{args.orders:,} orders, {args.page} per page")
+    print(f"{'':<10} {'bytes held':>14} {'bytes/order':>12} {'collect s':>10} {'sum ms':>8}")
+    for name, size, seconds, summed in (
+        ("dicts", dict_bytes, dict_seconds, dict_sum),
+        ("columns", column_bytes, column_seconds, column_sum),
+    ):
+        print(f"{name:<10} {size:>14,} {size / args.orders:>12,.1f} {seconds:>10.2f} {summed * 1000:>8.1f}")
+    print(f"{'saved':<10} {1 - column_bytes / dict_bytes:>14.1%}")
+
+
+if __name__ == "__main__":
+    main()
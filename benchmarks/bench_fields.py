@@ -0,0 +1,112 @@
+"""
+Benchmark REST field projection: bytes received and time per call for a products page
+fetched in full, against the same page fetched with `fields`.
+
+The mock transport selects top-level fields like Shopify does, so the savings shown are
+the smaller payload to transfer and decode, plus the projection of nested fields.
+
+Usage: python benchmarks/bench_fields.py [--products N] [--number N] [--fields id,title,variants.price ...]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from httpx import MockTransport, Response  # noqa: E402
+from basic_shopify_api import Client, Options, Session  # noqa: E402
+from bench_client import NoSleepDeferrer  # noqa: E402
+
+
+def product(index: int) -> dict:
+    # Roughly the shape and size of a real product
+    return {
+        "id": index,
+        "title": f"Product {index}",
+        "body_html": "<p>" + "Lorem ipsum dolor sit amet. " * 20 + "</p>",
+        "vendor": "Vendor",
+        "product_type": "Type",
+        "created_at": "2020-04-01T00:00:00-04:00",
+        "handle": f"product-{index}",
+        "updated_at": "2020-04-01T00:00:00-04:00",
+        "tags": "one, two, three",
+        "status": "active",
+        "variants": [
+            {
+                "id": index * 100 + variant,
+                "product_id": index,
+                "title": f"Variant {variant}",
+                "price": "19.99",
+                "sku": f"SKU-{index}-{variant}",
+                "inventory_quantity": 10,
+                "weight": 1.5,
+                "barcode": "0000000000000",
+            }
+            for variant in range(5)
+        ],
+        "options": [{"id": index, "name": "Size", "values": ["S", "M", "L", "XL", "XXL"]}],
+        "images": [{"id": index, "src": f"https://cdn.shopify.com/s/files/product-{index}.jpg"}],
+    }
+
+
+def transport(products: int) -> MockTransport:
+    catalog = [product(index) for index in range(products)]
+    # Payloads are encoded once per distinct field selection
+    encoded = {}
+
+    def handler(request):
+        fields = request.url.params.get("fields")
+        if fields not in encoded:
+            selected = catalog if fields is None else [
+                {key: value for key, value in item.items() if key in fields.split(",")} for item in catalog
+            ]
+            encoded[fields] = json.dumps({"products": selected}).encode("utf-8")
+        handler.received += len(encoded[fields])
+        return Response(200, content=encoded[fields], headers={"content-type": "application/json"})
+
+    handler.received = 0
+    return MockTransport(handler)
+
+
+def measure(products: int, number: int, fields):
+    options = Options()
+    options.deferrer = NoSleepDeferrer()
+    session = Session("example.myshopify.com", "abc", "123")
+    mock = transport(products)
+    with Client(session, options, transport=mock) as client:
+        def call():
+            return client.rest("get", "/admin/api/products.json", {"limit": products}, fields=fields)
+
+        body = call().body
+        mock.handler.received = 0
+        seconds = min(timeit.repeat(call, number=number, repeat=3)) / number
+    # Bytes per call, time per call in ms, and the size of the decoded result
+    return mock.handler.received / (number * 3), seconds * 1000, len(json.dumps(body))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=250, help="Products per page")
+    parser.add_argument("--number", type=int, default=20, help="Calls per timing")
+    parser.add_argument(
+        "--fields",
+        action="append",
+        help="Fields to request, can be repeated; defaults to top-level only and nested selections",
+    )
+    args = parser.parse_args()
+
+    full = measure(args.products, args.number, None)
+    print(f"{args.products} products per call")
+    print(f"{'fields':<28} {'bytes/call':>12} {'ms/call':>10} {'result bytes':>14}")
+    print(f"{'(all)':<28} {full[0]:>12,.0f} {full[1]:>10.3f} {full[2]:>14,}")
+    for fields in args.fields or ["id,title,updated_at", "id,title,variants.price"]:
+        received, ms, result = measure(args.products, args.number, fields.split(","))
+        print(f"{fields:<28} {received:>12,.0f} {ms:>10.3f} {result:>14,}")
+        saved = (1 - received / full[0], 1 - ms / full[1], 1 - result / full[2])
+        print(f"{'  saved':<28} {saved[0]:>12.1%} {saved[1]:>10.1%} {saved[2]:>14.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark HMAC verification: the create_hmac based verification against HmacVerifier.
+
+Usage: python benchmarks/bench_hmac.py [--size BYTES] [--number N]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from basic_shopify_api.utils import create_hmac, hmac_verifier, verify_webhooks  # noqa: E402
+
+SECRET = "hush"
+
+
+def legacy_webhook(secret: str, body: str, hmac_header: str) -> bool:
+    # Verification as done before HmacVerifier: str body re-encoded, key re-derived per call
+    hmac_local = create_hmac(data=body.encode("utf-8"), raw=True, encode=True, secret=secret)
+    return hmac.compare_digest(hmac_local, hmac_header.encode("utf-8"))
+
+
+def legacy_standard(secret: str, params: dict) -> bool:
+    # Verification as done before HmacVerifier: params copied since they were mutated
+    params = dict(params)
+    hmac_param = params.pop("hmac").encode("utf-8")
+    hmac_local = create_hmac(data=params, build_query=True, build_query_with_join=True, secret=secret)
+    return hmac.compare_digest(hmac_local, hmac_param)
+
+
+def payload(size: int) -> bytes:
+    products = []
+    while len(json.dumps(products)) < size:
+        products.append({"id": len(products), "title": "Product", "body_html": "<p>" + "x" * 200 + "</p>"})
+    return json.dumps({"products": products}).encode("utf-8")
+
+
+def report(name: str, number: int, seconds: float) -> None:
+    print(f"{name:<40} {number / seconds:>12,.0f} ops/s {seconds / number * 1e6:>10.2f} us/op")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=64 * 1024, help="Webhook body size in bytes")
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per benchmark")
+    parser.add_argument("--batch", type=int, default=256, help="Webhooks per batch")
+    args = parser.parse_args()
+
+    body = payload(args.size)
+    body_str = body.decode("utf-8")
+    header = base64.b64encode(hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).digest()).decode("utf-8")
+    verifier = hmac_verifier(SECRET)
+    chunks = [body[i:i + 16384] for i in range(0, len(body), 16384)]
+
+    params = {"code": "0907a61c0c8d55e99db179b68161bc00", "shop": "some-shop.myshopify.com", "timestamp": "1337178173"}
+    params["hmac"] = hmac.new(
+        SECRET.encode("utf-8"),
+        "&".join(f"{k}={v}" for k, v in sorted(params.items())).encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+
+    assert legacy_webhook(SECRET, body_str, header) and verifier.webhook(body, header)
+    assert legacy_standard(SECRET, params) and verifier.standard(params)
+
+    print(f"Webhook body: {len(body):,} bytes")
+    n = args.number
+    legacy = timeit.timeit(lambda: legacy_webhook(SECRET, body_str, header), number=n)
+    report("webhook: create_hmac (str body)", n, legacy)
+    report("webhook: HmacVerifier (bytes body)", n, timeit.timeit(lambda: verifier.webhook(body, header), number=n))
+    report("webhook: HmacVerifier (chunks)", n, timeit.timeit(lambda: verifier.webhook(chunks, header), number=n))
+
+    n = args.number * 10
+    report("standard: create_hmac", n, timeit.timeit(lambda: legacy_standard(SECRET, params), number=n))
+    report("standard: HmacVerifier", n, timeit.timeit(lambda: verifier.standard(params), number=n))
+
+    webhooks = [(body, header)] * args.batch
+    rounds = max(args.number // args.batch, 1)
+    serial = timeit.timeit(lambda: [verifier.webhook(*webhook) for webhook in webhooks], number=rounds)
+    threaded = timeit.timeit(lambda: verify_webhooks(SECRET, webhooks), number=rounds)
+    report(f"batch of {args.batch}: serial", rounds * args.batch, serial)
+    report(f"batch of {args.batch}: verify_webhooks", rounds * args.batch, threaded)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark the cold import time of the package and its light modules,
+and check they do not pull in HTTPX.
+
+Each import runs in a fresh interpreter with `-X importtime`, the median is kept.
+
+Usage:
+    python benchmarks/bench_import.py            # report
+    python benchmarks/bench_import.py --save     # report and save the baseline
+    python benchmarks/bench_import.py --check    # report and fail on regressions
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_baseline.json")
+# Modules to time, and modules they must not import
+TARGETS = {
+    "basic_shopify_api": ["httpx"],
+    "basic_shopify_api.utils": ["httpx", "concurrent.futures"],
+    "basic_shopify_api.webhooks": ["httpx"],
+    "basic_shopify_api.clients": [],
+}
+
+
+def import_time(module: str) -> float:
+    """
+    Cumulative import time of a module in a fresh interpreter, in ms.
+    """
+
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        check=True,
+    ).stderr.decode("utf-8")
+    total = 0.0
+    for line in output.splitlines():
+        # "import time: self | cumulative | name", top-level imports are not indented
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].startswith(" basic_shopify_api") and not parts[2].startswith("  "):
+            total += int(parts[1]) / 1000
+    return total
+
+
+def imported(module: str) -> List[str]:
+    output = subprocess.run(
+        [sys.executable, "-c", f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def run(repeat: int) -> Dict[str, float]:
+    return {module: statistics.median(import_time(module) for _ in range(repeat)) for module in TARGETS}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=15, help="Interpreters per module, median is kept")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Allowed regression (0.5 = 50%%)")
+    parser.add_argument("--slack", type=float, default=2, help="Allowed regression in ms, on top of the threshold")
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    failures = []
+    print(f"{'module':<30} {'import ms':>10} {'baseline':>10}")
+    for module, ms in results.items():
+        base = baseline.get(module)
+        base_text = "-" if base is None else f"{base:.2f}"
+        print(f"{module:<30} {ms:>10.2f} {base_text:>10}")
+        if base is not None and ms > base * (1 + args.threshold) + args.slack:
+            failures.append(f"{module}: {ms:.2f} ms > baseline {base:.2f} ms")
+        loaded = imported(module)
+        for forbidden in TARGETS[module]:
+            if forbidden in loaded:
+                failures.append(f"{module}: imports {forbidden}")
+
+    if args.save:
+        with open(args.baseline, "w") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.check:
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
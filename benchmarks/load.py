@@ -0,0 +1,187 @@
+"""
+Load driver: runs Client/AsyncClient calls against the simulator (or a given URL)
+for a duration, and reports sustained throughput, 429/THROTTLED rate, and latency.
+
+Use it to check changes to rate/cost limiting offline, example:
+    python benchmarks/load.py --api rest --mode async --concurrency 20 --duration 30
+    python benchmarks/load.py --api graphql --shops 4 --rest-limit 2 --graphql-limit 50
+    python benchmarks/load.py --mode async --concurrency 40 --shops 8 --max-concurrency 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from threading import Thread
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from basic_shopify_api import Client, AsyncClient, Options, Session, Metrics, FairScheduler  # noqa: E402
+from simulator import SimulatorConfig, serve_in_thread  # noqa: E402
+
+QUERY = "{ shop { name } products(first: 5) { edges { node { id title } } } }"
+
+
+class LocalSession(Session):
+    """
+    A session pointed at the simulator instead of the shop's domain.
+    """
+
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+
+    @property
+    def base_url(self) -> str:
+        return self.url
+
+
+class Run:
+    """
+    Results of the calls made by the workers.
+    """
+
+    def __init__(self, duration: float):
+        self.duration = duration
+        self.started = time.monotonic()
+        self.latencies: List[float] = []
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return time.monotonic() - self.started < self.duration
+
+    def record(self, started: float, failed: bool) -> None:
+        self.latencies.append((time.monotonic() - started) * 1000)
+        self.failed += failed
+
+
+def call_sync(client: Client, api: str):
+    if api == "rest":
+        return client.rest("get", "/admin/api/shop.json")
+    return client.graphql(QUERY)
+
+
+async def call_async(client: AsyncClient, api: str):
+    if api == "rest":
+        return await client.rest("get", "/admin/api/shop.json")
+    return await client.graphql(QUERY)
+
+
+def failed(result) -> bool:
+    return result.status[0] >= 400 or result.errors is not None
+
+
+def run_sync(sessions: List[Session], options: List[Options], args, run: Run) -> None:
+    def worker(index: int) -> None:
+        shop = index % len(sessions)
+        with Client(sessions[shop], options[shop]) as client:
+            while run.running:
+                started = time.monotonic()
+                run.record(started, failed(call_sync(client, args.api)))
+
+    threads = [Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def run_async(sessions: List[Session], options: List[Options], args, run: Run) -> None:
+    clients = [AsyncClient(session, shop_options) for session, shop_options in zip(sessions, options)]
+
+    async def worker(index: int) -> None:
+        client = clients[index % len(clients)]
+        while run.running:
+            started = time.monotonic()
+            run.record(started, failed(await call_async(client, args.api)))
+
+    await asyncio.gather(*[worker(index) for index in range(args.concurrency)])
+    for client in clients:
+        await client.aclose()
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def report(run: Run, metrics: List[Metrics], stats: Optional[dict]) -> None:
+    elapsed = time.monotonic() - run.started
+    calls = len(run.latencies)
+    requests = sum(metric.count("requests", cached="false") for metric in metrics)
+    throttled = sum(metric.count("throttled") for metric in metrics)
+    retries = sum(metric.count("retries") for metric in metrics)
+    waits = [metric.histogram("limiter_wait", api) for metric in metrics for api in ("rest", "graphql")]
+
+    print(f"calls completed     {calls:>10,} ({calls / elapsed:,.2f}/s)")
+    print(f"requests sent       {requests:>10,} ({requests / elapsed:,.2f}/s)")
+    print(f"throttled (429)     {throttled:>10,} ({throttled / max(requests, 1):.1%} of requests)")
+    print(f"retries             {retries:>10,}")
+    print(f"failed calls        {run.failed:>10,}")
+    print(f"latency p50/p95/max {percentile(run.latencies, 0.5):>8.1f} / {percentile(run.latencies, 0.95):.1f} / "
+          f"{max(run.latencies, default=0):.1f} ms")
+    print(f"limiter wait total  {sum(wait.sum for wait in waits) / 1000:>10.1f} s")
+    if stats is not None:
+        print(f"simulator           {stats}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Server to call, defaults to starting the simulator")
+    parser.add_argument("--api", choices=("rest", "graphql"), default="rest")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads (sync) or tasks (async)")
+    parser.add_argument("--shops", type=int, default=1, help="Shops to spread the workers over")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run for")
+    parser.add_argument("--rest-limit", type=int, default=2, help="Options.rest_limit")
+    parser.add_argument("--graphql-limit", type=int, default=50, help="Options.graphql_limit")
+    parser.add_argument("--max-retries", type=int, default=2, help="Options.max_retries")
+    parser.add_argument("--latency", type=float, default=20, help="Simulated latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="Simulated random latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="Simulated 502/503 rate")
+    parser.add_argument("--plus", action="store_true", help="Simulate Shopify Plus limits")
+    parser.add_argument("--max-concurrency", type=int, help="Share a FairScheduler with this cap between shops")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        simulated = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate}
+        config = SimulatorConfig.plus(**simulated) if args.plus else SimulatorConfig(**simulated)
+        server = serve_in_thread(config=config)
+        url = f"http://localhost:{server.server_address[1]}"
+
+    # Each shop gets its own limiter state, as an app would keep per shop
+    fair_scheduler = FairScheduler(args.max_concurrency) if args.max_concurrency else None
+    sessions, options = [], []
+    for index in range(args.shops):
+        sessions.append(LocalSession(url, domain=f"shop-{index}.myshopify.com", key="key", password=f"token-{index}"))
+        shop_options = Options()
+        shop_options.rest_limit = args.rest_limit
+        shop_options.graphql_limit = args.graphql_limit
+        shop_options.max_retries = args.max_retries
+        shop_options.metrics = Metrics()
+        shop_options.fair_scheduler = fair_scheduler
+        options.append(shop_options)
+
+    print(f"{args.mode} {args.api} against {url}: {args.concurrency} workers, {args.shops} shop(s), {args.duration}s")
+    run = Run(args.duration)
+    if args.mode == "sync":
+        run_sync(sessions, options, args, run)
+    else:
+        asyncio.get_event_loop().run_until_complete(run_async(sessions, options, args, run))
+
+    report(run, [shop_options.metrics for shop_options in options], server.simulator.stats if server else None)
+    if fair_scheduler is not None:
+        print(f"calls per shop      {fair_scheduler.admitted}")
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
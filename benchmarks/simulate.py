@@ -0,0 +1,88 @@
+"""
+Simulate rate limited REST traffic for many shops in virtual time, to tune limits.
+
+Each shop's calls run through AsyncClient's limiter against the simulator's leaky bucket,
+in process, with a VirtualDeferrer: sleeps and latency move a simulated clock instead
+of waiting, so long runs over many shops finish in seconds. Reports calls, the 429 rate,
+and throughput per shop against the bucket's leak rate.
+
+Usage:
+    python benchmarks/simulate.py --shops 100 --duration 600 --rest-limit 2
+    python benchmarks/simulate.py --shops 20 --duration 3600 --rest-limit 4 --latency 80
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from httpx import MockTransport, Response  # noqa: E402
+from basic_shopify_api import AsyncClient, Options, Session, VirtualDeferrer  # noqa: E402
+from simulator import CALL_LIMIT_HEADER, SimulatorConfig, ShopState  # noqa: E402
+
+
+def transport(deferrer: VirtualDeferrer, config: SimulatorConfig, shops: dict) -> MockTransport:
+    async def handler(request):
+        delay = config.latency + (config.random.uniform(0, config.jitter) if config.jitter else 0)
+        await deferrer.asleep(delay)
+        now = deferrer.current_time() / 1000
+        shop = shops.get(request.url.host)
+        if shop is None:
+            shop = shops[request.url.host] = ShopState(config, now)
+        allowed, level = shop.rest(now)
+        headers = {CALL_LIMIT_HEADER: f"{level}/{config.rest_bucket}"}
+        if not allowed:
+            headers["Retry-After"] = "1.0"
+            return Response(429, json={"errors": "Exceeded 2 calls per second for api client."}, headers=headers)
+        return Response(200, json={"shop": {"id": 1}}, headers=headers)
+
+    return MockTransport(handler)
+
+
+async def simulate(args) -> None:
+    deferrer = VirtualDeferrer()
+    config = SimulatorConfig(latency=args.latency, jitter=args.jitter, seed=1)
+    shops: dict = {}
+    mock = transport(deferrer, config, shops)
+    end = args.duration * 1000
+
+    async def shop(index: int) -> None:
+        options = Options()
+        options.deferrer = deferrer
+        options.rest_limit = args.rest_limit
+        options.max_retries = 0
+        session = Session(f"shop-{index}.myshopify.com", "abc", "123")
+        async with AsyncClient(session, options, transport=mock) as client:
+            while deferrer.current_time() < end:
+                await client.rest("get", "/admin/api/shop.json")
+
+    started = time.monotonic()
+    await asyncio.gather(*[shop(index) for index in range(args.shops)])
+    elapsed = time.monotonic() - started
+
+    calls = sum(state.calls for state in shops.values())
+    throttled = sum(state.throttled for state in shops.values())
+    simulated = deferrer.current_time() / 1000
+    print(f"{args.shops} shops, {simulated:,.0f}s simulated in {elapsed:.1f}s ({simulated / elapsed:,.0f}x)")
+    print(f"{calls:,} calls, {throttled:,} throttled ({throttled / max(calls, 1):.2%})")
+    print(
+        f"{(calls - throttled) / args.shops / simulated:.2f} calls/s per shop, "
+        f"leak rate {config.rest_leak_rate:g}/s, bucket {config.rest_bucket}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shops", type=int, default=100, help="Shops to simulate")
+    parser.add_argument("--duration", type=float, default=600, help="Simulated seconds")
+    parser.add_argument("--rest-limit", type=int, default=2, help="REST calls per second, per shop")
+    parser.add_argument("--latency", type=float, default=50, help="Simulated latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Random simulated latency in ms, on top")
+    args = parser.parse_args()
+    asyncio.run(simulate(args))
+
+
+if __name__ == "__main__":
+    main()
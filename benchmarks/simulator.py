@@ -0,0 +1,336 @@
+"""
+A local Shopify behaviour simulator for load testing the limiters.
+
+Reproduces, per shop (by access token):
+- the REST leaky bucket, with X-Shopify-Shop-Api-Call-Limit headers and 429 + Retry-After when full,
+- GraphQL costs (from the query's shape) against a restoring bucket, with throttleStatus and THROTTLED errors,
+- Link header pagination for /products.json,
+- injected latency and error rates.
+
+Speaks HTTP/1.1 with keep-alive, a thread per connection.
+
+Usage: python benchmarks/simulator.py [--port 8080] [--latency 50] [--error-rate 0.01] [--plus]
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from basic_shopify_api.estimator import static_cost  # noqa: E402
+
+# Header with the REST bucket's level
+CALL_LIMIT_HEADER = "X-Shopify-Shop-Api-Call-Limit"
+# Versioned API path
+API_PATH = re.compile(r"^/admin/api/(?:[0-9]{4}-[0-9]{2}|unstable)/(.+)$")
+
+
+class SimulatorConfig:
+    def __init__(
+        self,
+        rest_bucket: int = 40,
+        rest_leak_rate: float = 2,
+        graphql_bucket: float = 1000,
+        graphql_restore_rate: float = 50,
+        products: int = 250,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            rest_bucket: REST bucket size (40, or 80 for Plus).
+            rest_leak_rate: REST calls leaked per second (2, or 4 for Plus).
+            graphql_bucket: GraphQL bucket size in cost points (1000, or 2000 for Plus).
+            graphql_restore_rate: GraphQL points restored per second (50, or 100 for Plus).
+            products: Number of products to paginate through.
+            latency: Time in ms added to each response.
+            jitter: Random time in ms (up to) added on top of the latency.
+            error_rate: Share of calls answered with a 502/503 (0 to 1).
+            seed: Seed for latency and errors, for repeatable runs.
+        """
+
+        self.rest_bucket = rest_bucket
+        self.rest_leak_rate = rest_leak_rate
+        self.graphql_bucket = graphql_bucket
+        self.graphql_restore_rate = graphql_restore_rate
+        self.products = products
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    @classmethod
+    def plus(cls, **kwargs) -> "SimulatorConfig":
+        return cls(rest_bucket=80, rest_leak_rate=4, graphql_bucket=2000, graphql_restore_rate=100, **kwargs)
+
+
+class ShopState:
+    """
+    A shop's REST and GraphQL buckets.
+    """
+
+    def __init__(self, config: SimulatorConfig, now: float):
+        self.config = config
+        self.lock = Lock()
+        # REST: calls in the bucket
+        self.rest_level = 0.0
+        # GraphQL: points available
+        self.graphql_available = config.graphql_bucket
+        self.updated_at = now
+        # Calls answered, and calls throttled
+        self.calls = 0
+        self.throttled = 0
+
+    def _drain(self, now: float) -> None:
+        elapsed = max(now - self.updated_at, 0)
+        self.rest_level = max(self.rest_level - elapsed * self.config.rest_leak_rate, 0)
+        self.graphql_available = min(
+            self.graphql_available + elapsed * self.config.graphql_restore_rate,
+            self.config.graphql_bucket,
+        )
+        self.updated_at = now
+
+    def rest(self, now: float) -> Tuple[bool, int]:
+        """
+        Add a call to the REST bucket, returning if allowed and the bucket level.
+        """
+
+        with self.lock:
+            self._drain(now)
+            self.calls += 1
+            if self.rest_level + 1 > self.config.rest_bucket:
+                self.throttled += 1
+                return False, int(self.rest_level)
+            self.rest_level += 1
+            return True, int(round(self.rest_level))
+
+    def graphql(self, cost: float, now: float) -> Tuple[bool, dict]:
+        """
+        Take the cost from the GraphQL bucket, returning if allowed and the throttle status.
+        """
+
+        with self.lock:
+            self._drain(now)
+            self.calls += 1
+            allowed = self.graphql_available >= cost
+            if allowed:
+                self.graphql_available -= cost
+            else:
+                self.throttled += 1
+            return allowed, {
+                "maximumAvailable": float(self.config.graphql_bucket),
+                "currentlyAvailable": int(self.graphql_available),
+                "restoreRate": float(self.config.graphql_restore_rate),
+            }
+
+
+class Simulator:
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.lock = Lock()
+        self.shops: Dict[str, ShopState] = {}
+
+    def shop(self, token: str) -> ShopState:
+        with self.lock:
+            if token not in self.shops:
+                self.shops[token] = ShopState(self.config, time.monotonic())
+            return self.shops[token]
+
+    @property
+    def stats(self) -> dict:
+        with self.lock:
+            shops = list(self.shops.values())
+        return {
+            "calls": sum(shop.calls for shop in shops),
+            "throttled": sum(shop.throttled for shop in shops),
+        }
+
+
+def _cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"offset:{offset}".encode("utf-8")).decode("utf-8").rstrip("=")
+
+
+def _offset(cursor: str) -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return int(base64.urlsafe_b64decode(padded.encode("utf-8")).decode("utf-8").split(":")[1])
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ShopifySimulator/1.0"
+    simulator: Simulator = None
+
+    def log_message(self, format, *args) -> None:
+        # Quiet, load tests make many calls
+        pass
+
+    def do_GET(self) -> None:
+        self._handle("get")
+
+    def do_POST(self) -> None:
+        self._handle("post")
+
+    def do_PUT(self) -> None:
+        self._handle("put")
+
+    def do_DELETE(self) -> None:
+        self._handle("delete")
+
+    def _handle(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length > 0 else b""
+        config = self.simulator.config
+
+        delay = config.latency + (config.random.uniform(0, config.jitter) if config.jitter else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if config.error_rate and config.random.random() < config.error_rate:
+            self._respond(config.random.choice((502, 503)), {"errors": "Simulated error"})
+            return
+
+        url = urlsplit(self.path)
+        match = API_PATH.match(url.path)
+        if match is None:
+            self._respond(404, {"errors": "Not Found"})
+            return
+
+        shop = self.simulator.shop(self.headers.get("X-Shopify-Access-Token") or "default")
+        resource = match.group(1)
+        if resource == "graphql.json" and method == "post":
+            self._graphql(shop, body)
+        else:
+            self._rest(shop, method, resource, parse_qs(url.query))
+
+    def _rest(self, shop: ShopState, method: str, resource: str, query: dict) -> None:
+        allowed, level = shop.rest(time.monotonic())
+        headers = {CALL_LIMIT_HEADER: f"{level}/{shop.config.rest_bucket}"}
+        if not allowed:
+            headers["Retry-After"] = "1.0"
+            self._respond(429, {"errors": "Exceeded 2 calls per second for api client. Reduce request rates."}, headers)
+            return
+
+        if resource == "shop.json":
+            shop_body = {"id": 1, "name": "Simulated Shop", "myshopify_domain": self.headers["Host"]}
+            self._respond(200, {"shop": shop_body}, headers)
+        elif resource == "products.json" and method == "get":
+            self._products(query, headers)
+        elif method in ("post", "put"):
+            self._respond(201 if method == "post" else 200, {"product": {"id": 1}}, headers)
+        else:
+            self._respond(404, {"errors": "Not Found"}, headers)
+
+    def _products(self, query: dict, headers: dict) -> None:
+        total = self.simulator.config.products
+        limit = min(int(query.get("limit", ["50"])[0]), 250)
+        offset = _offset(query["page_info"][0]) if "page_info" in query else 0
+        products = [
+            {"id": index + 1, "title": f"Product {index + 1}"}
+            for index in range(offset, min(offset + limit, total))
+        ]
+
+        links = []
+        base = f"http://{self.headers['Host']}{urlsplit(self.path).path}"
+        if offset > 0:
+            links.append(f'<{base}?limit={limit}&page_info={_cursor(max(offset - limit, 0))}>; rel="previous"')
+        if offset + limit < total:
+            links.append(f'<{base}?limit={limit}&page_info={_cursor(offset + limit)}>; rel="next"')
+        if links:
+            headers["Link"] = ", ".join(links)
+        self._respond(200, {"products": products}, headers)
+
+    def _graphql(self, shop: ShopState, body: bytes) -> None:
+        try:
+            request = json.loads(body)
+            cost = max(static_cost(request["query"], request.get("variables")), 1)
+        except (ValueError, KeyError):
+            self._respond(400, {"errors": "Bad Request"})
+            return
+
+        allowed, throttle_status = shop.graphql(cost, time.monotonic())
+        extensions = {"cost": {
+            "requestedQueryCost": cost,
+            "actualQueryCost": cost if allowed else None,
+            "throttleStatus": throttle_status,
+        }}
+        if not allowed:
+            error = {"message": "Throttled", "extensions": {"code": "THROTTLED", "documentation": ""}}
+            self._respond(200, {"errors": [error], "extensions": extensions})
+            return
+        self._respond(200, {"data": {"shop": {"name": "Simulated Shop"}}, "extensions": extensions})
+
+    def _respond(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        content = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # A thread per connection, not waited on at shutdown
+    daemon_threads = True
+
+
+def make_server(host: str = "localhost", port: int = 8080, config: Optional[SimulatorConfig] = None):
+    """
+    Create the simulator server. Port 0 picks a free port.
+    """
+
+    simulator = Simulator(config or SimulatorConfig())
+    handler = type("Handler", (SimulatorHandler,), {"simulator": simulator})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.simulator = simulator
+    return server
+
+
+def serve_in_thread(host: str = "localhost", port: int = 0, config: Optional[SimulatorConfig] = None):
+    """
+    Start the simulator in a background thread, returning the server.
+    """
+
+    server = make_server(host, port, config)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--plus", action="store_true", help="Use Shopify Plus limits")
+    parser.add_argument("--latency", type=float, default=0, help="Latency in ms added to each response")
+    parser.add_argument("--jitter", type=float, default=0, help="Random latency in ms added on top")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of calls answered with a 502/503")
+    parser.add_argument("--products", type=int, default=250, help="Number of products to paginate through")
+    args = parser.parse_args()
+
+    options = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "products": args.products}
+    config = SimulatorConfig.plus(**options) if args.plus else SimulatorConfig(**options)
+    server = make_server(args.host, args.port, config)
+    print(f"Simulating Shopify on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(server.simulator.stats)
+
+
+if __name__ == "__main__":
+    main()
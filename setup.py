@@ -26,10 +26,13 @@ setup(
     packages=find_packages(exclude=['tests']),
     license="MIT License",
     install_requires=[
-        "httpx>=0.13"
+        "httpx>=0.18"
     ],
+    extras_require={
+        "numpy": ["numpy"]
+    },
     platforms="Any",
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     zip_safe=False,
     include_package_data=True,
 )
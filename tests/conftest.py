@@ -14,6 +14,12 @@ def local_server_app(environ, start_response):
     fixture = environ.get("HTTP_X_TEST_FIXTURE", f"{method}_{path}")
     if "HTTP_X_TEST_RETRY" in environ:
         headers.append((RETRY_HEADER, environ["HTTP_X_TEST_RETRY"]))
+    if "HTTP_X_TEST_ETAG" in environ:
+        headers.append(("ETag", environ["HTTP_X_TEST_ETAG"]))
+        if environ.get("HTTP_IF_NONE_MATCH") == environ["HTTP_X_TEST_ETAG"]:
+            # Resource unchanged, no body
+            start_response(f"{HTTPStatus.NOT_MODIFIED.value} {HTTPStatus.NOT_MODIFIED.phrase}", headers)
+            return [b""]
 
     with open(os.path.dirname(__file__) + f"/fixtures/{fixture}") as fixture:
         data = fixture.read().encode("utf-8")
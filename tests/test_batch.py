@@ -0,0 +1,92 @@
+import pytest
+import asyncio
+import json
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import AsyncClient, GraphQLBatcher
+from basic_shopify_api.batch import BatchOperation, merge, split
+from basic_shopify_api.models import ApiResult
+
+VARIANT_QUERY = "query Variant($id: ID!) { productVariant(id: $id) { id title } }"
+
+
+def test_parse_operation():
+    operation = BatchOperation.parse(VARIANT_QUERY)
+    assert operation.variables == [["$id", ":", "ID", "!"]]
+    assert operation.fields == [("productVariant", ["productVariant", "(", "id", ":", "$id", ")", "{", "id", "title", "}"])]
+
+    operation = BatchOperation.parse("{ s: shop { name } products(first: 1) @include(if: true) { edges { node { id } } } }")
+    assert [key for key, _ in operation.fields] == ["s", "products"]
+
+    assert BatchOperation.parse("mutation { a }") is None
+    assert BatchOperation.parse("{ ...F } fragment F on Shop { name }") is None
+
+
+def test_merge_and_split():
+    operations = [BatchOperation.parse(VARIANT_QUERY), BatchOperation.parse("{ shop { name } }")]
+    query, variables = merge(operations, [{"id": "1"}, None])
+    assert query == (
+        "query Batch ( $b0_id : ID ! ) "
+        "{ b0_productVariant : productVariant ( id : $b0_id ) { id title } b1_shop : shop { name } }"
+    )
+    assert variables == {"b0_id": "1"}
+
+    body = {"data": {"b0_productVariant": {"id": "1"}, "b1_shop": {"name": "Apple"}}}
+    results = split(ApiResult(response=None, status=200, body=body, errors=None), operations)
+    assert results[0].body == {"data": {"productVariant": {"id": "1"}}}
+    assert results[1].body == {"data": {"shop": {"name": "Apple"}}}
+
+    errors = [{"message": "Not found", "path": ["b0_productVariant"]}]
+    results = split(ApiResult(response=None, status=200, body=None, errors=errors), operations)
+    assert results[0].errors == [{"message": "Not found", "path": ["productVariant"]}]
+    assert results[1].errors is None
+
+
+def graphql_handler(request):
+    # Answer each aliased field with its variables
+    payload = json.loads(request.content)
+    graphql_handler.calls += 1
+    variables = payload["variables"] or {}
+    data = {name[:-2] + "productVariant": {"id": value} for name, value in variables.items()}
+    return Response(200, json={"data": data})
+
+
+@pytest.mark.asyncio
+async def test_batcher():
+    graphql_handler.calls = 0
+    sess, opts = generate_opts_and_sess()
+    async with AsyncClient(sess, opts, transport=MockTransport(graphql_handler)) as c:
+        batcher = GraphQLBatcher(c, window=5)
+        results = await asyncio.gather(*[batcher.graphql(VARIANT_QUERY, {"id": str(i)}) for i in range(3)])
+        assert [result.body["data"]["productVariant"]["id"] for result in results] == ["0", "1", "2"]
+        assert graphql_handler.calls == 1
+        assert batcher.queries == 3
+        assert batcher.requests == 1
+        # Sent batches are only held while in flight
+        assert batcher.sending == set()
+
+
+@pytest.mark.asyncio
+async def test_batcher_cost_ceiling():
+    graphql_handler.calls = 0
+    sess, opts = generate_opts_and_sess()
+    async with AsyncClient(sess, opts, transport=MockTransport(graphql_handler)) as c:
+        # Each query is estimated at 1, so 2 fit per batch
+        batcher = GraphQLBatcher(c, window=5, max_cost=2)
+        await asyncio.gather(*[batcher.graphql(VARIANT_QUERY, {"id": str(i)}) for i in range(5)])
+        assert graphql_handler.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_batcher_holds_sending():
+    graphql_handler.calls = 0
+    sess, opts = generate_opts_and_sess()
+    async with AsyncClient(sess, opts, transport=MockTransport(graphql_handler)) as c:
+        batcher = GraphQLBatcher(c, window=1000)
+        result = asyncio.ensure_future(batcher.graphql(VARIANT_QUERY, {"id": "1"}))
+        await asyncio.sleep(0)
+        task = batcher.flush()
+        assert batcher.sending == {task}
+        assert (await result).body["data"]["productVariant"]["id"] == "1"
+        await task
+        assert batcher.sending == set()
@@ -0,0 +1,217 @@
+import pytest
+from httpx import Response
+from .utils import generate_opts_and_sess, local_server_session, async_local_server_session
+from basic_shopify_api import Client, AsyncClient, ResponseCache, GraphQLCache, MemoryCacheBackend, DiskCacheBackend
+from basic_shopify_api.cache import CacheEntry
+
+
+def make_entry(stored_at=0, content=b"{}"):
+    return CacheEntry(status=200, headers={"etag": "abc"}, content=content, stored_at=stored_at, expires_at=1)
+
+
+def test_memory_backend_lru():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("a", make_entry())
+    backend.set("b", make_entry())
+    backend.get("a")
+    backend.set("c", make_entry())
+
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+    assert backend.evictions == 1
+
+
+def test_memory_backend_ttl():
+    now = [0]
+    backend = MemoryCacheBackend(ttl=100, clock=lambda: now[0])
+    backend.set("a", make_entry())
+    assert backend.get("a") is not None
+
+    now[0] = 101
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_disk_backend(tmp_path):
+    backend = DiskCacheBackend(str(tmp_path), max_entries=2)
+    backend.set("a", make_entry(content=b'{"a": 1}'))
+    backend.set("b", make_entry())
+    backend.set("c", make_entry())
+    assert backend.get("a") is None
+
+    # Entries survive a new instance
+    backend = DiskCacheBackend(str(tmp_path), max_entries=2)
+    assert len(backend) == 2
+    entry = backend.get("b")
+    assert entry.etag == "abc"
+    assert entry.validators() == {"if-none-match": "abc"}
+
+
+def test_response_cache_store():
+    cache = ResponseCache(ttl=100, clock=lambda: 0)
+    cache.store("a", Response(500, content=b"{}"))
+    assert cache.get("a") is None
+
+    cache.store("a", Response(200, content=b"{}", headers={"cache-control": "no-store"}))
+    assert cache.get("a") is None
+
+    entry = cache.store("a", Response(200, content=b'{"a": 1}'))
+    assert cache.is_fresh(entry) is True
+    assert cache.response(entry, "get", "https://example.com/").json() == {"a": 1}
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_rest_cache_hit():
+    sess, opts = generate_opts_and_sess()
+    opts.rest_cache = ResponseCache()
+    with Client(sess, opts) as c:
+        first = c.rest("get", "/admin/api/shop.json")
+        second = c.rest("get", "/admin/api/shop.json")
+        assert first.cached is False
+        assert second.cached is True
+        assert second.body["shop"]["name"] == "Apple Computers"
+        assert len(c.options.time_store.all(c.session)) == 1
+        assert opts.rest_cache.stats.hits == 1
+        assert opts.rest_cache.stats.misses == 1
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_rest_cache_revalidate():
+    sess, opts = generate_opts_and_sess()
+    opts.rest_cache = ResponseCache(ttl=0)
+    with Client(sess, opts) as c:
+        c.rest("get", "/admin/api/shop.json", headers={"x-test-etag": "v1"})
+        response = c.rest("get", "/admin/api/shop.json", headers={"x-test-etag": "v1"})
+        assert response.cached is True
+        assert response.body["shop"]["name"] == "Apple Computers"
+        assert opts.rest_cache.stats.revalidated == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("local_server")
+@async_local_server_session
+async def test_async_rest_cache_hit():
+    sess, opts = generate_opts_and_sess()
+    opts.rest_cache = ResponseCache()
+    async with AsyncClient(sess, opts) as c:
+        await c.rest("get", "/admin/api/shop.json")
+        response = await c.rest("get", "/admin/api/shop.json")
+        assert response.cached is True
+        assert response.body["shop"]["name"] == "Apple Computers"
+
+
+def test_graphql_cache_key_and_ttl():
+    sess, _ = generate_opts_and_sess()
+    cache = GraphQLCache(ttl=10, ttls={"ProductByHandle": 20, "{ shop { name } }": 30})
+    assert cache.key(sess, "{ shop { name } }") == cache.key(sess, "{\n  shop {\n    name\n  }\n}")
+    assert cache.key(sess, "{ shop { name } }", {"a": 1}) != cache.key(sess, "{ shop { name } }", {"a": 2})
+    assert cache.ttl_for("query ProductByHandle($h: String!) { productByHandle(handle: $h) { id } }") == 20
+    assert cache.ttl_for("{shop{name}}") == 30
+    assert cache.ttl_for("{ products(first: 1) { edges { node { id } } } }") == 10
+    assert cache.cacheable("{ shop { name } }") is True
+    assert cache.cacheable("mutation { productDelete(input: {}) { userErrors { message } } }") is False
+
+
+def test_graphql_cache_invalidate_topic():
+    cache = GraphQLCache()
+    body = {"data": {"product": {"id": "gid://shopify/Product/1"}}}
+    cache.store("a", Response(200, content=b"{}"), body=body)
+    cache.store("b", Response(200, content=b"{}"), body=body)
+    assert cache.topic_type("products/update") == "Product"
+    assert cache.topic_type("inventory_items/update") == "InventoryItem"
+    assert cache.topic_type("collection_listings/add") == "CollectionListing"
+
+    assert cache.invalidate_topic("products/update", {"id": 2}) == 0
+    assert cache.invalidate_topic("products/delete", {"id": 1}) == 2
+    assert cache.get("a") is None
+
+    cache.store("a", Response(200, content=b"{}"), body=body)
+    assert cache.invalidate_topic("products/create", {"admin_graphql_api_id": "gid://shopify/Product/3"}) == 1
+
+
+def test_graphql_cache_tags_follow_evictions():
+    now = [0]
+    backend = MemoryCacheBackend(max_entries=2, ttl=100, clock=lambda: now[0])
+    cache = GraphQLCache(backend=backend, clock=lambda: now[0])
+    for index in range(3):
+        cache.store(str(index), Response(200, content=b"{}"), body={"id": f"gid://shopify/Product/{index}"})
+    # LRU eviction of the first entry drops its tags
+    assert "0" not in cache.key_tags
+    assert "gid://shopify/Product/0" not in cache.tags
+
+    # So does expiry
+    now[0] = 101
+    assert cache.get("1") is None
+    assert "1" not in cache.key_tags
+    assert set(cache.tags) == {"gid://shopify/Product/2", "type:Product"}
+
+
+def test_graphql_cache_disk_tags(tmp_path):
+    cache = GraphQLCache(backend=DiskCacheBackend(str(tmp_path)))
+    cache.store("a", Response(200, content=b"{}"), body={"id": "gid://shopify/Product/1"})
+    cache.store("b", Response(200, content=b"{}"), body={"id": "gid://shopify/Order/1"})
+
+    # A new process can still invalidate by tag
+    cache = GraphQLCache(backend=DiskCacheBackend(str(tmp_path), max_entries=1))
+    assert cache.invalidate_gid("gid://shopify/Product/1") == 1
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+
+def test_graphql_cache_invalidate_webhook():
+    cache = GraphQLCache()
+    cache.store("a", Response(200, content=b"{}"), body={"data": {"x": "gid://shopify/Xyz/123"}})
+    assert cache.invalidate_webhook("hush", "xyzs/update", '{"xyz":"123"}', "invalid") is False
+    assert cache.get("a") is not None
+
+    hmac_header = "b/rWdZdcB2yqHc0eitdWqmRDdepHw4phdZNa68NHBSY="
+    assert cache.invalidate_webhook("hush", "xyzs/update", b'{"xyz":"123"}', hmac_header) is True
+    assert cache.get("a") is None
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_graphql_cache_hit():
+    sess, opts = generate_opts_and_sess()
+    opts.graphql_cache = GraphQLCache()
+    query = "{ productByHandle(handle: \"ipod\") { id title } }"
+    headers = {"x-test-fixture": "post_graphql_product.json"}
+    with Client(sess, opts) as c:
+        first = c.graphql(query, headers=headers)
+        second = c.graphql(query, headers=headers)
+        assert first.cached is False
+        assert second.cached is True
+        assert second.body["data"]["productByHandle"]["title"] == "iPod"
+        # Cached results do not count towards cost limiting
+        assert len(c.options.cost_store.all(c.session)) == 1
+
+        opts.graphql_cache.invalidate_gid("gid://shopify/Product/1")
+        assert c.graphql(query, headers=headers).cached is False
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_graphql_cache_mutation_bypass():
+    sess, opts = generate_opts_and_sess()
+    opts.graphql_cache = GraphQLCache()
+    with Client(sess, opts) as c:
+        c.graphql("mutation { shop { name } }")
+        response = c.graphql("mutation { shop { name } }")
+        assert response.cached is False
+        assert opts.graphql_cache.stats.hits == 0
+        assert opts.graphql_cache.stats.misses == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("local_server")
+@async_local_server_session
+async def test_async_graphql_cache_hit():
+    sess, opts = generate_opts_and_sess()
+    opts.graphql_cache = GraphQLCache()
+    async with AsyncClient(sess, opts) as c:
+        await c.graphql("{ shop { name } }")
+        response = await c.graphql("{ shop { name } }")
+        assert response.cached is True
+        assert response.body["data"]["shop"]["name"] == "Apple Computers"
@@ -0,0 +1,114 @@
+import json
+import time
+import pytest
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, RecordingTransport, ReplayTransport
+from basic_shopify_api.cassette import Cassette, CassetteMiss, CassetteWriter, MAGIC
+
+
+def handler(request):
+    if request.url.path.endswith("graphql.json"):
+        return Response(200, json={"data": {"shop": {"name": json.loads(request.content)["query"]}}})
+    count = handler.counts.get(request.url.path, 0) + 1
+    handler.counts[request.url.path] = count
+    return Response(200, json={"count": count}, headers={"x-shopify-shop-api-call-limit": f"{count}/40"})
+
+
+def record(path):
+    handler.counts = {}
+    mock = MockTransport(handler)
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    with Client(sess, opts, transport=RecordingTransport(path, transport=mock)) as c:
+        c.rest("get", "/admin/api/shop.json")
+        c.rest("get", "/admin/api/shop.json")
+        c.rest("get", "/admin/api/products.json", {"limit": 5, "fields": "id"})
+        c.graphql("{ shop { name } }")
+
+
+def test_record_replay(tmp_path):
+    path = str(tmp_path / "traffic.cassette")
+    record(path)
+
+    cassette = Cassette(path)
+    assert len(cassette) == 4
+    records = list(cassette.records())
+    assert records[0].meta["status"] == 200
+    # Credentials are not recorded
+    assert "x-shopify-access-token" not in dict(records[0].meta["request_headers"])
+    assert all(record.elapsed >= 0 for record in records)
+
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    with Client(sess, opts, transport=ReplayTransport(cassette, speed=None)) as c:
+        # Identical requests are served in recorded order, then the last repeats
+        assert c.rest("get", "/admin/api/shop.json").body == {"count": 1}
+        assert c.rest("get", "/admin/api/shop.json").body == {"count": 2}
+        assert c.rest("get", "/admin/api/shop.json").body == {"count": 2}
+        # Query order does not matter
+        result = c.rest("get", "/admin/api/products.json", {"fields": "id", "limit": 5})
+        assert result.response.headers["x-shopify-shop-api-call-limit"] == "1/40"
+        assert c.graphql("{ shop { name } }").body["data"]["shop"]["name"] == "{ shop { name } }"
+        with pytest.raises(CassetteMiss):
+            c.graphql("{ shop { id } }")
+    cassette.close()
+
+
+def test_replay_not_strict(tmp_path):
+    path = str(tmp_path / "traffic.cassette")
+    record(path)
+
+    sess, opts = generate_opts_and_sess()
+    opts.max_retries = 0
+    transport = ReplayTransport(path, speed=None, strict=False)
+    with Client(sess, opts, transport=transport) as c:
+        assert c.rest("get", "/admin/api/missing.json").status[0] == 404
+    assert transport.misses == 1
+
+
+def test_replay_speed(tmp_path):
+    path = str(tmp_path / "traffic.cassette")
+    writer = CassetteWriter(path)
+    sess, opts = generate_opts_and_sess()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        response = c.get("/admin/api/2020-04/shop.json")
+    writer.write(response.request, response, time.perf_counter(), 0.2)
+    writer.close()
+
+    with Client(sess, opts, transport=ReplayTransport(path, speed=4)) as c:
+        started = time.perf_counter()
+        c.rest("get", "/admin/api/shop.json")
+        assert 0.05 <= time.perf_counter() - started < 0.2
+
+
+def test_unclosed_cassette(tmp_path):
+    path = str(tmp_path / "traffic.cassette")
+    writer = CassetteWriter(path)
+    sess, opts = generate_opts_and_sess()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        response = c.get("/admin/api/2020-04/shop.json")
+    writer.write(response.request, response, time.perf_counter(), 0.01)
+    writer.handle.write(b"\x00\x01")
+    writer.handle.flush()
+
+    # No index, rebuilt by scanning and the partial record is skipped
+    assert len(Cassette(path)) == 1
+
+    with open(str(tmp_path / "other"), "wb") as handle:
+        handle.write(b"nope" + MAGIC)
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "other"))
+
+
+@pytest.mark.asyncio
+async def test_async_record_replay(tmp_path):
+    path = str(tmp_path / "traffic.cassette")
+    handler.counts = {}
+    sess, opts = generate_opts_and_sess()
+    mock = MockTransport(handler)
+    async with AsyncClient(sess, opts, transport=RecordingTransport(path, async_transport=mock)) as c:
+        await c.rest("get", "/admin/api/shop.json")
+
+    async with AsyncClient(sess, opts, transport=ReplayTransport(path, speed=None)) as c:
+        assert (await c.rest("get", "/admin/api/shop.json")).body == {"count": 1}
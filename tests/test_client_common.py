@@ -2,6 +2,7 @@ import pytest
 from .utils import generate_opts_and_sess
 from basic_shopify_api import Client
 from basic_shopify_api.constants import ACCESS_TOKEN_HEADER, ALT_MODE
+from basic_shopify_api.clients.common import RequestTemplate
 
 
 def test_build_headers():
@@ -30,3 +31,35 @@ def test_build_request():
             params={"fields": "id"},
         )
         assert "json" in request
+
+
+def test_build_headers_template():
+    with Client(*generate_opts_and_sess()) as c:
+        assert c._build_headers({"X-Extra": "1"})["X-Extra"] == "1"
+        assert "X-Extra" not in c._build_headers({})
+
+        # Options, headers, and session changes are picked up
+        c.options.headers["X-Shop"] = "a"
+        assert c._build_headers({})["X-Shop"] == "a"
+        c.session.password = "456"
+        assert c._build_headers({})[ACCESS_TOKEN_HEADER] == "456"
+        c.options.mode = ALT_MODE
+        assert ACCESS_TOKEN_HEADER not in c._build_headers({})
+        c.options.headers = {}
+        assert c._build_headers({}) == {}
+
+
+def test_version_path_memo():
+    with Client(*generate_opts_and_sess()) as c:
+        assert c.version_path("/admin/api/shop.json") == "/admin/api/2020-04/shop.json"
+        assert c.version_path("/admin/oauth/access_token") == "/admin/oauth/access_token"
+        assert c.version_path("/admin/api/shop.json") == "/admin/api/2020-04/shop.json"
+
+        # A new version rebuilds the memo
+        c.options.version = "unstable"
+        assert c.version_path("/admin/api/shop.json") == "/admin/api/unstable/shop.json"
+
+        # Bounded
+        for index in range(RequestTemplate.MAX_PATHS + 1):
+            c.version_path(f"/admin/api/products/{index}.json")
+        assert len(c._request_template().paths) <= RequestTemplate.MAX_PATHS
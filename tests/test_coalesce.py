@@ -0,0 +1,90 @@
+import pytest
+import asyncio
+from threading import Event, Thread
+from .utils import generate_opts_and_sess, async_local_server_session
+from basic_shopify_api import Client, AsyncClient, Coalescer
+
+
+def test_coalescer_threads():
+    coalescer = Coalescer()
+    release = Event()
+    results = []
+
+    def leader():
+        release.wait()
+        return "result"
+
+    threads = [Thread(target=lambda: results.append(coalescer.run("a", leader))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while coalescer.leaders + coalescer.collapsed < 3:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 3
+    assert coalescer.stats == {"leaders": 1, "collapsed": 2, "inflight": 0}
+
+
+def test_coalescer_error():
+    coalescer = Coalescer()
+
+    def leader():
+        raise ValueError("oops")
+
+    with pytest.raises(ValueError):
+        coalescer.run("a", leader)
+    assert coalescer.inflight == 0
+
+
+def test_coalesce_key():
+    sess, opts = generate_opts_and_sess()
+    opts.coalescer = Coalescer()
+    with Client(sess, opts) as c:
+        assert c._coalesce_key("rest", {"method": "get", "path": "/a", "_retries": 0}) is not None
+        assert c._coalesce_key("rest", {"method": "get", "path": "/a", "_retries": 1}) is None
+        assert c._coalesce_key("rest", {"method": "post", "path": "/a"}) is None
+        assert c._coalesce_key("graphql", {"query": "{ shop { name } }"}) is not None
+        assert c._coalesce_key("graphql", {"query": "mutation { a }"}) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("local_server")
+@async_local_server_session
+async def test_async_coalesce():
+    sess, opts = generate_opts_and_sess()
+    opts.coalescer = Coalescer()
+    async with AsyncClient(sess, opts) as c:
+        responses = await asyncio.gather(*[c.rest("get", "/admin/api/shop.json") for _ in range(5)])
+        assert all(response.body["shop"]["name"] == "Apple Computers" for response in responses)
+        assert opts.coalescer.leaders == 1
+        assert opts.coalescer.collapsed == 4
+        assert len(c.options.time_store.all(c.session)) == 1
+
+        responses = await asyncio.gather(c.graphql("{ shop { name } }"), c.graphql(query="{ shop { name } }"))
+        assert responses[0] is responses[1]
+        assert opts.coalescer.collapsed == 5
+
+
+@pytest.mark.asyncio
+async def test_async_coalesce_leader_cancelled():
+    coalescer = Coalescer()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    leader = asyncio.ensure_future(coalescer.arun("a", fetch))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(coalescer.arun("a", fetch)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    # Followers were not cancelled, one of them runs the call again for both
+    assert await asyncio.gather(*followers) == [2, 2]
+    assert leader.cancelled() is True
+    assert coalescer.leaders == 2
+    assert coalescer.inflight == 0
@@ -0,0 +1,103 @@
+import pytest
+from array import array
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, ColumnarResult
+from basic_shopify_api.columnar import Column, unwrap, records_of
+
+
+def test_column_types():
+    column = Column(None, rows=1)
+    column.append(1)
+    column.append(None)
+    assert column.kind is int
+    assert isinstance(column.data, array) and column.data.typecode == "q"
+    assert column.values() == [None, 1, None]
+
+    # Floats promote the column
+    column.append(2.5)
+    column.append(3)
+    assert column.kind is float
+    assert column.values() == [None, 1.0, None, 2.5, 3.0]
+
+    # Anything else falls back to a list
+    column.append("x")
+    assert column.kind is object
+    assert column.values() == [None, 1.0, None, 2.5, 3.0, "x"]
+
+
+def test_string_dictionary():
+    column = Column(None)
+    for value in ("paid", "pending", "paid", None, "paid"):
+        column.append(value)
+    assert column.strings == ["paid", "pending"]
+    assert list(column.data) == [0, 1, 0, -1, 0]
+    assert column.values() == ["paid", "pending", "paid", None, "paid"]
+
+
+def test_unwrap():
+    node = {"id": 1, "lineItems": {"edges": [{"node": {"sku": "A"}}]}, "tags": {"nodes": ["x"]}}
+    assert unwrap({"edges": [{"node": node}]}) == [{"id": 1, "lineItems": [{"sku": "A"}], "tags": ["x"]}]
+
+
+def test_records_of():
+    assert records_of({"orders": [{"id": 1}]}) == [{"id": 1}]
+    assert records_of({"orders": [], "other": []}, "orders") == []
+    body = {"data": {"shop": {"orders": {"pageInfo": {}, "edges": [{"node": {"id": 1}}]}}}}
+    assert records_of(body) == [{"id": 1}]
+    assert records_of(body, "shop.orders") == [{"id": 1}]
+    assert records_of(None) == []
+
+
+def test_flatten_and_missing_fields():
+    columns = ColumnarResult()
+    columns.append({"id": 1, "customer": {"id": 10, "email": "a@example.com"}})
+    columns.append({"id": 2, "customer": None, "note": "Gift"})
+    assert len(columns) == 2
+    assert columns.to_dict() == {
+        "id": [1, 2],
+        "customer.id": [10, None],
+        "customer.email": ["a@example.com", None],
+        "customer": [None, None],
+        "note": [None, "Gift"],
+    }
+
+
+def test_fields_and_types():
+    columns = ColumnarResult(fields=["id", "total_price", "customer.id"], types={"total_price": float})
+    columns.append({"id": 1, "total_price": "10.50", "customer": {"id": 10, "email": "a@example.com"}, "tags": "x"})
+    columns.append({"id": 2, "total_price": "4.50", "customer": {"id": 11}})
+    assert sorted(columns.columns) == ["customer.id", "id", "total_price"]
+    assert columns["total_price"].data.typecode == "d"
+    assert sum(columns["total_price"].data) == 15.0
+
+
+def test_numpy():
+    numpy = pytest.importorskip("numpy")
+    columns = ColumnarResult()
+    columns.extend([{"id": 1, "status": "paid"}, {"id": 2, "status": "paid"}])
+    assert columns["id"].numpy().dtype == numpy.int64
+    assert columns["id"].numpy().sum() == 3
+    assert list(columns["status"].numpy()) == [0, 0]
+
+
+def test_paginated_rest():
+    def handler(request):
+        page = int(request.url.params.get("page_info", 0))
+        headers = {}
+        if page == 0:
+            headers["link"] = '<https://example.myshopify.com/admin/api/2020-04/orders.json?page_info=1>; rel="next"'
+        orders = [{"id": page * 2 + index, "financial_status": "paid"} for index in range(2)]
+        return Response(200, json={"orders": orders}, headers=headers)
+
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    columns = ColumnarResult()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        params = {"limit": 2}
+        while params is not None:
+            result = c.rest("get", "/admin/api/orders.json", params)
+            assert columns.add(result) == 2
+            params = {"limit": 2, "page_info": result.link.next} if result.link.next else None
+    assert list(columns["id"].data) == [0, 1, 2, 3]
+    assert columns["financial_status"].strings == ["paid"]
@@ -0,0 +1,143 @@
+import pytest
+import asyncio
+from httpx import MockTransport, Response, ConnectError, ReadTimeout
+from .utils import generate_opts_and_sess
+from basic_shopify_api import AsyncClient, AdaptiveConcurrency, Metrics
+from basic_shopify_api.concurrency import ConcurrencySlot
+from basic_shopify_api.deadline import DeadlineExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def healthy(*args, **kwargs):
+    return Response(200, json={"shop": {}}, *args, **kwargs)
+
+
+def test_additive_increase():
+    clock = Clock()
+    limiter = AdaptiveConcurrency(initial=2, maximum=3, clock=clock)
+    for _ in range(2):
+        limiter.acquire("shop")
+    # Limited, each healthy response grows the limit by 1 / limit
+    assert limiter.record("shop", 0, healthy()) == 2.5
+    assert limiter.record("shop", 0, healthy()) == 2.9
+    assert limiter.record("shop", 0, healthy()) == 3
+    for _ in range(2):
+        limiter.release("shop")
+
+    # Not limited, the limit is left alone
+    assert limiter.record("shop", 0, healthy()) == 3
+
+
+@pytest.mark.parametrize("response", [
+    Response(429),
+    Response(503),
+    Response(200, json={"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}]}),
+    healthy(headers={"X-Shopify-Shop-Api-Call-Limit": "36/40"}),
+    None,
+])
+def test_multiplicative_decrease(response):
+    limiter = AdaptiveConcurrency(initial=8, clock=Clock())
+    assert limiter.record("shop", 0, response) == 4
+    assert limiter.stats["cuts"] == {"shop": 1}
+
+
+def test_one_cut_per_round():
+    clock = Clock()
+    limiter = AdaptiveConcurrency(initial=8, clock=clock)
+    clock.now = 10
+    limiter.record("shop", 5, Response(429))
+    # Sent before the cut, ignored
+    assert limiter.record("shop", 6, Response(429)) == 4
+    # Sent after the cut
+    assert limiter.record("shop", 11, Response(429)) == 2
+    clock.now = 20
+    assert limiter.record("shop", 12, Response(429)) == 1
+    assert limiter.record("shop", 21, Response(429)) == 1
+
+
+def test_latency_breach():
+    clock = Clock()
+    limiter = AdaptiveConcurrency(initial=8, tolerance=2, slack=10, clock=clock)
+    clock.now = 50
+    limiter.record("shop", 0, healthy())
+    clock.now = 100
+    # Baseline of 50ms, 60ms is within 2 * 50 + 10
+    assert limiter.record("shop", 40, healthy()) == 8
+    assert limiter.record("shop", 0, healthy()) == 8
+    clock.now = 200
+    assert limiter.record("shop", 89, healthy()) == 4
+
+
+def test_limits_check():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(decrease=1)
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(initial=2, minimum=4)
+
+
+@pytest.mark.asyncio
+async def test_limit_holds_calls():
+    limiter = AdaptiveConcurrency(initial=1, clock=Clock())
+    await limiter.aacquire("shop")
+    waiting = asyncio.ensure_future(limiter.aacquire("shop"))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    # Growing the limit lets the waiter through
+    limiter.record("shop", 0, healthy())
+    await asyncio.wait_for(waiting, 1)
+    assert limiter.stats["inflight"] == {"shop": 2}
+
+
+@pytest.mark.asyncio
+async def test_async_client_adapts():
+    state = {"inflight": 0, "max": 0, "calls": 0}
+
+    async def handler(request):
+        state["inflight"] += 1
+        state["calls"] += 1
+        call = state["calls"]
+        state["max"] = max(state["max"], state["inflight"])
+        await asyncio.sleep(0.001)
+        state["inflight"] -= 1
+        if call == 10:
+            return Response(429, json={"errors": "Exceeded 2 calls per second for api client."})
+        return Response(200, json={"shop": {}})
+
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    opts.retry_on_status = []
+    opts.metrics = Metrics()
+    opts.concurrency = AdaptiveConcurrency(initial=4, maximum=5, slack=1000)
+    async with AsyncClient(sess, opts, transport=MockTransport(handler)) as c:
+        await asyncio.gather(*[c.rest("get", "/admin/api/shop.json") for _ in range(20)])
+
+    assert state["max"] <= 5
+    assert opts.concurrency.stats["cuts"] == {sess.domain: 1}
+    limit = opts.concurrency.limit(sess.domain)
+    assert opts.metrics.gauge("concurrency_limit", shop=sess.domain) == limit
+    assert f'basic_shopify_api_concurrency_limit{{shop="{sess.domain}"}}' in opts.metrics.export()
+
+
+@pytest.mark.parametrize("error, cut", [
+    (ConnectError("refused"), True),
+    (ReadTimeout("slow"), True),
+    (DeadlineExceeded("send", 100, 0), False),
+    (asyncio.CancelledError(), False),
+    (ValueError("bug"), False),
+])
+def test_slot_failures(error, cut):
+    limiter = AdaptiveConcurrency(initial=8, clock=Clock())
+    slot = ConcurrencySlot(limiter, "shop")
+    with pytest.raises(type(error)):
+        with slot:
+            slot.start()
+            raise error
+    # Only transport errors are congestion
+    assert limiter.limit("shop") == (4 if cut else 8)
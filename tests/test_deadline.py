@@ -0,0 +1,198 @@
+import pytest
+import asyncio
+import httpx
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, Deadline, DeadlineExceeded, PriorityScheduler, FairScheduler, \
+    VirtualDeferrer, CostEstimator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline():
+    clock = Clock()
+    deadline = Deadline(2, clock=clock)
+    clock.now = 500
+    assert deadline.remaining() == 1500
+    assert deadline.timeout() == 1.5
+    deadline.check(1000, "limiter_wait")
+    with pytest.raises(DeadlineExceeded) as error:
+        deadline.check(1500, "retry_sleep")
+    assert error.value.phase == "retry_sleep"
+    assert str(error.value) == "Deadline exceeded: retry_sleep needs 1500ms, 1500ms remaining"
+
+    clock.now = 3000
+    assert deadline.remaining() == 0
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout()
+    assert Deadline.of(None) is None
+    assert Deadline.of(deadline) is deadline
+
+
+def test_retry_sleep_over_deadline():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return Response(429, headers={"retry-after": "5.0"})
+
+    sess, opts = generate_opts_and_sess()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        with pytest.raises(DeadlineExceeded) as error:
+            c.rest("get", "/admin/api/shop.json", deadline=2)
+    assert error.value.phase == "retry_sleep"
+    # Failed straight away, without sleeping
+    assert len(calls) == 1
+
+
+def test_limiter_wait_over_deadline():
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 1
+    with Client(sess, opts, transport=MockTransport(lambda request: Response(200, json={"shop": {}}))) as c:
+        c.rest("get", "/admin/api/shop.json")
+        with pytest.raises(DeadlineExceeded) as error:
+            c.rest("get", "/admin/api/shop.json", deadline=0.1)
+    assert error.value.phase == "limiter_wait"
+
+
+def test_limiter_wait_over_deadline_keeps_window():
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 2
+    opts.deferrer = VirtualDeferrer()
+    with Client(sess, opts, transport=MockTransport(lambda request: Response(200, json={"shop": {}}))) as c:
+        c.rest("get", "/admin/api/shop.json")
+        c.rest("get", "/admin/api/shop.json")
+        with pytest.raises(DeadlineExceeded) as error:
+            c.rest("get", "/admin/api/shop.json", deadline=0.1)
+        assert error.value.phase == "limiter_wait"
+        assert len(opts.time_store.all(sess)) == 2
+
+        # The window still applies, the next call is spaced out
+        c.rest("get", "/admin/api/shop.json")
+    assert opts.deferrer.current_time() == 1000
+
+
+def test_cost_limit_over_deadline_releases_reservation():
+    sess, opts = generate_opts_and_sess()
+    opts.deferrer = VirtualDeferrer()
+    opts.cost_estimator = CostEstimator(restore_rate=1)
+    opts.cost_estimator.bucket(sess, 0).available = 0
+    with Client(sess, opts, transport=MockTransport(lambda request: Response(200, json={"data": {}}))) as c:
+        with pytest.raises(DeadlineExceeded) as error:
+            c.graphql("{ shop { name } }", deadline=0.1)
+    assert error.value.phase == "limiter_wait"
+    assert opts.cost_estimator.buckets[sess.domain].available == 0
+
+
+def test_deadline_on_deferrer_clock():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return Response(503, headers={"retry-after": "1.0"})
+
+    sess, opts = generate_opts_and_sess()
+    opts.deferrer = VirtualDeferrer()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        # Retry sleeps pass in virtual time, the second leaves no time for the call
+        with pytest.raises(DeadlineExceeded) as error:
+            c.rest("get", "/admin/api/shop.json", deadline=2)
+    assert error.value.phase == "retry_sleep"
+    assert error.value.remaining == 1000
+    assert len(calls) == 2
+
+
+def test_timeout_is_time_left():
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        return Response(200, json={"shop": {}})
+
+    sess, opts = generate_opts_and_sess()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        c.graphql("{ shop { name } }", deadline=2)
+    assert 1.5 < timeouts[0] <= 2
+
+
+@pytest.mark.asyncio
+async def test_async_timeout_over_deadline():
+    async def handler(request):
+        raise httpx.ReadTimeout("Timed out", request=request)
+
+    sess, opts = generate_opts_and_sess()
+    async with AsyncClient(sess, opts, transport=MockTransport(handler)) as c:
+        with pytest.raises(DeadlineExceeded) as error:
+            await c.rest("get", "/admin/api/shop.json", deadline=Deadline(1))
+    assert error.value.phase == "send"
+
+
+@pytest.mark.asyncio
+async def test_async_retry_within_deadline():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return Response(503, headers={"retry-after": "0.01"})
+        return Response(200, json={"shop": {}})
+
+    sess, opts = generate_opts_and_sess()
+    async with AsyncClient(sess, opts, transport=MockTransport(handler)) as c:
+        result = await asyncio.wait_for(c.rest("get", "/admin/api/shop.json", deadline=2), 1)
+    assert result.status[0] == 200
+    assert len(calls) == 2
+
+
+def test_positional_deadline():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return Response(503, headers={"retry-after": "0.01"})
+        return Response(200, json={"shop": {}})
+
+    sess, opts = generate_opts_and_sess()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        result = c.rest("get", "/admin/api/shop.json", None, {}, None, None, 2)
+    assert result.status[0] == 200
+    assert len(calls) == 2
+
+
+def test_queue_wait_over_deadline():
+    sess, opts = generate_opts_and_sess()
+    opts.scheduler = PriorityScheduler()
+    # Another caller holds the shop's turn
+    opts.scheduler.acquire(f"{sess.domain}:rest")
+    with Client(sess, opts, transport=MockTransport(lambda request: Response(200, json={"shop": {}}))) as c:
+        with pytest.raises(DeadlineExceeded) as error:
+            c.rest("get", "/admin/api/shop.json", deadline=0.05)
+        assert error.value.phase == "queue_wait"
+        assert opts.scheduler.waiting == 0
+
+        # The abandoned wait does not hold up the next caller
+        opts.scheduler.release(f"{sess.domain}:rest")
+        assert c.rest("get", "/admin/api/shop.json", deadline=1).status[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_async_slot_wait_over_deadline():
+    sess, opts = generate_opts_and_sess()
+    opts.fair_scheduler = FairScheduler(max_concurrency=1)
+    opts.fair_scheduler.acquire("other.myshopify.com")
+    async with AsyncClient(sess, opts, transport=MockTransport(lambda request: Response(200, json={"shop": {}}))) as c:
+        with pytest.raises(DeadlineExceeded) as error:
+            await c.rest("get", "/admin/api/shop.json", deadline=0.05)
+        assert error.value.phase == "slot_wait"
+
+        opts.fair_scheduler.release("other.myshopify.com")
+        result = await c.rest("get", "/admin/api/shop.json", deadline=1)
+    assert result.status[0] == 200
+    assert opts.fair_scheduler.inflight == 0
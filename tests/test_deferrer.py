@@ -0,0 +1,97 @@
+import pytest
+import asyncio
+import time
+from httpx import MockTransport, Response
+from basic_shopify_api import Client, AsyncClient, Options, Session, SleepDeferrer, VirtualDeferrer
+
+
+def test_sleep_deferrer_monotonic():
+    deferrer = SleepDeferrer()
+    first = deferrer.current_time()
+    deferrer.sleep(5)
+    second = deferrer.current_time()
+    assert isinstance(first, float)
+    assert 5 <= second - first < 1000
+    # Comparable to times stored by other processes
+    assert abs(second - time.time() * 1000) < 1000
+
+
+def test_virtual_sleep():
+    deferrer = VirtualDeferrer(start=1000)
+    deferrer.sleep(500)
+    deferrer.sleep(-1)
+    assert deferrer.current_time() == 1500
+
+
+@pytest.mark.asyncio
+async def test_virtual_asleep_concurrent():
+    deferrer = VirtualDeferrer()
+    woken = []
+
+    async def sleeper(name, length):
+        await deferrer.asleep(length)
+        woken.append((name, deferrer.current_time()))
+
+    started = time.monotonic()
+    await asyncio.gather(sleeper("long", 60000), sleeper("short", 500), sleeper("also", 500))
+    assert woken == [("short", 500), ("also", 500), ("long", 60000)]
+    # Sleeps overlap, like real time, without waiting
+    assert deferrer.current_time() == 60000
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_virtual_asleep_cancelled():
+    deferrer = VirtualDeferrer()
+    cancelled = asyncio.ensure_future(deferrer.asleep(10000))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await deferrer.asleep(100)
+    assert deferrer.current_time() == 100
+
+
+def make_options(deferrer):
+    opts = Options()
+    opts.deferrer = deferrer
+    return opts
+
+
+def handler(request):
+    return Response(200, json={"shop": {}})
+
+
+def test_virtual_rest_limit():
+    deferrer = VirtualDeferrer()
+    sess = Session("example.myshopify.com", "abc", "123")
+    started = time.monotonic()
+    with Client(sess, make_options(deferrer), transport=MockTransport(handler)) as c:
+        for _ in range(10):
+            c.rest("get", "/admin/api/shop.json")
+    # 2 calls a second, 4 waits of a second, in simulated time
+    assert deferrer.current_time() >= 4000
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_virtual_shops():
+    deferrer = VirtualDeferrer()
+    calls = {}
+
+    async def shop_handler(request):
+        # Simulated latency
+        await deferrer.asleep(100)
+        calls.setdefault(request.url.host, []).append(deferrer.current_time())
+        return Response(200, json={"shop": {}})
+
+    async def run(domain):
+        sess = Session(domain, "abc", "123")
+        async with AsyncClient(sess, make_options(deferrer), transport=MockTransport(shop_handler)) as c:
+            for _ in range(10):
+                await c.rest("get", "/admin/api/shop.json")
+
+    await asyncio.gather(*[run(f"shop-{index}.myshopify.com") for index in range(20)])
+    assert len(calls) == 20
+    # Shops are limited separately, all in the same simulated seconds
+    assert 4000 <= deferrer.current_time() < 6000
+    for times in calls.values():
+        assert all(later - earlier >= 100 for earlier, later in zip(times, times[1:]))
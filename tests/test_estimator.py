@@ -0,0 +1,115 @@
+import pytest
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess, local_server_session
+from basic_shopify_api import Client, CostEstimator, VirtualDeferrer
+from basic_shopify_api.estimator import fingerprint, static_cost, CostBucket
+
+
+def test_fingerprint():
+    assert fingerprint("{ shop { name } }") == fingerprint("{\n  shop {\n    name\n  }\n}")
+    assert fingerprint("{ a }", {"id": 1}) == fingerprint("{ a }", {"id": 2})
+    assert fingerprint("{ a }", {"id": 1}) != fingerprint("{ a }", {"id": "1"})
+
+
+def test_static_cost():
+    assert static_cost("{ shop { name } }") == 1
+    assert static_cost("{ products(first: 10) { edges { node { id title } } } }") == 12
+    query = """
+        query($n: Int) {
+            products(first: $n) {
+                edges { node { id variants(first: 5) { edges { node { id } } } } }
+                pageInfo { hasNextPage }
+            }
+        }
+    """
+    assert static_cost(query, {"n": 20}) == 162
+    assert static_cost("{ node(id: 1) { ... on Product { collections(last: 2) { nodes { id } } } } }") == 1 + 2 + 2 * 1
+    assert static_cost("mutation { productUpdate(input: {id: 1}) { product { id } } }") == 12
+
+
+def test_cost_bucket():
+    bucket = CostBucket(maximum=100, restore_rate=50, now=0)
+    assert bucket.reserve(60, 0) is False
+    assert bucket.reserve(60, 0) == 400.0
+    # Reservation is held, the next caller waits longer
+    assert bucket.reserve(10, 0) == 600.0
+    assert bucket.current(10000) == 100
+
+    bucket.settle({"maximumAvailable": 1000.0, "currentlyAvailable": 500, "restoreRate": 100.0}, 0)
+    assert bucket.current(1000) == 600
+
+
+def test_estimator_learns():
+    sess, _ = generate_opts_and_sess()
+    estimator = CostEstimator()
+    query = "{ products(first: 10) { edges { node { id } } } }"
+    assert estimator.estimate(query) == 12
+
+    body = {
+        "extensions": {
+            "cost": {
+                "requestedQueryCost": 15,
+                "actualQueryCost": 4,
+                "throttleStatus": {"maximumAvailable": 1000.0, "currentlyAvailable": 100, "restoreRate": 50.0},
+            }
+        }
+    }
+    estimator.record(sess, query, None, body, 0)
+    assert estimator.estimate(query) == 15
+    assert estimator.stats[fingerprint(query)].actual_mean == 4
+    assert estimator.reserve(sess, query, None, 0) is False
+    assert estimator.buckets[sess.domain].available == 85
+
+
+@pytest.mark.usefixtures("local_server")
+@local_server_session
+def test_graphql_cost_estimator():
+    sess, opts = generate_opts_and_sess()
+    opts.cost_estimator = CostEstimator()
+    with Client(sess, opts) as c:
+        c.graphql("{ shop { name } }")
+        assert opts.cost_estimator.stats[fingerprint("{ shop { name } }")].count == 1
+        assert opts.cost_estimator.buckets[sess.domain].available == 999
+
+        # The stores are reset before each call, not left to grow
+        for _ in range(3):
+            c.graphql("{ shop { name } }")
+        assert len(opts.time_store.all(sess)) == 1
+        assert len(opts.cost_store.all(sess)) == 1
+
+        # Bucket can not cover the predicted cost, limiting is required
+        opts.cost_estimator.buckets[sess.domain].available = 0
+        request = c._build_request("post", "/admin/api/graphql.json", {"query": "{ shop { name } }", "variables": None})
+        assert c._graphql_cost_limit_required(request) > 0
+
+
+def test_throttled_settles_bucket():
+    cost = {
+        "requestedQueryCost": 1,
+        "actualQueryCost": None,
+        "throttleStatus": {"maximumAvailable": 1000.0, "currentlyAvailable": 0, "restoreRate": 50.0},
+    }
+    responses = [
+        Response(200, json={"errors": [{"extensions": {"code": "THROTTLED"}}], "extensions": {"cost": cost}}),
+        Response(200, json={"data": {"shop": {}}, "extensions": {"cost": {
+            **cost,
+            "actualQueryCost": 1,
+            "throttleStatus": {**cost["throttleStatus"], "currentlyAvailable": 999},
+        }}}),
+    ]
+
+    sess, opts = generate_opts_and_sess()
+    opts.deferrer = VirtualDeferrer()
+    opts.cost_estimator = CostEstimator()
+    with Client(sess, opts, transport=MockTransport(lambda request: responses.pop(0))) as c:
+        result = c.graphql("{ shop { name } }")
+        assert result.errors is not None
+        # Settled to what Shopify reported, nothing learned from a call which did not run
+        assert opts.cost_estimator.buckets[sess.domain].available == 0
+        assert opts.cost_estimator.stats == {}
+
+        # The retry waits for the bucket to restore, then settles again
+        c.graphql("{ shop { name } }")
+    assert opts.deferrer.current_time() == 20
+    assert opts.cost_estimator.buckets[sess.domain].available == 999
+    assert opts.cost_estimator.stats[fingerprint("{ shop { name } }")].count == 1
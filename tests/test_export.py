@@ -0,0 +1,105 @@
+import io
+import json
+import pytest
+from httpx import MockTransport, Response
+from basic_shopify_api import Session
+from basic_shopify_api.__main__ import main
+from basic_shopify_api.export import ExportJob, load_sessions, shard, params_from, run
+
+# Products per shop
+CATALOG = {"small.myshopify.com": 3, "big.myshopify.com": 7}
+
+
+def handler(request):
+    shop = request.url.host
+    handler.requests.append(request)
+    if shop not in CATALOG:
+        return Response(401, json={"errors": "Invalid API key or access token"})
+
+    limit = int(request.url.params["limit"])
+    offset = int(request.url.params.get("page_info", 0))
+    products = [
+        {"id": index, "title": f"Product {index}", "vendor": shop}
+        for index in range(offset, min(offset + limit, CATALOG[shop]))
+    ]
+    headers = {}
+    if offset + limit < CATALOG[shop]:
+        url = f"https://{shop}/admin/api/2020-04/products.json?limit={limit}&page_info={offset + limit}"
+        headers["link"] = f'<{url}>; rel="next"'
+    return Response(200, json={"products": products}, headers=headers)
+
+
+def read(path):
+    with open(path) as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_load_sessions(tmp_path):
+    entries = [{"domain": "a.myshopify.com", "password": "token"}, {"domain": "b.myshopify.com", "key": "k"}]
+    listed = tmp_path / "shops.json"
+    listed.write_text(json.dumps(entries))
+    lines = tmp_path / "shops.ndjson"
+    lines.write_text("\n".join(json.dumps(entry) for entry in entries) + "\n")
+
+    for path in (listed, lines):
+        sessions = load_sessions(str(path))
+        assert [session.domain for session in sessions] == ["a.myshopify.com", "b.myshopify.com"]
+        assert sessions[0].password == "token"
+
+
+def test_shard():
+    sessions = [Session(f"{index}.myshopify.com") for index in range(5)]
+    shards = shard(sessions, 2)
+    assert [[session.domain[0] for session in group] for group in shards] == [["0", "2", "4"], ["1", "3"]]
+    # No empty shards when there are more processes than shops
+    assert len(shard(sessions, 8)) == 5
+
+
+def test_params_from():
+    assert params_from(["status=any", "created_at_min=2020-01-01T00:00:00"]) == {
+        "status": "any",
+        "created_at_min": "2020-01-01T00:00:00",
+    }
+
+
+def test_job():
+    job = ExportJob("/products/1/variants.json", "out")
+    assert job.path == "/admin/api/products/1/variants.json"
+    assert job.key == "variants"
+
+
+def test_export(tmp_path):
+    handler.requests = []
+    sessions = [Session(domain, "abc", "123") for domain in (*CATALOG, "gone.myshopify.com")]
+    job = ExportJob("products", str(tmp_path), params={"status": "active"}, fields=["id", "title"], limit=3)
+    job.rest_limit = 100
+    stream = io.StringIO()
+    results = {result["shop"]: result for result in run(sessions, job, 0, stream, transport=MockTransport(handler))}
+
+    assert results["small.myshopify.com"] == {"shop": "small.myshopify.com", "records": 3, "pages": 1, "error": None}
+    assert results["big.myshopify.com"]["records"] == 7
+    assert results["big.myshopify.com"]["pages"] == 3
+    assert results["gone.myshopify.com"]["error"].startswith("401")
+
+    big = read(tmp_path / "big.myshopify.com.ndjson")
+    assert [record["id"] for record in big] == list(range(7))
+    # Projected to the requested fields
+    assert big[0] == {"id": 0, "title": "Product 0"}
+    # Failed shops leave no file behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["big.myshopify.com.ndjson", "small.myshopify.com.ndjson"]
+
+    first, paged = [request for request in handler.requests if request.url.host == "big.myshopify.com"][:2]
+    assert first.url.params["status"] == "active"
+    assert first.url.params["fields"] == "id,title"
+    # Only limit and fields are sent with page_info
+    assert "status" not in paged.url.params
+    assert paged.url.params["page_info"] == "3"
+    assert paged.url.params["fields"] == "id,title"
+    assert "10 records" in stream.getvalue()
+
+
+def test_main_requires_command(capsys):
+    with pytest.raises(SystemExit):
+        main([])
+    with pytest.raises(SystemExit):
+        main(["export", "--resource", "products"])
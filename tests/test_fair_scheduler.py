@@ -0,0 +1,150 @@
+import pytest
+import asyncio
+from threading import Thread
+from httpx import MockTransport, Response
+from basic_shopify_api import Client, AsyncClient, Options, Session, FairScheduler
+
+
+async def admission_order(scheduler, holder, waiters):
+    """
+    Queue waiters (shop, priority) behind a held slot, then release it
+    and return the shops in the order they were let through.
+    """
+
+    order = []
+    await scheduler.aacquire(holder)
+
+    async def waiter(shop, priority):
+        await scheduler.aacquire(shop, priority)
+        order.append(shop)
+        scheduler.release(shop)
+
+    tasks = []
+    for shop, priority in waiters:
+        tasks.append(asyncio.ensure_future(waiter(shop, priority)))
+        await asyncio.sleep(0)
+    scheduler.release(holder)
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_fair_round_robin():
+    scheduler = FairScheduler(max_concurrency=1)
+    waiters = [("big", None)] * 4 + [("small", None)] * 2
+    order = await admission_order(scheduler, "big", waiters)
+    assert order == ["big", "small", "big", "small", "big", "big"]
+    assert scheduler.stats == {"inflight": 0, "waiting": 0, "shops_waiting": 0, "admitted": {"big": 5, "small": 2}}
+
+
+@pytest.mark.asyncio
+async def test_fair_weights():
+    scheduler = FairScheduler(max_concurrency=1, weights={"big": 2})
+    waiters = [("big", None)] * 4 + [("small", None)] * 2 + [("tiny", None)]
+    scheduler.set_weight("tiny", 0.5)
+    order = await admission_order(scheduler, "big", waiters)
+    # Tiny needs two turns to build up one call
+    assert order == ["big", "big", "small", "big", "big", "small", "tiny"]
+
+
+@pytest.mark.asyncio
+async def test_fair_priority_within_shop():
+    scheduler = FairScheduler(max_concurrency=1)
+    order = []
+    await scheduler.aacquire("shop")
+
+    async def waiter(name, priority):
+        await scheduler.aacquire("shop", priority)
+        order.append(name)
+        scheduler.release("shop")
+
+    tasks = [
+        asyncio.ensure_future(waiter("sync", "background")),
+        asyncio.ensure_future(waiter("admin", "interactive")),
+    ]
+    await asyncio.sleep(0)
+    scheduler.release("shop")
+    await asyncio.gather(*tasks)
+    assert order == ["admin", "sync"]
+
+
+@pytest.mark.asyncio
+async def test_fair_cancel():
+    scheduler = FairScheduler(max_concurrency=1)
+    await scheduler.aacquire("a")
+    cancelled = asyncio.ensure_future(scheduler.aacquire("b"))
+    waiting = asyncio.ensure_future(scheduler.aacquire("c"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    scheduler.release("a")
+    await asyncio.wait_for(waiting, 1)
+    scheduler.release("c")
+    assert scheduler.stats["inflight"] == 0
+    assert scheduler.queues == {}
+
+
+def test_fair_weight_check():
+    with pytest.raises(ValueError):
+        FairScheduler(weights={"shop": 0})
+    with pytest.raises(ValueError):
+        FairScheduler().set_weight("shop", -1)
+
+
+def make_options(scheduler):
+    opts = Options()
+    opts.rest_limit = 100
+    opts.fair_scheduler = scheduler
+    return opts
+
+
+def test_client_fair_scheduler():
+    scheduler = FairScheduler(max_concurrency=2)
+    state = {"inflight": 0, "max": 0}
+
+    def handler(request):
+        state["inflight"] += 1
+        state["max"] = max(state["max"], state["inflight"])
+        state["inflight"] -= 1
+        return Response(200, json={"shop": {}})
+
+    def run(domain):
+        sess = Session(domain, "abc", "123")
+        with Client(sess, make_options(scheduler), transport=MockTransport(handler)) as c:
+            for _ in range(5):
+                c.rest("get", "/admin/api/shop.json")
+
+    threads = [Thread(target=run, args=(f"shop-{index}.myshopify.com",)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state["max"] <= 2
+    assert scheduler.stats["inflight"] == 0
+    assert sorted(scheduler.admitted.values()) == [5, 5, 5, 5]
+
+
+@pytest.mark.asyncio
+async def test_async_client_fair_scheduler():
+    scheduler = FairScheduler(max_concurrency=1)
+    order = []
+
+    async def handler(request):
+        order.append(request.url.host)
+        await asyncio.sleep(0.001)
+        return Response(200, json={"shop": {}})
+
+    clients = [
+        AsyncClient(Session(domain, "abc", "123"), make_options(scheduler), transport=MockTransport(handler))
+        for domain in ("big.myshopify.com", "small.myshopify.com")
+    ]
+    calls = [clients[0].rest("get", "/admin/api/shop.json") for _ in range(4)]
+    calls += [clients[1].rest("get", "/admin/api/shop.json") for _ in range(2)]
+    results = await asyncio.gather(*calls)
+    for client in clients:
+        await client.aclose()
+
+    assert all(result.status[0] == 200 for result in results)
+    # The small shop is not stuck behind the big shop's backlog
+    assert order.index("small.myshopify.com") < 3
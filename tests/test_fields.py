@@ -0,0 +1,98 @@
+import pytest
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, ResponseCache
+from basic_shopify_api.utils import field_tree, project_fields
+
+PRODUCTS = [
+    {
+        "id": index,
+        "title": f"Product {index}",
+        "body_html": "<p>Long description</p>",
+        "variants": [{"id": index * 10, "price": "1.00", "sku": "SKU"}],
+    }
+    for index in range(1, 4)
+]
+
+
+def handler(request):
+    handler.requests.append(request)
+    # Like Shopify, only select the top-level fields
+    fields = request.url.params.get("fields")
+    products = [
+        {key: value for key, value in product.items() if fields is None or key in fields.split(",")}
+        for product in PRODUCTS
+    ]
+    return Response(200, json={"products": products}, headers={"etag": '"v1"'})
+
+
+def make_client(client_class=Client, **options):
+    handler.requests = []
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    for name, value in options.items():
+        setattr(opts, name, value)
+    return client_class(sess, opts, transport=MockTransport(handler))
+
+
+def test_field_tree():
+    assert field_tree(["id", "variants.id", "variants.price", ""]) == {
+        "id": None,
+        "variants": {"id": None, "price": None},
+    }
+    # The whole value wins over nested keys, in either order
+    assert field_tree(["variants", "variants.id"]) == {"variants": None}
+    assert field_tree(["variants.id", "variants"]) == {"variants": None}
+
+
+def test_project_fields():
+    body = {"products": PRODUCTS, "count": 3}
+    projected = project_fields(body, ["id", "variants.price", "missing"])
+    assert projected["count"] == 3
+    assert projected["products"][0] == {"id": 1, "variants": [{"price": "1.00"}]}
+    # Input is not modified
+    assert "title" in PRODUCTS[0]
+
+
+def test_rest_fields():
+    with make_client() as c:
+        result = c.rest("get", "/admin/api/products.json", {"limit": 3}, fields=["id", "variants.id"])
+        params = handler.requests[0].url.params
+        assert params["fields"] == "id,variants"
+        assert params["limit"] == "3"
+        assert result.body["products"][0] == {"id": 1, "variants": [{"id": 10}]}
+
+
+def test_rest_fields_merged():
+    with make_client() as c:
+        params = {"fields": "id", "page_info": "abc", "limit": 3}
+        result = c.rest("get", "/admin/api/products.json", params, fields="title")
+        sent = handler.requests[0].url.params
+        assert sent["fields"] == "id,title"
+        assert sent["page_info"] == "abc"
+        assert result.body["products"][0] == {"id": 1, "title": "Product 1"}
+        # Params passed in are not modified
+        assert params["fields"] == "id"
+
+
+def test_rest_fields_ignored_for_writes():
+    with make_client() as c:
+        c.rest("post", "/admin/api/products.json", {"product": {"title": "New"}}, fields=["id"])
+        assert "fields" not in handler.requests[0].url.params
+
+
+def test_rest_fields_cached():
+    with make_client(rest_cache=ResponseCache(ttl=60000)) as c:
+        first = c.rest("get", "/admin/api/products.json", fields=["id"])
+        second = c.rest("get", "/admin/api/products.json", fields=["id"])
+        assert len(handler.requests) == 1
+        assert second.cached is True
+        assert second.body == first.body == {"products": [{"id": 1}, {"id": 2}, {"id": 3}]}
+
+
+@pytest.mark.asyncio
+async def test_rest_fields_async():
+    async with make_client(AsyncClient) as c:
+        result = await c.rest("get", "/admin/api/products.json", fields=["title", "variants.sku"])
+        assert handler.requests[0].url.params["fields"] == "title,variants"
+        assert result.body["products"][2] == {"title": "Product 3", "variants": [{"sku": "SKU"}]}
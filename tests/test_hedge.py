@@ -0,0 +1,107 @@
+import pytest
+import asyncio
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import AsyncClient, Hedger
+from basic_shopify_api.hedge import path_template
+
+
+def test_path_template():
+    assert path_template("/admin/api/2020-04/products/1.json") == "/admin/api/2020-04/products/{id}.json"
+    assert path_template("/admin/api/2020-04/products/12/variants/34.json") == (
+        "/admin/api/2020-04/products/{id}/variants/{id}.json"
+    )
+    assert path_template("/admin/api/2020-04/shop.json") == "/admin/api/2020-04/shop.json"
+
+
+def test_delay():
+    hedger = Hedger(percentile=90, min_samples=10, min_delay=5)
+    for latency in range(1, 10):
+        hedger.observe("products", latency * 10)
+    assert hedger.delay("products") is None
+    hedger.observe("products", 100)
+    assert hedger.delay("products") == 100
+    assert hedger.delay("orders") is None
+
+    hedger = Hedger(min_samples=1, min_delay=5)
+    hedger.observe("shop", 1)
+    assert hedger.delay("shop") == 5
+
+    with pytest.raises(ValueError):
+        Hedger(percentile=100)
+
+
+def make_client(handler, rest_limit=100):
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = rest_limit
+    opts.hedger = Hedger(min_samples=1, min_delay=10)
+    opts.hedger.observe("/admin/api/2020-04/products/{id}.json", 10)
+    return AsyncClient(sess, opts, transport=MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins():
+    calls = {"sent": 0, "cancelled": 0}
+
+    async def handler(request):
+        calls["sent"] += 1
+        if calls["sent"] == 1:
+            try:
+                # Slow edge node
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                calls["cancelled"] += 1
+                raise
+        return Response(200, json={"product": {"id": 1}})
+
+    async with make_client(handler) as c:
+        result = await asyncio.wait_for(c.rest("get", "/admin/api/products/1.json"), 1)
+        assert result.body == {"product": {"id": 1}}
+        assert c.options.hedger.stats == {"calls": 1, "hedged": 1, "won": 1}
+        # The hedge took room in the rate budget
+        assert len(c.options.time_store.all(c.session)) == 2
+    assert calls == {"sent": 2, "cancelled": 1}
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_spare_budget():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return Response(200, json={"product": {"id": 1}})
+
+    async with make_client(handler, rest_limit=1) as c:
+        await c.rest("get", "/admin/api/products/1.json")
+        assert c.options.hedger.stats == {"calls": 1, "hedged": 0, "won": 0}
+
+
+@pytest.mark.asyncio
+async def test_only_gets_hedged():
+    sent = []
+
+    async def handler(request):
+        sent.append(request.method)
+        await asyncio.sleep(0.05)
+        return Response(200, json={"product": {"id": 1}})
+
+    async with make_client(handler) as c:
+        await c.rest("put", "/admin/api/products/1.json", {"product": {"title": "Shirt"}})
+        assert sent == ["PUT"]
+        assert c.options.hedger.stats["calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_call_loses():
+    calls = {"sent": 0}
+
+    async def handler(request):
+        calls["sent"] += 1
+        if calls["sent"] == 1:
+            await asyncio.sleep(0.05)
+            raise ConnectionError("Reset")
+        await asyncio.sleep(0.1)
+        return Response(200, json={"product": {"id": 1}})
+
+    async with make_client(handler) as c:
+        result = await c.rest("get", "/admin/api/products/1.json")
+        assert result.status[0] == 200
+        assert c.options.hedger.stats["won"] == 1
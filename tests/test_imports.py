@@ -0,0 +1,26 @@
+import subprocess
+import sys
+import pytest
+import basic_shopify_api
+
+
+def modules_after(statement):
+    output = subprocess.run(
+        [sys.executable, "-c", f"import sys; {statement}; print(' '.join(sys.modules))"],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout.decode("utf-8")
+    return output.split()
+
+
+def test_lazy_imports():
+    assert "httpx" not in modules_after("import basic_shopify_api")
+    assert "httpx" not in modules_after("from basic_shopify_api.utils import hmac_verify")
+    assert "httpx" in modules_after("from basic_shopify_api import Client")
+
+
+def test_lazy_attributes():
+    assert basic_shopify_api.Client is basic_shopify_api.clients.Client
+    assert "Options" in dir(basic_shopify_api)
+    with pytest.raises(AttributeError):
+        basic_shopify_api.Missing
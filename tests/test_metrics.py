@@ -0,0 +1,87 @@
+import json
+import pytest
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, Metrics
+from basic_shopify_api.constants import FIRST_BYTE_EXTENSION
+from basic_shopify_api.metrics import Histogram, throttled
+
+THROTTLE_STATUS = {"maximumAvailable": 1000.0, "currentlyAvailable": 250, "restoreRate": 50.0}
+
+
+def handler(request):
+    if request.url.path.endswith("graphql.json"):
+        query = json.loads(request.content)["query"]
+        if "throttled" in query:
+            return Response(200, json={"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}]})
+        cost = {"requestedQueryCost": 1, "actualQueryCost": 1, "throttleStatus": THROTTLE_STATUS}
+        return Response(200, json={"data": {"shop": {"name": "Shop"}}, "extensions": {"cost": cost}})
+    if request.headers.get("x-attempt") == "throttle" and not hasattr(handler, "throttled"):
+        handler.throttled = True
+        return Response(429, json={"errors": "Exceeded 2 calls per second for api client."})
+    return Response(200, json={"shop": {"name": "Shop"}})
+
+
+def test_histogram():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.cumulative() == [2, 3, 4]
+    assert histogram.sum == 56.5
+
+
+def test_throttled():
+    assert throttled(429, None)
+    assert throttled(200, [{"extensions": {"code": "THROTTLED"}}])
+    assert not throttled(200, [{"message": "oops"}])
+    assert not throttled(200, ValueError("oops"))
+
+
+def test_disabled():
+    sess, opts = generate_opts_and_sess()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        response = c.rest("get", "/admin/api/shop.json")
+        assert FIRST_BYTE_EXTENSION not in response.response.extensions
+        assert c._metrics_start() is None
+
+
+def test_metrics():
+    sess, opts = generate_opts_and_sess()
+    opts.metrics = Metrics()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        c.rest("get", "/admin/api/shop.json", headers={"x-attempt": "throttle"})
+        c.graphql("{ shop { name } }")
+        c.graphql("{ throttled }")
+
+    metrics = opts.metrics
+    assert metrics.count("requests", api="rest") == 2
+    assert metrics.count("requests", api="rest", status="429") == 1
+    assert metrics.count("throttled", shop=sess.domain) == 2
+    assert metrics.count("retries", api="rest") == 1
+    for phase in ("limiter_wait", "send", "first_byte", "body", "decode"):
+        assert metrics.histogram(phase, "rest").count == 2
+        assert metrics.histogram(phase, "graphql").count == 2
+    assert metrics.histogram("retry_sleep", "rest").count == 1
+    assert metrics.utilisation[(("api", "graphql"), ("shop", sess.domain))].sum == 0.75
+
+    exported = metrics.export()
+    assert "# TYPE basic_shopify_api_call_phase_seconds histogram" in exported
+    assert 'basic_shopify_api_call_phase_seconds_count{api="rest",phase="send"} 2' in exported
+    assert 'basic_shopify_api_call_phase_seconds_bucket{api="rest",phase="send",le="+Inf"} 2' in exported
+    assert 'basic_shopify_api_throttled_total{api="graphql",shop="example.myshopify.com"} 1' in exported
+    assert 'basic_shopify_api_budget_utilisation_bucket{api="graphql",shop="example.myshopify.com",le="0.75"} 1' \
+        in exported
+
+
+@pytest.mark.asyncio
+async def test_async_metrics():
+    sess, opts = generate_opts_and_sess()
+    opts.metrics = Metrics()
+    async with AsyncClient(sess, opts, transport=MockTransport(handler)) as c:
+        await c.graphql("{ shop { name } }")
+        await c.rest("get", "/admin/api/shop.json")
+
+    assert opts.metrics.histogram("first_byte", "graphql").count == 1
+    assert opts.metrics.histogram("body", "rest").count == 1
+    assert opts.metrics.count("requests", status="200") == 2
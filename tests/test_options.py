@@ -1,3 +1,5 @@
+import copy
+import pickle
 import pytest
 from basic_shopify_api import Options
 
@@ -34,3 +36,35 @@ def test_options_failed_type():
     with pytest.raises(ValueError):
         opts = Options()
         opts.mode = "oops"
+
+
+def test_options_revision():
+    opts = Options()
+    revision = opts.revision
+    opts.rest_limit = 4
+    assert opts.revision == revision + 1
+
+    # Headers changes count too, even when replaced
+    opts.headers["X-Extra"] = "1"
+    opts.headers.update({"X-Other": "2"})
+    opts.headers.pop("X-Other")
+    assert opts.revision == revision + 4
+    opts.headers = {"Accept": "application/json"}
+    opts.headers.setdefault("X-Extra", "1")
+    assert opts.revision == revision + 6
+    assert dict(opts.headers) == {"Accept": "application/json", "X-Extra": "1"}
+
+
+@pytest.mark.parametrize("clone", [copy.copy, copy.deepcopy, lambda opts: pickle.loads(pickle.dumps(opts))])
+def test_options_copy(clone):
+    opts = Options()
+    opts.headers["X-Extra"] = "1"
+    cloned = clone(opts)
+    assert cloned.revision == opts.revision
+    assert dict(cloned.headers) == dict(opts.headers)
+
+    # The clone's headers count against the clone only
+    cloned.headers["X-Other"] = "2"
+    assert cloned.revision == opts.revision + 1
+    assert "X-Other" not in opts.headers
+    assert type(copy.deepcopy(opts.headers)) is dict
@@ -0,0 +1,107 @@
+import json
+import time
+from threading import Event, Thread
+from basic_shopify_api import Options, Session, CostEstimator, LimiterSnapshot
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Deferrer:
+    def __init__(self, now):
+        self.now = now
+
+    def current_time(self):
+        return self.now
+
+
+def make_options(now):
+    opts = Options()
+    opts.deferrer = Deferrer(now)
+    opts.cost_estimator = CostEstimator()
+    return opts
+
+
+def test_save_and_restore(tmp_path):
+    path = str(tmp_path / "limiter.json")
+    session = Session("example.myshopify.com")
+    opts = make_options(10000)
+    opts.time_store.append(session, 9500)
+    opts.time_store.append(session, 9900)
+    opts.time_store.reset(Session("idle.myshopify.com"))
+    opts.cost_store.append(session, 400)
+    bucket = opts.cost_estimator.bucket(session, 9000)
+    bucket.settle({"maximumAvailable": 1000, "currentlyAvailable": 100, "restoreRate": 50}, 9000)
+
+    wall = Clock(1000.0)
+    LimiterSnapshot(path, opts, wall_clock=wall).save()
+    with open(path) as handle:
+        state = json.load(handle)
+    assert state["times"] == {"example.myshopify.com": [500, 100]}
+    assert "idle.myshopify.com" not in state["times"]
+
+    # Restarted 2 seconds later, with a new clock origin
+    wall.now = 1002.0
+    restored = make_options(50)
+    assert LimiterSnapshot(path, restored, wall_clock=wall).load() is True
+    assert restored.time_store.all(session) == [50 - 500 - 2000, 50 - 100 - 2000]
+    assert restored.cost_store.all(session) == [400]
+    # 3 seconds since throttleStatus, 150 points restored
+    assert restored.cost_estimator.bucket(session, 50).current(50) == 250
+
+
+def test_load_missing_or_corrupt(tmp_path):
+    opts = make_options(0)
+    assert LimiterSnapshot(str(tmp_path / "missing.json"), opts).load() is False
+    corrupt = tmp_path / "corrupt.json"
+    corrupt.write_text("{")
+    assert LimiterSnapshot(str(corrupt), opts).load() is False
+    corrupt.write_text(json.dumps({"version": 0}))
+    assert LimiterSnapshot(str(corrupt), opts).load() is False
+
+
+def test_periodic_and_shutdown(tmp_path):
+    path = tmp_path / "limiter.json"
+    opts = make_options(1000)
+    with LimiterSnapshot(str(path), opts, interval=0.01):
+        opts.time_store.append(Session("example.myshopify.com"), 990)
+    assert json.loads(path.read_text())["times"] == {"example.myshopify.com": [10]}
+    assert not (tmp_path / "limiter.json.part").exists()
+
+
+def test_periodic_save_failure(tmp_path, caplog):
+    path = tmp_path / "missing" / "limiter.json"
+    snapshot = LimiterSnapshot(str(path), make_options(1000), interval=0.01)
+    snapshot.start(at_exit=False)
+    time.sleep(0.05)
+    # Failed saves are logged, and saving carries on
+    assert snapshot.thread.is_alive()
+    assert "Saving limiter snapshot" in caplog.text
+    (tmp_path / "missing").mkdir()
+    time.sleep(0.05)
+    assert path.exists()
+    snapshot.stop()
+
+
+def test_snapshot_while_shops_are_added():
+    opts = make_options(1000)
+    snapshot = LimiterSnapshot("unused", opts)
+    done = Event()
+
+    def add_shops():
+        for index in range(20000):
+            opts.time_store.append(Session(f"shop-{index}.myshopify.com"), 990)
+            opts.cost_store.append(Session(f"shop-{index}.myshopify.com"), 10)
+        done.set()
+
+    thread = Thread(target=add_shops)
+    thread.start()
+    while not done.is_set():
+        snapshot.snapshot()
+    thread.join()
+    assert len(snapshot.snapshot()["times"]) == 20000
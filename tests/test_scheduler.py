@@ -0,0 +1,156 @@
+import pytest
+import asyncio
+from threading import Thread
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, PriorityScheduler
+from basic_shopify_api.scheduler import priority_class, INTERACTIVE, DEFAULT, BACKGROUND
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def wait_for(scheduler, waiting):
+    while scheduler.waiting < waiting:
+        pass
+
+
+def run_waiters(scheduler, clock, waiters):
+    """
+    Queue waiters (name, priority, time queued) behind a held turn, then release it
+    and return the order they were let through.
+    """
+
+    order = []
+    scheduler.acquire("shop")
+
+    def waiter(name, priority):
+        scheduler.acquire("shop", priority)
+        order.append(name)
+        scheduler.release("shop")
+
+    threads = []
+    for name, priority, queued_at in waiters:
+        clock.now = queued_at
+        thread = Thread(target=waiter, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        wait_for(scheduler, len(threads))
+    scheduler.release("shop")
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_priority_class():
+    assert priority_class(None) == DEFAULT
+    assert priority_class("interactive") == INTERACTIVE
+    assert priority_class("background") == BACKGROUND
+    assert priority_class(5) == 5
+    with pytest.raises(ValueError):
+        priority_class("urgent")
+
+
+def test_scheduler_priority():
+    clock = Clock()
+    scheduler = PriorityScheduler(ageing=2000, clock=clock)
+    order = run_waiters(scheduler, clock, [
+        ("background", "background", 0),
+        ("default", None, 10),
+        ("interactive", "interactive", 20),
+        ("interactive-2", "interactive", 30),
+    ])
+    assert order == ["interactive", "interactive-2", "default", "background"]
+    assert scheduler.stats == {"admitted": {DEFAULT: 2, BACKGROUND: 1, INTERACTIVE: 2}, "waiting": 0}
+    assert scheduler.queues == {}
+
+
+def test_scheduler_ageing():
+    clock = Clock()
+    scheduler = PriorityScheduler(ageing=2000, clock=clock)
+    # Waited over two classes worth, goes before the newer interactive call
+    order = run_waiters(scheduler, clock, [
+        ("background", "background", 0),
+        ("interactive", "interactive", 5000),
+    ])
+    assert order == ["background", "interactive"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_async_cancel():
+    scheduler = PriorityScheduler()
+    await scheduler.aacquire("shop")
+    cancelled = asyncio.ensure_future(scheduler.aacquire("shop", "interactive"))
+    waiting = asyncio.ensure_future(scheduler.aacquire("shop", "background"))
+    await asyncio.sleep(0)
+    assert scheduler.waiting == 2
+
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    scheduler.release("shop")
+    await asyncio.wait_for(waiting, 1)
+    assert scheduler.waiting == 0
+    scheduler.release("shop")
+    assert scheduler.queues == {}
+
+
+def test_client_priority():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.params.get("name"))
+        return Response(200, json={"shop": {}})
+
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    opts.scheduler = PriorityScheduler()
+    with Client(sess, opts, transport=MockTransport(handler)) as c:
+        key = f"{sess.domain}:rest"
+        opts.scheduler.acquire(key)
+
+        def call(name, priority):
+            c.rest("get", "/admin/api/shop.json", {"name": name}, priority=priority)
+
+        threads = []
+        for name, priority in (("sync", "background"), ("admin", "interactive")):
+            thread = Thread(target=call, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            wait_for(opts.scheduler, len(threads))
+        opts.scheduler.release(key)
+        for thread in threads:
+            thread.join()
+
+    assert requests == ["admin", "sync"]
+
+
+@pytest.mark.asyncio
+async def test_async_client_priority():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.params.get("name") or "graphql")
+        return Response(200, json={"shop": {}})
+
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    opts.scheduler = PriorityScheduler()
+    async with AsyncClient(sess, opts, transport=MockTransport(handler)) as c:
+        key = f"{sess.domain}:rest"
+        await opts.scheduler.aacquire(key)
+        calls = [
+            asyncio.ensure_future(c.rest("get", "/admin/api/shop.json", {"name": "sync"}, priority="background")),
+            asyncio.ensure_future(c.rest("get", "/admin/api/shop.json", {"name": "admin"}, priority="interactive")),
+        ]
+        await asyncio.sleep(0.01)
+        # GraphQL has its own turn, it is not held up by REST
+        await c.graphql("{ shop { name } }", priority="interactive")
+        opts.scheduler.release(key)
+        await asyncio.gather(*calls)
+
+    assert requests == ["graphql", "admin", "sync"]
@@ -0,0 +1,146 @@
+import pytest
+import json
+import re
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, QuerySplitter
+from basic_shopify_api.models import ApiResult
+from basic_shopify_api.splitter import max_cost_exceeded, TRUNCATED_ERROR
+
+QUERY = "{ shop { products(first: 20) { edges { node { id } } } } }"
+PRODUCTS = [f"gid://shopify/Product/{i}" for i in range(15)]
+
+
+def shopify_handler(request):
+    # Products connection costing 2 + first, with a max cost of 10
+    payload = json.loads(request.content)
+    first = int(re.search(r"first\s*:\s*(\d+)", payload["query"]).group(1))
+    after = re.search(r'after\s*:\s*"(\d+)"', payload["query"])
+    cost = 1 + 2 + first
+    if cost > 10:
+        error = {"message": "Too expensive", "extensions": {"code": "MAX_COST_EXCEEDED", "cost": cost, "maxCost": 10}}
+        return Response(200, json={"errors": [error]})
+
+    start = int(after.group(1)) + 1 if after else 0
+    nodes = PRODUCTS[start:start + first]
+    end = start + len(nodes) - 1
+    return Response(200, json={
+        "data": {
+            "shop": {
+                "products": {
+                    "pageInfo": {"hasNextPage": end < len(PRODUCTS) - 1, "endCursor": str(end)},
+                    "edges": [{"node": {"id": node}} for node in nodes],
+                }
+            }
+        }
+    })
+
+
+def test_max_cost_exceeded():
+    error = {"extensions": {"code": "MAX_COST_EXCEEDED", "cost": 2004, "maxCost": 1000}}
+    assert max_cost_exceeded(ApiResult(response=None, status=200, body=None, errors=[error])) == (2004, 1000)
+    assert max_cost_exceeded(ApiResult(response=None, status=200, body=None, errors="Not found")) is None
+
+
+def test_plan():
+    splitter = QuerySplitter(max_cost=100)
+    query = "{ products(first: 50) { edges { node { variants(first: 10) { nodes { id } } } } } }"
+    # 2 + 50 * (1 + 2 + 10) = 652
+    plan = splitter.plan(query, None, 652)
+    assert plan.page_size == 7
+    page, _ = plan.page("abc")
+    assert "first : 7 after : \"abc\"" in page
+    assert "pageInfo { hasNextPage endCursor }" in page
+
+    # Even one product is too big, nested variants are reduced
+    plan = splitter.plan(query, None, 652, 10)
+    assert plan.page_size == 1
+    assert plan.sizes[plan.connections[1].size_index] == 5
+
+    assert splitter.plan("{ shop { name } }", None, 2000) is None
+
+
+def test_split_on_error():
+    sess, opts = generate_opts_and_sess()
+    opts.query_splitter = QuerySplitter()
+    with Client(sess, opts, transport=MockTransport(shopify_handler)) as c:
+        response = c.graphql(QUERY)
+        assert response.errors is None
+        edges = response.body["data"]["shop"]["products"]["edges"]
+        assert [edge["node"]["id"] for edge in edges] == PRODUCTS
+        assert opts.query_splitter.splits == 1
+
+
+def test_split_predicted():
+    sess, opts = generate_opts_and_sess()
+    opts.query_splitter = QuerySplitter(max_cost=10)
+    with Client(sess, opts, transport=MockTransport(shopify_handler)) as c:
+        response = c.graphql("{ shop { products(first: 12) { edges { node { id } } } } }")
+        assert len(response.body["data"]["shop"]["products"]["edges"]) == 12
+
+
+def nested_handler(variants):
+    # Two products, each with a number of variants
+    def handler(request):
+        payload = json.loads(request.content)
+        first, nested = [int(size) for size in re.findall(r"first\s*:\s*(\d+)", payload["query"])]
+        after = re.search(r'after\s*:\s*"(\d+)"', payload["query"])
+        start = int(after.group(1)) + 1 if after else 0
+        ids = range(start, min(start + first, 2))
+        variant = {"pageInfo": {"hasNextPage": variants > nested}, "nodes": [{"id": i} for i in range(min(variants, nested))]}
+        return Response(200, json={
+            "data": {
+                "products": {
+                    "pageInfo": {"hasNextPage": ids[-1] < 1, "endCursor": str(ids[-1])},
+                    "edges": [{"node": {"id": i, "variants": variant}} for i in ids],
+                }
+            }
+        })
+    return handler
+
+
+def test_split_nested_truncated():
+    query = "{ products(first: 2) { edges { node { id variants(first: 10) { nodes { id } } } } } }"
+    sess, opts = generate_opts_and_sess()
+    opts.query_splitter = QuerySplitter(max_cost=10)
+    with Client(sess, opts, transport=MockTransport(nested_handler(7))) as c:
+        response = c.graphql(query)
+    # Variants were reduced to 5, the data is returned with an error for what was left out
+    edges = response.body["data"]["products"]["edges"]
+    assert [len(edge["node"]["variants"]["nodes"]) for edge in edges] == [5, 5]
+    assert response.errors[0]["extensions"] == {"code": TRUNCATED_ERROR, "paths": ["products.edges.node.variants"]}
+
+    # Reduced, but every variant still fit
+    with Client(sess, opts, transport=MockTransport(nested_handler(4))) as c:
+        response = c.graphql(query)
+    assert response.errors is None
+    assert len(response.body["data"]["products"]["edges"]) == 2
+
+
+def test_split_null_parent():
+    sess, opts = generate_opts_and_sess()
+    opts.query_splitter = QuerySplitter(max_cost=10)
+    with Client(sess, opts, transport=MockTransport(lambda request: Response(200, json={"data": {"shop": None}}))) as c:
+        response = c.graphql("{ shop { products(first: 12) { edges { node { id } } } } }")
+    assert response.errors is None
+    assert response.body == {"data": {"shop": None}}
+
+
+def test_stitch_null_last_page():
+    plan = QuerySplitter(max_cost=10).plan("{ shop { products(first: 12) { edges { node { id } } } } }", None, 15)
+    page = {"data": {"shop": {"products": {"pageInfo": {"hasNextPage": True}, "edges": [{"node": {"id": "1"}}]}}}}
+    results = [
+        ApiResult(response=None, status=200, body=page, errors=None),
+        ApiResult(response=None, status=200, body={"data": {"shop": None}}, errors=None),
+    ]
+    stitched = plan.stitch(results)
+    assert stitched.body["data"]["shop"]["products"]["edges"] == [{"node": {"id": "1"}}]
+
+
+@pytest.mark.asyncio
+async def test_async_split_on_error():
+    sess, opts = generate_opts_and_sess()
+    opts.query_splitter = QuerySplitter()
+    async with AsyncClient(sess, opts, transport=MockTransport(shopify_handler)) as c:
+        response = await c.graphql(QUERY)
+        assert len(response.body["data"]["shop"]["products"]["edges"]) == 15
@@ -0,0 +1,230 @@
+import json
+import pytest
+from httpx import MockTransport, Response
+from .utils import generate_opts_and_sess
+from basic_shopify_api import Client, AsyncClient, RestSync, GraphQLSync, MemoryCheckpointStore, SqliteCheckpointStore
+from basic_shopify_api.sync import Checkpoint, SyncError, latest, parse_time
+
+
+class Shop:
+    """
+    Products with updated_at times, in ID order (as REST returns them), paged by offset cursors.
+    """
+
+    def __init__(self, count):
+        self.products = [
+            {"id": index, "title": f"Product {index}", "updated_at": f"2020-04-01T00:00:{index:02d}-04:00"}
+            for index in range(count)
+        ]
+        self.requests = []
+        self.fail_cursor = False
+
+    def update(self, index, title, second):
+        self.products[index].update(title=title, updated_at=f"2020-04-01T00:01:{second:02d}-04:00")
+
+    def handler(self, request):
+        self.requests.append(request)
+        params = request.url.params
+        if "page_info" in params and self.fail_cursor:
+            return Response(400, json={"errors": {"page_info": "Invalid value."}})
+
+        since = params.get("updated_at_min")
+        products = [
+            product for product in self.products
+            if since is None or parse_time(product["updated_at"]) >= parse_time(since)
+        ]
+        offset = int(params.get("page_info", 0))
+        limit = int(params["limit"])
+        headers = {}
+        if offset + limit < len(products):
+            url = f"https://example.myshopify.com/admin/api/2020-04/products.json?page_info={offset + limit}"
+            headers["link"] = f'<{url}>; rel="next"'
+        return Response(200, json={"products": products[offset:offset + limit]}, headers=headers)
+
+
+def clock_at(value):
+    # Clock for a sync, settable by ISO time
+    now = [parse_time(value).timestamp()]
+
+    def clock():
+        return now[0]
+
+    clock.set = lambda value: now.__setitem__(0, parse_time(value).timestamp())
+    return clock
+
+
+def make_client(shop, client_class=Client):
+    sess, opts = generate_opts_and_sess()
+    opts.rest_limit = 100
+    return client_class(sess, opts, transport=MockTransport(shop.handler))
+
+
+def test_latest():
+    assert latest(None, "2020-04-01T00:00:00Z") == "2020-04-01T00:00:00Z"
+    assert latest("2020-04-01T00:00:00-04:00", "2020-04-01T03:00:00Z") == "2020-04-01T00:00:00-04:00"
+    assert latest(None, None) is None
+
+
+def test_rest_sync_incremental():
+    shop = Shop(5)
+    store = MemoryCheckpointStore()
+    clock = clock_at("2020-04-01T04:00:10Z")
+    sync = RestSync(store, "products", limit=2, overlap=5, clock=clock)
+    handled = []
+    with make_client(shop) as c:
+        stats = sync.run(c, handled.extend)
+        assert stats.as_dict() == {"resumed": False, "pages": 3, "records": 5, "changed": 5, "skipped": 0}
+        checkpoint = store.load(c.session.domain, "products")
+        # Start of the run, less the overlap
+        assert checkpoint.high_water == "2020-04-01T04:00:05Z"
+        assert checkpoint.cursor is None
+
+        # Nothing changed since the run started
+        shop.requests.clear()
+        clock.set("2020-04-01T04:01:00Z")
+        stats = sync.run(c, handled.extend)
+        assert shop.requests[0].url.params["updated_at_min"] == "2020-04-01T04:00:05Z"
+        assert stats.as_dict() == {"resumed": False, "pages": 1, "records": 0, "changed": 0, "skipped": 0}
+
+        shop.update(1, "Renamed", 30)
+        clock.set("2020-04-01T04:02:00Z")
+        stats = sync.run(c, handled.extend)
+        assert stats.changed == 1
+        assert handled[-1]["title"] == "Renamed"
+        assert store.load(c.session.domain, "products").high_water == "2020-04-01T04:01:55Z"
+    assert len(handled) == 6
+
+
+def test_rest_sync_updated_mid_run():
+    shop = Shop(4)
+    store = MemoryCheckpointStore()
+    clock = clock_at("2020-04-01T04:00:10Z")
+    sync = RestSync(store, "products", limit=2, overlap=0, clock=clock)
+    handled = []
+
+    def update_during_run(records):
+        if not handled:
+            # Product 0's page was already fetched, product 3's was not
+            shop.update(0, "Late", 20)
+            shop.update(3, "Later", 25)
+        handled.extend(records)
+
+    with make_client(shop) as c:
+        sync.run(c, update_during_run)
+        assert [record["title"] for record in handled] == ["Product 0", "Product 1", "Product 2", "Later"]
+
+        # Older than the latest updated at seen (product 3), but still picked up by the next run
+        clock.set("2020-04-01T04:02:00Z")
+        stats = sync.run(c, handled.extend)
+        assert stats.as_dict() == {"resumed": False, "pages": 1, "records": 2, "changed": 1, "skipped": 1}
+        assert handled[-1]["title"] == "Late"
+
+
+def test_rest_sync_resume():
+    shop = Shop(6)
+    store = MemoryCheckpointStore()
+    sync = RestSync(store, "products", params={"status": "any"}, limit=2)
+    handled = []
+
+    def crash_on_second_page(records):
+        if handled:
+            raise RuntimeError("Writer down")
+        handled.extend(records)
+
+    with make_client(shop) as c:
+        with pytest.raises(RuntimeError):
+            sync.run(c, crash_on_second_page)
+        checkpoint = store.load(c.session.domain, "products")
+        assert checkpoint.cursor == "2"
+
+        shop.requests.clear()
+        stats = sync.run(c, handled.extend)
+        assert stats.resumed is True
+        assert shop.requests[0].url.params["page_info"] == "2"
+        assert "status" not in shop.requests[0].url.params
+        assert stats.records == 4
+    assert [record["id"] for record in handled] == list(range(6))
+
+
+def test_rest_sync_expired_cursor():
+    shop = Shop(4)
+    store = MemoryCheckpointStore()
+    sync = RestSync(store, "products", limit=2)
+    with make_client(shop) as c:
+        store.save(c.session.domain, "products", Checkpoint(cursor="2"), {})
+        shop.fail_cursor = True
+        with pytest.raises(SyncError):
+            # Restarts from the start of the run, then fails on the next page's cursor
+            sync.run(c, lambda records: None)
+        assert "page_info" not in shop.requests[1].url.params
+
+
+def test_sqlite_store(tmp_path):
+    path = str(tmp_path / "sync.db")
+    store = SqliteCheckpointStore(path)
+    checkpoint = Checkpoint(high_water="2020-04-01T00:00:00Z", cursor="abc")
+    store.save("shop", "products", checkpoint, {str(index): f"digest-{index}" for index in range(1200)})
+    store.close()
+
+    store = SqliteCheckpointStore(path)
+    assert store.load("shop", "products").as_dict() == checkpoint.as_dict()
+    assert store.load("shop", "orders") is None
+    found = store.digests("shop", "products", [str(index) for index in range(0, 1500, 100)])
+    assert found == {str(index): f"digest-{index}" for index in range(0, 1200, 100)}
+
+    store.reset("shop", "products")
+    assert store.load("shop", "products") is None
+    assert len(store.digests("shop", "products", ["1"])) == 1
+    store.reset("shop", "products", digests=True)
+    assert store.digests("shop", "products", ["1"]) == {}
+    store.close()
+
+
+QUERY = """
+query ($first: Int!, $after: String, $query: String) {
+    products(first: $first, after: $after, query: $query) {
+        pageInfo { hasNextPage endCursor }
+        edges { node { id title updatedAt } }
+    }
+}
+"""
+
+
+@pytest.mark.asyncio
+async def test_graphql_sync_async():
+    nodes = [
+        {"id": f"gid://shopify/Product/{index}", "title": f"Product {index}", "updatedAt": f"2020-04-01T04:00:0{index}Z"}
+        for index in range(3)
+    ]
+    variables = []
+
+    def handler(request):
+        variables.append(json.loads(request.content)["variables"])
+        after = int(variables[-1]["after"] or 0)
+        page = nodes[after:after + 2]
+        connection = {
+            "pageInfo": {"hasNextPage": after + 2 < len(nodes), "endCursor": str(after + 2)},
+            "edges": [{"node": node} for node in page],
+        }
+        return Response(200, json={"data": {"products": connection}})
+
+    sess, opts = generate_opts_and_sess()
+    store = MemoryCheckpointStore()
+    sync = GraphQLSync(
+        store, "products", QUERY, search="status:active", first=2, overlap=0, clock=clock_at("2020-04-01T04:00:05Z")
+    )
+    handled = []
+
+    async def write(records):
+        handled.extend(records)
+
+    async with AsyncClient(sess, opts, transport=MockTransport(handler)) as c:
+        stats = await sync.arun(c, write)
+        assert stats.records == 3
+        assert variables[0] == {"first": 2, "after": None, "query": "status:active"}
+        assert variables[1]["after"] == "2"
+
+        await sync.arun(c, write)
+        assert variables[2]["query"] == "updated_at:>='2020-04-01T04:00:05Z' AND status:active"
+    # Second run had nothing changed
+    assert len(handled) == 3
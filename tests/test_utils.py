@@ -1,5 +1,5 @@
 import pytest
-from basic_shopify_api.utils import hmac_verify
+from basic_shopify_api.utils import hmac_verify, hmac_verifier, verify_webhooks, is_mutation
 
 
 def test_hmac_verify_oauth():
@@ -30,3 +30,50 @@ def test_hmac_verify_webhook():
     # From Shopify docs: Webhook
     hmac_header_value = "b/rWdZdcB2yqHc0eitdWqmRDdepHw4phdZNa68NHBSY="
     assert hmac_verify("webhook", "hush", '{"xyz":"123"}', hmac_header_value) is True
+
+
+def test_hmac_verifier_webhook():
+    verifier = hmac_verifier("hush")
+    hmac_header_value = "b/rWdZdcB2yqHc0eitdWqmRDdepHw4phdZNa68NHBSY="
+    assert verifier is hmac_verifier("hush")
+    assert verifier.webhook(b'{"xyz":"123"}', hmac_header_value) is True
+    assert verifier.webhook([b'{"xyz"', b':"123"}'], hmac_header_value.encode("utf-8")) is True
+    assert verifier.webhook(b'{"xyz":"124"}', hmac_header_value) is False
+
+
+def test_hmac_verifier_params_untouched():
+    query_string = {
+        "code": "0907a61c0c8d55e99db179b68161bc00",
+        "hmac": "700e2dadb827fcc8609e9d5ce208b2e9cdaab9df07390d2cbca10d7c328fc4bf",
+        "shop": "some-shop.myshopify.com",
+        "state": "0.6784241404160823",
+        "timestamp": "1337178173",
+    }
+    assert hmac_verify("standard", "hush", query_string) is True
+    assert hmac_verify("standard", "hush", query_string) is True
+    assert "hmac" in query_string
+    assert hmac_verifier("hush").standard({"shop": "some-shop.myshopify.com"}) is False
+
+
+def test_verify_webhooks():
+    hmac_header_value = "b/rWdZdcB2yqHc0eitdWqmRDdepHw4phdZNa68NHBSY="
+    webhooks = [(b'{"xyz":"123"}', hmac_header_value), ('{"xyz":"123"}', "invalid")] * 3
+    assert verify_webhooks("hush", webhooks, max_workers=2) == [True, False] * 3
+
+
+def test_hmac_verify_invalid_source():
+    with pytest.raises(ValueError):
+        hmac_verify("oops", "hush", {})
+
+
+def test_is_mutation():
+    assert is_mutation("mutation { productDelete(input: {}) { deletedProductId } }") is True
+    assert is_mutation("{ shop { name } }") is False
+    assert is_mutation("query Shop($a: Int = 1) { shop { name } }") is False
+
+    # Fragments may come before the operation
+    fragment = "fragment Fields on Product { id title }"
+    mutation = "mutation ($input: ProductInput!) { productUpdate(input: $input) { product { ...Fields } } }"
+    assert is_mutation(f"{fragment} {mutation}") is True
+    assert is_mutation(f"{fragment} query {{ product(id: 1) {{ ...Fields }} }}") is False
+    assert is_mutation('fragment mutation on Mutation { id } query { shop { name } }') is False
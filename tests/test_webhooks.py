@@ -0,0 +1,166 @@
+import io
+import pytest
+from threading import Event
+from basic_shopify_api import WebhookReceiver, MemoryIdempotencyIndex, DiskIdempotencyIndex
+from basic_shopify_api.utils import create_hmac
+
+SECRET = "secret"
+BODY = b'{"id": 1, "title": "Product"}'
+
+
+def headers_for(body=BODY, webhook_id="abc"):
+    return {
+        "X-Shopify-Hmac-Sha256": create_hmac(data=body, encode=True, secret=SECRET).decode("utf-8"),
+        "X-Shopify-Webhook-Id": webhook_id,
+        "X-Shopify-Topic": "products/update",
+        "X-Shopify-Shop-Domain": "example.myshopify.com",
+    }
+
+
+def test_receive():
+    handled = []
+    with WebhookReceiver(SECRET, handled.append, workers=2) as receiver:
+        assert receiver.receive(BODY, headers_for())[0] == 200
+        # Shopify's retry of the same webhook
+        assert receiver.receive(BODY, headers_for())[0] == 200
+        assert receiver.receive(BODY, {**headers_for(), "X-Shopify-Hmac-Sha256": "bad"})[0] == 401
+        receiver.join()
+
+    assert len(handled) == 1
+    assert handled[0].topic == "products/update"
+    assert handled[0].shop_domain == "example.myshopify.com"
+    assert handled[0].json()["title"] == "Product"
+    metrics = receiver.metrics
+    assert metrics["received"] == 3
+    assert metrics["accepted"] == 1
+    assert metrics["duplicates"] == 1
+    assert metrics["rejected"] == 1
+    assert metrics["handled"] == 1
+    assert metrics["ack_latency"]["count"] == 3
+    assert metrics["queue_latency"]["count"] == 1
+    assert metrics["depth"] == 0
+
+
+def test_back_pressure():
+    release = Event()
+    receiver = WebhookReceiver(SECRET, lambda webhook: release.wait(), max_queue=1, workers=1)
+
+    # No workers yet, the queue fills
+    assert receiver.receive(BODY, headers_for(webhook_id="1"))[0] == 200
+    status, headers = receiver.receive(BODY, headers_for(webhook_id="2"))
+    assert status == 503
+    assert headers["retry-after"] == "1"
+    assert receiver.metrics["dropped"] == 1
+    assert receiver.metrics["depth"] == 1
+
+    # Dropped webhooks are accepted when retried
+    receiver.start()
+    release.set()
+    receiver.join()
+    assert receiver.receive(BODY, headers_for(webhook_id="2"))[0] == 200
+    receiver.stop()
+    assert receiver.metrics["handled"] == 2
+
+
+def test_handler_failure():
+    def handler(webhook):
+        raise ValueError("oops")
+
+    with WebhookReceiver(SECRET, handler) as receiver:
+        receiver.receive(BODY, headers_for())
+        receiver.join()
+    assert receiver.metrics["failed"] == 1
+
+
+def test_memory_index():
+    index = MemoryIdempotencyIndex(max_entries=2)
+    assert index.add("a")
+    assert not index.add("a")
+    assert index.add("b")
+    assert index.add("c")
+    # Oldest forgotten over the limit
+    assert len(index) == 2
+    assert index.add("a")
+    index.discard("a")
+    assert index.add("a")
+
+    index = MemoryIdempotencyIndex(ttl=-1)
+    assert index.add("a")
+    assert index.add("a")
+
+
+def test_disk_index(tmp_path):
+    path = str(tmp_path / "webhooks.db")
+    index = DiskIdempotencyIndex(path, max_entries=2)
+    assert index.add("a")
+    assert not index.add("a")
+    index.close()
+
+    # Survives a restart
+    index = DiskIdempotencyIndex(path, max_entries=2)
+    assert not index.add("a")
+    assert index.add("b")
+    assert index.add("c")
+    assert len(index) == 2
+    index.discard("c")
+    assert index.add("c")
+    index.close()
+
+
+def test_disk_index_prune_every(tmp_path):
+    index = DiskIdempotencyIndex(str(tmp_path / "webhooks.db"), max_entries=3, prune_every=4)
+    for webhook_id in "abcd":
+        index.add(webhook_id)
+    # Pruned on the 4th insert, oldest first
+    assert len(index) == 3
+    assert index.add("a")
+    assert not index.add("d")
+    assert len(index) == 4
+    index.close()
+
+
+def test_wsgi():
+    handled = []
+    with WebhookReceiver(SECRET, handled.append) as receiver:
+        responses = []
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "CONTENT_LENGTH": str(len(BODY)),
+            "wsgi.input": io.BytesIO(BODY),
+        }
+        for key, value in headers_for().items():
+            environ[f"HTTP_{key.upper().replace('-', '_')}"] = value
+        receiver.wsgi(environ, lambda status, headers: responses.append(status))
+        receiver.wsgi({"REQUEST_METHOD": "GET"}, lambda status, headers: responses.append(status))
+        receiver.join()
+
+    assert responses == ["200 OK", "405 Method Not Allowed"]
+    assert handled[0].webhook_id == "abc"
+
+
+@pytest.mark.asyncio
+async def test_asgi():
+    handled = []
+    sent = []
+    messages = [
+        {"type": "http.request", "body": BODY[:10], "more_body": True},
+        {"type": "http.request", "body": BODY[10:], "more_body": False},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers_for().items()],
+    }
+    with WebhookReceiver(SECRET, handled.append) as receiver:
+        await receiver.asgi(scope, receive, send)
+        receiver.join()
+
+    assert sent[0]["status"] == 200
+    assert handled[0].body == BODY